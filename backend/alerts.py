@@ -0,0 +1,141 @@
+"""
+Alert delivery — bounded, prioritized, deduplicating queue with deadlines
+-------------------------------------------------------------------------
+TTSWorker and LLMWorker used unbounded queue.Queue()s, and every LLM job ran
+`ollama run` with a 6 s timeout, so under sustained fatigue messages piled up
+and were spoken long after they mattered. AlertQueue replaces both queues:
+
+  priority   CRITICAL < WARNING < SUPPORTIVE; get() always returns the most
+             urgent pending alert, oldest first within a priority
+  coalesce   put() with the key of an alert that is still pending updates
+             that alert in place (newest text, most urgent priority, earliest
+             trigger time) instead of queueing a repeat
+  deadline   every alert carries `created` (the DWI trigger time) and
+             `deadline`; get() discards alerts already past their deadline
+  preempt    a CRITICAL put() removes the pending SUPPORTIVE ones, and when
+             the queue is full a more urgent alert evicts the least urgent
+  bounded    at most `maxsize` pending; an alert that is no more urgent than
+             everything pending is rejected and counted
+
+Queue latency (trigger → handed to the consumer) and end-to-end delivery
+latency (trigger → done(), e.g. after speaking) go into ms histograms;
+stats() reports them together with the drop counters.
+"""
+
+import time, heapq, itertools, threading
+from infer_server import Histogram
+
+CRITICAL, WARNING, SUPPORTIVE = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: "critical", WARNING: "warning", SUPPORTIVE: "supportive"}
+LATENCY_BOUNDS_MS = [10, 25, 50, 100, 250, 500, 1000, 1500, 2000, 3000, 5000, 10000, 30000]
+
+
+class Alert:
+    __slots__ = ("key", "text", "priority", "created", "deadline", "meta", "seq", "live")
+    def __init__(self, key, text, priority, created, deadline, meta, seq):
+        self.key = key; self.text = text; self.priority = priority
+        self.created = created; self.deadline = deadline; self.meta = meta
+        self.seq = seq; self.live = True
+    def remaining(self, now): return self.deadline - now
+
+
+class AlertQueue:
+    """
+    put(key, text, priority, ttl_s, created=None) → "queued" | "coalesced" | "rejected"
+    get(timeout) → next live Alert or None; done(alert) once it has been delivered.
+    Thread-safe; producers never block.
+    """
+    def __init__(self, maxsize=4, ttl_s=3.0, clock=time.time, name="alerts"):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.clock = clock
+        self.name = name
+        self.cv = threading.Condition()
+        self.heap = []                   # (priority, created, seq, alert); dead entries skipped lazily
+        self.pending = {}                # key → live Alert
+        self.seq = itertools.count()
+        self.queue_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.deliver_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.counts = {"queued": 0, "coalesced": 0, "rejected": 0, "evicted": 0,
+                       "preempted": 0, "stale": 0, "delivered": 0, "late": 0}
+
+    def __len__(self): return len(self.pending)
+
+    def put(self, key, text, priority=WARNING, ttl_s=None, created=None, meta=None):
+        now = self.clock()
+        created = now if created is None else created
+        deadline = created + (self.ttl_s if ttl_s is None else ttl_s)
+        with self.cv:
+            old = self.pending.get(key)
+            if old is not None:
+                old.text = text; old.meta = meta
+                old.deadline = max(old.deadline, deadline)
+                if priority < old.priority:
+                    self._kill(old); self._push(key, text, priority, old.created, old.deadline, meta)
+                self.counts["coalesced"] += 1; self.cv.notify()
+                return "coalesced"
+            if priority == CRITICAL:
+                for a in [a for a in self.pending.values() if a.priority == SUPPORTIVE]:
+                    self._kill(a); self.counts["preempted"] += 1
+            if len(self.pending) >= self.maxsize:
+                worst = max(self.pending.values(), key=lambda a: (a.priority, a.created))
+                if worst.priority <= priority:
+                    self.counts["rejected"] += 1
+                    return "rejected"
+                self._kill(worst); self.counts["evicted"] += 1
+            self._push(key, text, priority, created, deadline, meta)
+            self.counts["queued"] += 1; self.cv.notify()
+            return "queued"
+
+    def get(self, timeout=None):
+        """Most urgent live alert, waiting up to timeout; expired alerts are dropped here."""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cv:
+            while True:
+                while self.heap:
+                    a = heapq.heappop(self.heap)[3]
+                    if not a.live: continue
+                    self._kill(a)
+                    now = self.clock()
+                    if now > a.deadline:
+                        self.counts["stale"] += 1; continue
+                    self.queue_ms.add((now - a.created) * 1000.0)
+                    return a
+                wait = None if end is None else end - time.monotonic()
+                if wait is not None and wait <= 0: return None
+                self.cv.wait(wait)
+
+    def done(self, alert):
+        """Record end-to-end latency once the alert actually reached the driver."""
+        now = self.clock()
+        with self.cv:
+            self.deliver_ms.add((now - alert.created) * 1000.0)
+            self.counts["delivered"] += 1
+            if now > alert.deadline: self.counts["late"] += 1
+
+    def clear(self):
+        with self.cv:
+            for a in list(self.pending.values()): self._kill(a)
+            self.heap.clear()
+
+    def stats(self):
+        with self.cv:
+            return {"pending": len(self.pending), **self.counts,
+                    "queue_ms": self.queue_ms.snapshot(), "deliver_ms": self.deliver_ms.snapshot()}
+
+    def line(self):
+        s = self.stats(); q, d = s["queue_ms"], s["deliver_ms"]
+        return (f"[{self.name}] delivered {s['delivered']} (late {s['late']}) | coalesced {s['coalesced']} "
+                f"stale {s['stale']} preempted {s['preempted']} evicted {s['evicted']} rejected {s['rejected']} | "
+                f"queue p50/p95 {q['p50']:.0f}/{q['p95']:.0f} ms | deliver p50/p95 {d['p50']:.0f}/{d['p95']:.0f} ms")
+
+    # ------------------------- internals ----------------------
+    def _push(self, key, text, priority, created, deadline, meta):
+        a = Alert(key, text, priority, created, deadline, meta, next(self.seq))
+        heapq.heappush(self.heap, (priority, created, a.seq, a))
+        self.pending[key] = a
+        return a
+
+    def _kill(self, a):
+        a.live = False
+        if self.pending.get(a.key) is a: del self.pending[a.key]
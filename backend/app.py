@@ -15,33 +15,109 @@ Optional (voice stress):
   pip install sounddevice
 """
 
-import os, cv2, time, random, threading, subprocess, numpy as np, csv, queue, math
+import os, sys, cv2, time, random, signal, threading, numpy as np, csv, math
 from collections import deque
-import tensorflow as tf
 from playsound3 import playsound
-import pyttsx3
 import mediapipe as mp
+from pipeline import FramePipeline
+from cnn_sched import CNNScheduler, staleness_weight
+from preprocess import ResizeRing
+from roi import FaceROITracker, to_frame_coords
+from geometry import landmarks_array, compute as compute_geometry
+from rolling import RollingStats, BucketedMean
+from session_log import SessionLogger
+from recording import RecordingWriter
+from profiling import PROF
+from governor import FrameGovernor, levels_for
+from audio_features import RingBuffer, VSIEngine, WavSource
+from alerts import AlertQueue, CRITICAL, WARNING, SUPPORTIVE
+from llm_client import OllamaClient, PhraseCache, cause_bucket
+from session_stats import SessionStats, recover as recover_stats
+from metrics_server import MetricsHub
+from capture import Camera, LatencyMeter
 
 # =========================== CONFIG ===========================
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 
 USE_OLLAMA = True
+OLLAMA_URL = "http://127.0.0.1:11434"   # local model server, one persistent connection (llm_client.py)
+OLLAMA_MODEL = "llama3"
+LLM_CACHE_PATH = "llm_phrases.json"     # alert phrasings per (action, cause), kept across runs
+LLM_REFRESH_S = 300.0                   # re-phrase the oldest cached entry this often
 ALERT_SOUND = "alert.wav"
 IMG_SIZE = 224
+TFLITE_INPUT_IN_PLACE = True   # write CNN input straight into the interpreter's buffer
+FACE_ROI = True                # CNN + FaceMesh see only the padded face crop (roi.py)
+ROI_PAD = 0.35
 
 LOG_PATH = "driver_wellness_p11_4.csv"
 SUMMARY_PATH = "driver_wellness_p11_4_summary.csv"
+STATS_CHECKPOINT = "driver_wellness_p11_4_stats.json"   # streaming summary state; recovered after a crash
+STATS_CHECKPOINT_S = 30.0
+RECORD_ENABLE = False                        # also write the columnar .vgrec (recording.py)
+RECORD_PATH = "driver_wellness_p11_4.vgrec"
 
 # Voice capture (optional)
 AUDIO_RATE = 16000
-AUDIO_BLOCK_SEC = 0.5   # VSI ~2 Hz
+AUDIO_BLOCK_SEC = 0.05  # sounddevice callback block (ring buffer granularity)
+AUDIO_WIN_SEC = 0.5     # VSI analysis window
+AUDIO_HOP_SEC = 0.25    # window hop → VSI ~4 Hz
 AUDIO_ENABLE = True     # set False to disable mic input
+AUDIO_WAV = None        # path → feed a WAV file instead of the mic (audio_features.WavSource)
 
 # Fatigue trigger (on DWI)
 DWI_HIGH = 0.70
 DWI_LOW  = 0.45
 COOLDOWN_S = 15
+PERCLOS_LONG_S = 300.0   # long-horizon PERCLOS (reported alongside the 30 s one)
+
+# Alert delivery (alerts.py): spoken within ALERT_DEADLINE_S of the DWI trigger, or dropped
+ALERT_DEADLINE_S = 4.0
+ALERT_QUEUE_MAX = 4
+ALERT_PRIORITY = {"beep_alert": CRITICAL, "speak_break": WARNING, "speak_breathing": SUPPORTIVE}
+
+# Camera (capture.py): explicit format, driver buffer of 1, grab thread exposing only the newest frame
+CAMERA_INDEX = 0
+CAMERA_SIZE = (1280, 720)
+CAMERA_FPS = 30
+CAMERA_FOURCC = "MJPG"        # "MJPG" | "YUYV" | None (driver default)
+CAMERA_THREADED = True
+
+# Frame loop: True → capture / CNN / FaceMesh run on separate threads (pipeline.py)
+PIPELINED = True
+
+# CNN scheduling (cnn_sched.py). "every_frame" scores every frame as before.
+CNN_POLICY = "adaptive"   # "every_frame" | "every_n" | "hz" | "adaptive"
+CNN_EVERY_N = 10
+CNN_HZ = 2.0
+CNN_HALF_LIFE_S = 3.0     # CNN weight halves every N s once its result is stale
+
+# FusionEngine starting weights (adapted at runtime, bounded to [0.3, 0.8] / [0.2, 0.7])
+FUSION_W_VISUAL = 0.6
+FUSION_W_CNN = 0.4
+
+# Per-frame constants (EMA steps, smoothing) were tuned at this rate; they are
+# rescaled by the real frame interval so detection holds at any FPS
+REF_FPS = 30.0
+
+# Adaptive quality governor (governor.py)
+GOVERNOR = True
+TARGET_FPS = 20.0
+
+# Profiling (profiling.py) — 'p' toggles the HUD panel at runtime either way
+PROFILE = False           # per-stage timers + periodic stats line from the start
+PROFILE_REPORT_S = 5.0
+PROFILE_DUMP = None       # e.g. "vg_profile.json", rewritten every report
+PROFILE_PORT = None       # e.g. 9109 → http://127.0.0.1:9109/metrics
+METRICS_PORT = None       # e.g. 8765 → live dashboard stream: /events (SSE), /ws (metrics_server.py)
+
+# Display. Headless skips landmark drawing, HUD composition and imshow / waitKey entirely;
+# the HUD is then rendered on demand onto a copy of the frame.
+HEADLESS = None           # None → auto (no DISPLAY / WAYLAND_DISPLAY on Linux); True / False to force
+HUD_EVERY_N = 0           # headless: write the HUD to HUD_SNAPSHOT every Nth frame (0 = never)
+HUD_SNAPSHOT = "hud_latest.jpg"
+HUD_VIEW_HZ = 5.0         # headless: HUD refresh while a viewer polls METRICS_PORT /hud.jpg
 
 # CNN model paths
 MODEL_PATHS = [
@@ -49,9 +125,20 @@ MODEL_PATHS = [
     "/Users/mayankchauhan/Documents/IMobileThon/driver_fatigue_detector_v1.h5"
 ]
 TFLITE_PATH = "/Users/mayankchauhan/Documents/IMobileThon/driver_fatigue_detector_v1.tflite"
+# Produced by `python inference.py export ...`; used when present
+TFLITE_INT8_PATH = "/Users/mayankchauhan/Documents/IMobileThon/driver_fatigue_detector_v1_int8.tflite"
+ONNX_PATH = "/Users/mayankchauhan/Documents/IMobileThon/driver_fatigue_detector_v1.onnx"
+INFER_BACKEND = "auto"    # "auto" (fastest within PARITY_TOL) | "keras" | "tflite" | "tflite_int8" | "onnx"
+INFER_THREADS = None      # CNN threads (None → runtime default)
+PARITY_TOL = 0.05         # max |Δprob| vs the reference model for a backend to be eligible
 
 # ======================== MODEL LOADING =======================
+# TensorFlow, the model and its first inference load on a background thread
+# (ModelLoader) so the camera and visual scoring start immediately; until the
+# CNN is ready predict_model() returns None and fusion is visual-only.
 def load_model():
+    """Raw Keras model or TFLite interpreter (for infer_server's batched forward pass)."""
+    import tensorflow as tf   # imported here: several seconds we don't want before the camera opens
     for p in MODEL_PATHS:
         if os.path.exists(p):
             print(f"✅ Loading {p}")
@@ -68,40 +155,116 @@ def load_model():
         return inter, True
     raise FileNotFoundError("❌ No model found!")
 
-model, IS_TFLITE = load_model()
+backend = None   # inference.Backend, set by ModelLoader once warm
+model_loader = None
+
+class ModelLoader(threading.Thread):
+    """
+    Imports TF, builds the candidate CNN backends (inference.py), warms each up,
+    benchmarks them and checks parity — all off the main thread — then
+    publishes the chosen one as `backend`.
+    """
+    def __init__(self):
+        super().__init__(daemon=True, name="vg-model")
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self.error = None
+        self.load_s = None
+        self.report = []
+    def run(self):
+        global backend
+        t0 = time.time()
+        try:
+            from inference import backend_specs, select_backend
+            specs = backend_specs(MODEL_PATHS, TFLITE_PATH, TFLITE_INT8_PATH, ONNX_PATH, INFER_THREADS,
+                                  tflite_in_place=TFLITE_INPUT_IN_PLACE)
+            be, self.report = select_backend(specs, INFER_BACKEND, PARITY_TOL)
+            backend = be
+            self.load_s = time.time() - t0
+            self.ready.set()
+            print(f"✅ CNN ready: {be} ({self.load_s:.1f} s) — fusing visual + CNN")
+        except Exception as e:
+            self.error = e
+            print("⚠️ CNN unavailable, visual-only fatigue:", e)
+        finally:
+            self.done.set()
+
+def start_model_loader():
+    global model_loader
+    if model_loader is None:
+        model_loader = ModelLoader(); model_loader.start()
+    return model_loader
+
+def resolve_backend():
+    """
+    INFER_BACKEND with "auto" pinned to the reference backend kind (the first
+    model file present, Keras first). "auto" picks the fastest by timing, which
+    can differ between runs; offline re-scoring needs the same CNN every time.
+    """
+    if INFER_BACKEND != "auto": return INFER_BACKEND
+    from inference import backend_specs
+    specs = backend_specs(MODEL_PATHS, TFLITE_PATH, TFLITE_INT8_PATH, ONNX_PATH)
+    return specs[0][0] if specs else INFER_BACKEND
+
+def ensure_model(timeout=None):
+    """Block until the CNN is loaded (offline tools need it from the first frame)."""
+    ld = start_model_loader()
+    ld.done.wait(timeout)
+    if ld.error is not None: raise ld.error
+    if not ld.ready.is_set(): raise TimeoutError("CNN model still loading")
+    return backend
 
 def predict_model(frame):
-    img = cv2.resize(frame, (IMG_SIZE, IMG_SIZE))
-    img = np.expand_dims(img.astype("float32") / 255.0, axis=0)
-    if IS_TFLITE:
-        inp = model.get_input_details()
-        out = model.get_output_details()
-        model.set_tensor(inp[0]['index'], img)
-        model.invoke()
-        res = model.get_tensor(out[0]['index'])
-        prob = float(res[0][0])
-    else:
-        prob = float(model.predict(img, verbose=0)[0][0])
-    return float(np.clip(prob, 0.0, 1.0))
+    """CNN fatigue probability, or None while the model is still loading."""
+    if backend is None:
+        start_model_loader(); return None
+    with PROF.stage("cnn"):
+        prob = backend.predict(frame)
+    return min(1.0, max(0.0, prob))
+
+def predict_model_batch(frames):
+    """One forward pass for several face crops (multiface.py); None while loading."""
+    if backend is None:
+        start_model_loader(); return None
+    with PROF.stage("cnn"):
+        probs = backend.predict_batch(frames)
+    return [min(1.0, max(0.0, p)) for p in probs]
 
 # ========================= TTS THREAD =========================
 class TTSWorker(threading.Thread):
     def __init__(self):
         super().__init__(daemon=True)
-        self.q = queue.Queue()
-        self.tts = pyttsx3.init()
-        self.tts.setProperty("rate", 175)
-        self.tts.setProperty("volume", 1.0)
+        self.q = AlertQueue(ALERT_QUEUE_MAX, ALERT_DEADLINE_S, name="tts")
+        self.tts = None
     def run(self):
+        # Engine init is slow (speech driver start-up), so it happens here, not at import
+        try:
+            import pyttsx3
+            self.tts = pyttsx3.init()
+            self.tts.setProperty("rate", 175)
+            self.tts.setProperty("volume", 1.0)
+        except Exception as e:
+            print("⚠️ TTS disabled:", e)
         while True:
-            txt = self.q.get()
+            a = self.q.get()
+            if self.tts is None:
+                print("🗣", a.text); self.q.done(a); continue
             try:
-                self.tts.say(txt); self.tts.runAndWait()
+                self.tts.say(a.text); self.tts.runAndWait()
+                self.q.done(a)
             except Exception as e:
                 print("[TTS Error]", e)
-    def speak(self, txt): self.q.put(txt)
+    def speak(self, txt, key=None, priority=WARNING, created=None, ttl_s=None):
+        """Non-blocking; a pending alert with the same key is updated rather than repeated."""
+        return self.q.put(key or txt, txt, priority, ttl_s, created)
 
-tts_worker = TTSWorker(); tts_worker.start()
+tts_worker = None   # TTSWorker, started by main() or on first speak()
+
+def _tts():
+    global tts_worker
+    if tts_worker is None:
+        tts_worker = TTSWorker(); tts_worker.start()
+    return tts_worker
 
 # ============================ AUDIO ===========================
 class AudioController:
@@ -115,40 +278,40 @@ class AudioController:
             if os.path.exists(ALERT_SOUND): playsound(ALERT_SOUND, block=False)
             else: print("\a")
         except Exception as e: print("[Alert Error]", e)
-    def speak(self, txt): tts_worker.speak(txt)
+    def speak(self, txt, **kw): return _tts().speak(txt, **kw)
 
 # ========================= OLLAMA AI ==========================
 class LLMWorker(threading.Thread):
+    """
+    Alert → phrasing → TTS. Phrasings come from the PhraseCache (never a
+    model call on the alert path); the cache thread talks to ollama.
+    """
     def __init__(self, audio):
         super().__init__(daemon=True)
         self.audio = audio
-        self.q = queue.Queue()
+        self.q = AlertQueue(ALERT_QUEUE_MAX, ALERT_DEADLINE_S, name="llm")
+        client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL) if USE_OLLAMA else None
+        self.phrases = PhraseCache(client, LLM_CACHE_PATH, refresh_s=LLM_REFRESH_S)
         self.last_message = None
-    def enqueue(self, context_text):
-        """Queue a contextual message (already summarized by backend)"""
-        self.q.put(context_text)
+    def start(self):
+        self.phrases.start(); super().start()
+    def enqueue(self, context_text, action=None, created=None, cause=None):
+        """Queue a contextual message (already summarized by backend); one pending per action."""
+        return self.q.put(action or context_text, context_text, ALERT_PRIORITY.get(action, WARNING),
+                          created=created, meta=cause)
     def run(self):
         while True:
             try:
-                context_text = self.q.get()
-                msg = context_text
-                if USE_OLLAMA:
-                    try:
-                        proc = subprocess.Popen(
-                            ["ollama", "run", "llama3",
-                             f"Driver assistance: Say a short supportive one-liner based on: {context_text}"],
-                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
-                        )
-                        out, _ = proc.communicate(timeout=6)
-                        msg = (out or "").strip() or context_text
-                    except Exception as e:
-                        print("[Ollama error]", e)
-                        msg = context_text
+                a = self.q.get()
+                msg = a.text if a.meta is None else self.phrases.get(a.key, a.meta)
+                self.q.done(a)
                 self.last_message = msg
-                self.audio.speak(msg)
+                self.audio.speak(msg, key=a.key, priority=a.priority, created=a.created,
+                                 ttl_s=a.deadline - a.created)
             except Exception as e:
                 print("[LLMWorker Error]", e)
                 time.sleep(0.1)
+    def stop(self): self.phrases.stop()
 
 # ========================= SENSORS (Sim) ======================
 class HeartSource:
@@ -160,66 +323,71 @@ class HeartSource:
                 "hrv": int(np.clip(self.hrv,15,80))}
 
 class SteeringSource:
-    def __init__(self): self.buf=deque(maxlen=100); self.t=0
+    def __init__(self): self.buf=RollingStats(maxlen=100); self.t=0
     def read(self):
         self.t+=0.05
         v=0.03*np.sin(self.t)+0.01*np.random.randn()
-        self.buf.append(v)
-        return {"micro_var": float(np.std(self.buf))}
+        self.buf.push(float(v))
+        return {"micro_var": self.buf.std}
 
 class IMUSource:
-    def __init__(self): self.buf=deque(maxlen=50)
+    def __init__(self): self.buf=RollingStats(maxlen=50)
     def read(self):
-        a=0.002*np.random.randn(); self.buf.append(a)
-        return {"accel_var": float(np.var(self.buf))}
+        a=0.002*np.random.randn(); self.buf.push(float(a))
+        return {"accel_var": self.buf.var}
 
 # ==================== VOICE STRESS (VSI) ======================
 class VoiceStressWorker(threading.Thread):
-    def __init__(self, rate=AUDIO_RATE, block_sec=AUDIO_BLOCK_SEC, enable=AUDIO_ENABLE):
+    """
+    Mic (or WAV) → audio_features.RingBuffer → VSIEngine. The sounddevice
+    callback only copies into the ring; this thread analyses every hop.
+    dropped_blocks counts audio that did not fit, overflows the driver's
+    input-overflow flags.
+    """
+    def __init__(self, rate=AUDIO_RATE, block_sec=AUDIO_BLOCK_SEC, enable=AUDIO_ENABLE,
+                 win_sec=AUDIO_WIN_SEC, hop_sec=AUDIO_HOP_SEC, wav=AUDIO_WAV):
         super().__init__(daemon=True)
         self.rate = rate
         self.block = int(rate*block_sec)
         self.enable = enable
-        self.last_vsi = 0.0
+        self.engine = VSIEngine(rate, win_sec, hop_sec)
+        self.ring = RingBuffer(4*self.engine.n + 2*self.block)
+        self.wav = wav
+        self.overflows = 0
         self.ok = False
         self._stop = False
         try:
             if not enable: raise RuntimeError("Audio disabled by config")
-            import sounddevice as sd
-            self.sd = sd
+            if wav: self.source = WavSource(wav, rate, self.block, realtime=True)
+            else:
+                import sounddevice as sd
+                self.sd = sd
             self.ok = True
         except Exception as e:
             print("🔇 Voice stress disabled (sounddevice not available or disabled).", e)
-    @staticmethod
-    def _zcr(x): return float(((x[:-1]*x[1:])<0).sum())/len(x)
-    @staticmethod
-    def _spectral_centroid(x, sr):
-        n=len(x); 
-        if n<=8: return 0.0
-        win=np.hanning(n); X=np.abs(np.fft.rfft(x*win)); freqs=np.fft.rfftfreq(n,1/sr)
-        s=X.sum(); 
-        if s<1e-8: return 0.0
-        return float((freqs*X).sum()/s)
-    def _frame_vsi(self, x):
-        x=x.astype(np.float32); mx=max(1e-6, np.max(np.abs(x))); x=x/mx
-        rms=float(np.sqrt(np.mean(x*x))); zcr=self._zcr(x); sc=self._spectral_centroid(x,self.rate)
-        rms_n=np.clip((rms-0.02)/0.25,0,1); zcr_n=np.clip((zcr-0.02)/0.25,0,1); sc_n=np.clip(sc/4000.0,0,1)
-        vsi=0.5*rms_n+0.3*zcr_n+0.2*sc_n
-        self.last_vsi=0.8*self.last_vsi+0.2*float(vsi)
-        return float(np.clip(self.last_vsi,0,1))
+    @property
+    def last_vsi(self): return min(1.0, max(0.0, self.engine.last_vsi))
+    @property
+    def dropped_blocks(self): return self.ring.dropped_blocks
+    @property
+    def updates(self): return self.engine.windows
+    def _cb(self, indata, frames, time_info, status):
+        if status and status.input_overflow: self.overflows += 1
+        self.ring.write(indata[:, 0])
+    def _analyse(self):
+        try: self.engine.feed(self.ring)
+        except Exception as e: print("[VSI Error]", e)
     def run(self):
         if not self.ok: return
-        q=queue.Queue(maxsize=4)
-        def cb(indata, frames, time_info, status):
-            try: q.put_nowait(indata.copy())
-            except queue.Full: pass
-        with self.sd.InputStream(channels=1, samplerate=self.rate, blocksize=self.block, callback=cb):
+        poll = self.engine.hop / self.rate / 4
+        if self.wav:
+            while not self._stop and not self.source.done():
+                self.source.pump(self.ring); self._analyse()
+            return
+        with self.sd.InputStream(channels=1, samplerate=self.rate, blocksize=self.block,
+                                 dtype="float32", callback=self._cb):
             while not self._stop:
-                try:
-                    data=q.get(timeout=1.0)
-                    _=self._frame_vsi(data[:,0])
-                except Exception:
-                    pass
+                time.sleep(poll); self._analyse()
     def stop(self): self._stop=True
 
 # ======================= SUPPORT CLASSES ======================
@@ -228,19 +396,20 @@ class CalibrationWizard:
     Robust EAR baseline during first warmup_s seconds.
     Ignores frames with large head motion. Produces baseline EAR and threshold.
     """
-    def __init__(self, warmup_s=10.0):
+    def __init__(self, warmup_s=10.0, clock=time.time):
         self.warmup_s = warmup_s
-        self.start = time.time()
+        self.clock = clock
+        self.start = clock()
         self.samples = []
         self.ready = False
         self.baseline_ear = None
         self.ear_T = 0.23
     def update(self, smooth_ear, head_motion, motion_tol):
         if self.ready: return self.baseline_ear, self.ear_T, True
-        if time.time() - self.start <= self.warmup_s:
+        if self.clock() - self.start <= self.warmup_s:
             if head_motion < motion_tol*0.8:
                 self.samples.append(smooth_ear)
-        if (time.time() - self.start) > self.warmup_s:
+        if (self.clock() - self.start) > self.warmup_s:
             if len(self.samples) >= 20:
                 self.baseline_ear = float(np.median(self.samples))
                 self.ear_T = 0.70 * self.baseline_ear
@@ -251,197 +420,359 @@ class CalibrationWizard:
             self.ready = True
         return self.baseline_ear, self.ear_T, self.ready
 
+def per_dt(alpha, dt):
+    """Per-frame EMA/step factor tuned at REF_FPS → the same time constant over dt seconds."""
+    return 1.0 - (1.0 - alpha) ** (max(0.0, min(dt, 1.0)) * REF_FPS)
+
 class TrendTracker:
     """
     Tracks EMA and slope for signals; provides stability score (0..1).
+    Window and EMA are in seconds of `clock`, so they don't depend on the frame rate.
     """
-    def __init__(self, alpha=0.1, window_s=15.0, fps_est=30):
-        self.alpha = alpha
+    def __init__(self, alpha=0.1, window_s=15.0, clock=time.time):
+        self.alpha = alpha              # per-frame at REF_FPS
+        self.clock = clock
         self.ema = None
-        self.buf = deque(maxlen=int(window_s*fps_est))
-    def update(self, x):
-        self.ema = x if self.ema is None else (1-self.alpha)*self.ema + self.alpha*x
-        self.buf.append(x)
-        slope = 0.0
-        if len(self.buf) >= 5:
-            y = np.array(self.buf)
-            t = np.arange(len(y))
-            # simple slope via least squares
-            denom = (t*t).sum() - (t.sum()**2)/len(t)
-            if denom > 1e-6:
-                slope = ((t*y).sum() - t.sum()*y.mean()) / denom
+        self.last_t = None
+        self.buf = RollingStats(horizon=window_s)
+    def update(self, x, now=None):
+        now = self.clock() if now is None else now
+        if self.ema is None: self.ema = x
+        else: self.ema += per_dt(self.alpha, now - self.last_t) * (x - self.ema)
+        self.last_t = now
+        self.buf.push(float(x), now)
+        # least-squares slope (per second) from running sums
+        slope = self.buf.slope if len(self.buf) >= 5 else 0.0
         # stability: lower variance => closer to 1
-        var = np.var(self.buf) if len(self.buf) > 3 else 0.0
+        var = self.buf.var if len(self.buf) > 3 else 0.0
         stab = float(np.clip(1.0 / (1.0 + 200*var), 0.0, 1.0))
         return self.ema, slope, stab
 
 class FusionEngine:
     """
     RL-lite: dynamically reweights visual vs CNN based on agreement with PERLCOS trend.
+    The CNN term fades out as its last result ages (cnn=None → visual only).
     """
-    def __init__(self):
-        self.w_visual = 0.6
-        self.w_cnn    = 0.4
-    def fuse(self, visual, cnn):
-        return np.clip(self.w_visual*visual + self.w_cnn*cnn, 0, 1)
-    def adapt(self, perclos_slope, visual, cnn):
+    def __init__(self, cnn_half_life_s=CNN_HALF_LIFE_S):
+        self.w_visual = FUSION_W_VISUAL
+        self.w_cnn    = FUSION_W_CNN
+        self.cnn_half_life_s = cnn_half_life_s
+    def fuse(self, visual, cnn, cnn_age=0.0):
+        if cnn is None: return float(np.clip(visual, 0, 1))
+        wc = self.w_cnn * staleness_weight(cnn_age, self.cnn_half_life_s)
+        return np.clip((self.w_visual*visual + wc*cnn) / (self.w_visual + wc), 0, 1)
+    def adapt(self, perclos_slope, visual, cnn, dt=1.0/REF_FPS):
+        if cnn is None: return
+        k = max(0.0, min(dt, 1.0)) * REF_FPS   # steps were tuned per frame at REF_FPS
         # If PERCLOS rising and visual > cnn → trust visual a bit more
         if perclos_slope > 0 and visual > cnn + 0.05:
-            self.w_visual += 0.01
-            self.w_cnn    -= 0.01
+            self.w_visual += 0.01*k
+            self.w_cnn    -= 0.01*k
         # If PERCLOS falling and cnn < visual → trust cnn a bit more
         if perclos_slope < 0 and cnn + 0.05 < visual:
-            self.w_visual -= 0.005
-            self.w_cnn    += 0.005
+            self.w_visual -= 0.005*k
+            self.w_cnn    += 0.005*k
         # keep normalized and bounded
         self.w_visual = float(np.clip(self.w_visual, 0.3, 0.8))
         self.w_cnn    = float(np.clip(1.0 - self.w_visual, 0.2, 0.7))
 
+class DWITrigger:
+    """
+    Hysteresis + cooldown alert trigger on DWI; explains the dominant cause.
+    update() returns (action, llm_context) when an alert fires, else None.
+    """
+    ACTIONS = ["beep_alert","speak_break","speak_breathing"]
+    def __init__(self, high=None, low=None, cooldown_s=None, rng=None):
+        # None → module config at construction time (lets replay/batch override DWI_HIGH etc.)
+        self.high = DWI_HIGH if high is None else high
+        self.low  = DWI_LOW if low is None else low
+        self.cooldown_s = COOLDOWN_S if cooldown_s is None else cooldown_s
+        self.rng = rng or random
+        self.last_action = None
+        self.last_cause = None
+        self.last_trigger_t = float("-inf")
+    def update(self, now, dwi, visual, vsi, cli):
+        fired = None
+        if (now - self.last_trigger_t) > self.cooldown_s and dwi >= self.high:
+            # Decide "why" (dominant factor)
+            reasons = []; tags = []
+            if visual > 0.55: reasons.append("eye-fatigue (PERCLOS/blinks)"); tags.append("eyes")
+            if vsi > 0.55:    reasons.append("voice stress"); tags.append("voice")
+            if cli > 0.55:    reasons.append("cognitive load"); tags.append("load")
+            dom = ", ".join(reasons) if reasons else "overall workload"
+            a = self.rng.choice(self.ACTIONS)
+            self.last_action = a; self.last_trigger_t = now
+            self.last_cause = cause_bucket(tags)     # phrase-cache key with the action
+            fired = (a, f"DWI {dwi:.2f}. Likely causes: {dom}. Suggestion aligned to '{a}'.")
+        if dwi <= self.low and (now - self.last_trigger_t) > 3.0:
+            self.last_action = None
+        return fired
+
+def compute_dwi(fatigue, hrv, cli, vsi, accel_var):
+    """Driver Wellness Index (0..1) — include motion a bit."""
+    return float(np.clip(
+        0.45*fatigue +           # fused fatigue (visual+cnn)
+        0.10*((80 - hrv)/65) +   # physio HRV penalty
+        0.20*cli +               # cognitive load
+        0.15*vsi +               # voice stress
+        0.10*(accel_var/0.001), 0, 1
+    ))
+
 # ======================= VISION MODULE ========================
 class VisionModule:
-    LEFT=[33,160,158,133,153,144]
-    RIGHT=[362,385,387,263,373,380]
-    HEAD_POINTS=[1,33,263]
-
-    def __init__(self, warmup_s=10.0, perclos_horizon_s=30.0):
-        self.mesh = mp.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=True)
+    def __init__(self, warmup_s=10.0, perclos_horizon_s=30.0, face_roi=FACE_ROI, clock=time.time, mesh=None,
+                 refine_landmarks=True):
+        self.clock = clock   # time.time live; replay.VirtualClock offline
+        # A warm FaceMesh can be handed in (batch workers reuse one across videos)
+        self.refine_landmarks = refine_landmarks
+        self.mesh = mesh or mp.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=refine_landmarks)
+        self._retired = []             # meshes swapped out by set_refine(), closed on the mesh thread
         self.draw = mp.solutions.drawing_utils
-        self.ear_hist = deque(maxlen=15)
-        self.closed_samples = deque()
+        self.draw_landmarks = True     # HUD detail (governor turns it off under load, headless never draws)
+        self.last_res = None           # FaceMesh result of the last step (on-demand HUD draws from it)
+        self.roi = FaceROITracker(pad=ROI_PAD) if face_roi else None
+        self.ear_hist = RollingStats(horizon=0.5)                     # EAR smoothing (was 15 frames @30 FPS)
+        self.perclos_win = RollingStats(horizon=perclos_horizon_s)   # O(1) PERCLOS
+        self.perclos_long = BucketedMean(horizon=PERCLOS_LONG_S)     # 5-min PERCLOS, fixed memory
         self.blink_times = deque(maxlen=120)
-        # Blink logic parameters
-        self.frames_closed = 0
-        self.min_close_frames = 3      # min frames eyes closed to count a blink
+        # Blink logic parameters (seconds, not frames, so they hold at any FPS)
+        self.closed_since = None
+        self.min_close_s = 0.09        # min eyes-closed time to count a blink (~3 frames @30 FPS)
         self.refractory_s = 0.25       # min time between blinks
         self.last_blink_time = 0.0
+        self.last_t = None
 
         self.EAR_T = 0.23
         self.motion_tolerance = 0.015
         self.last_head_pos = None
 
-        self.calib = CalibrationWizard(warmup_s=warmup_s)
+        self.calib = CalibrationWizard(warmup_s=warmup_s, clock=clock)
         self.perclos_horizon_s = perclos_horizon_s
 
         self.fatigue = 0.0
         self.visual_last = 0.0
 
-    def _ear(self, lm, idx, w, h):
-        def p(i): return np.array([lm[idx[i]].x*w, lm[idx[i]].y*h])
-        p1,p2,p3,p4,p5,p6 = [p(i) for i in range(6)]
-        vert=(np.linalg.norm(p2-p6)+np.linalg.norm(p3-p5))/2
-        horiz=np.linalg.norm(p1-p4)+1e-6
-        return vert/horiz
-
-    def _head_motion(self, lm, w, h):
-        pts = [np.array([lm[i].x*w, lm[i].y*h]) for i in self.HEAD_POINTS]
-        center = np.mean(pts, axis=0)
+    def _head_motion(self, center, w):
         if self.last_head_pos is None:
             self.last_head_pos = center
             return 0.0
-        dist = np.linalg.norm(center - self.last_head_pos) / w
+        dist = float(np.linalg.norm(center - self.last_head_pos)) / w
         self.last_head_pos = center
         return dist
 
+    def set_refine(self, refine):
+        """Swap FaceMesh for one with/without iris refinement (takes effect on the next detect)."""
+        if refine == self.refine_landmarks: return
+        self.refine_landmarks = refine
+        self._retired.append(self.mesh)
+        self.mesh = mp.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=refine)
+
     def _update_perclos(self, is_closed):
-        now = time.time()
-        self.closed_samples.append((now, 1 if is_closed else 0))
-        while self.closed_samples and now - self.closed_samples[0][0] > self.perclos_horizon_s:
-            self.closed_samples.popleft()
-        if not self.closed_samples: return 0.0
-        vals = [c for _, c in self.closed_samples]
-        return sum(vals)/len(vals)
+        now = self.clock()
+        c = 1.0 if is_closed else 0.0
+        self.perclos_win.push(c, now)
+        self.perclos_long.push(c, now)
+        return self.perclos_win.fraction
 
     def _blink_rate_per_min(self):
-        now = time.time()
+        now = self.clock()
         # drop older than 60s
         while self.blink_times and now - self.blink_times[0] > 60:
             self.blink_times.popleft()
         return len(self.blink_times)
 
-    def step(self, frame, cnn_prob, dwi_hint_for_adapt, perclos_tracker: TrendTracker, fusion: FusionEngine):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    def detect(self, frame):
+        """
+        FaceMesh pass only — runs on the mesh thread in pipelined mode.
+        Processes the tracked face ROI when there is one, else the full frame.
+        """
+        h, w = frame.shape[:2]
+        region = self.roi.region(w, h) if self.roi is not None else None
+        res = None
+        while self._retired: self._retired.pop().close()
+        with PROF.stage("mesh"):
+            if region is not None:
+                x0, y0, x1, y1 = region
+                res = self.mesh.process(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB))
+                if res.multi_face_landmarks:
+                    to_frame_coords(res.multi_face_landmarks[0].landmark, region, w, h)
+                else:
+                    res = None   # tracking lost → full-frame detection
+            if res is None:
+                res = self.mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if self.roi is not None:
+            if res.multi_face_landmarks: self.roi.update(res.multi_face_landmarks[0].landmark, w, h)
+            else: self.roi.lost()
+        return res
+
+    def face_crop(self, frame):
+        """Face region for the CNN (zero-copy view; full frame when not tracking)."""
+        return self.roi.crop(frame) if self.roi is not None else frame
+
+    def draw_face(self, overlay, res=None):
+        """Face-mesh contours onto overlay (default: the landmarks of the last step)."""
+        res = self.last_res if res is None else res
+        if res is not None and res.multi_face_landmarks:
+            self.draw.draw_landmarks(overlay, res.multi_face_landmarks[0],
+                                     mp.solutions.face_mesh.FACEMESH_CONTOURS)
+        return overlay
+    def step(self, frame, cnn_prob, dwi_hint_for_adapt, perclos_tracker: TrendTracker, fusion: FusionEngine,
+             res=None, cnn_age=0.0):
         h, w, _ = frame.shape
-        res = self.mesh.process(rgb)
+        if res is None: res = self.detect(frame)
         ear = 0.0; blink_rate = 0.0; perclos = 0.0
+        now = self.clock()
+        dt = 1.0 / REF_FPS if self.last_t is None else now - self.last_t
+        self.last_t = now
 
         if res.multi_face_landmarks:
-            lm = res.multi_face_landmarks[0].landmark
-            l = self._ear(lm, self.LEFT, w, h)
-            r = self._ear(lm, self.RIGHT, w, h)
-            ear = (l + r) / 2.0
-            self.ear_hist.append(ear)
-            smooth_ear = float(np.mean(self.ear_hist))
-
-            head_motion = self._head_motion(lm, w, h)
-
-            # Calibration / Threshold
-            base_ear, ear_T, ready = self.calib.update(smooth_ear, head_motion, self.motion_tolerance)
-            if ready:
-                self.EAR_T = 0.9*self.EAR_T + 0.1*ear_T  # soft settle
-            else:
-                # Pre-ready: provisional threshold toward 0.7 * current baseline
-                self.EAR_T = 0.9*self.EAR_T + 0.1*(0.70*(base_ear if base_ear else smooth_ear))
-
-            # Valid close only if head is not moving much
-            is_closed = (smooth_ear < self.EAR_T) if head_motion < self.motion_tolerance else False
-
-            # Blink detection with min-close + refractory
-            if is_closed:
-                self.frames_closed += 1
-            else:
-                if self.frames_closed >= self.min_close_frames:
-                    now = time.time()
-                    if now - self.last_blink_time >= self.refractory_s:
-                        self.blink_times.append(now)
-                        self.last_blink_time = now
-                self.frames_closed = 0
-
-            blink_rate = self._blink_rate_per_min()
-            perclos = self._update_perclos(is_closed)
-
-            # Visual fatigue from EAR + PERCLOS + Blinks
-            ear_def = np.clip((self.EAR_T - smooth_ear)/(self.EAR_T*0.6), 0, 1)
-            blink_pen = np.clip((15.0 - blink_rate)/15.0, 0, 1)
-            visual = 0.6*perclos + 0.25*ear_def + 0.15*blink_pen
-            self.visual_last = float(visual)
-
-            # Fusion with CNN (weights adapt separately)
-            fused = fusion.fuse(visual, cnn_prob)
-
-            # EMA with attack/decay
-            α_up, α_down = 0.25, 0.1
-            self.fatigue += (fused - self.fatigue) * (α_up if fused > self.fatigue else α_down)
-            self.fatigue = float(np.clip(self.fatigue, 0, 1))
-
-            # Trend info for adaptation
-            _, perclos_slope, _ = perclos_tracker.update(perclos)
-            fusion.adapt(perclos_slope, visual, cnn_prob)
-
-            # Draw landmarks
-            self.draw.draw_landmarks(frame, res.multi_face_landmarks[0],
-                mp.solutions.face_mesh.FACEMESH_CONTOURS)
+            with PROF.stage("features"):
+                lm = res.multi_face_landmarks[0].landmark
+                geo = compute_geometry(landmarks_array(lm), w, h)   # one array, vectorized features
+                ear = (geo.ear_l + geo.ear_r) / 2.0
+                self.ear_hist.push(ear, now)
+                smooth_ear = self.ear_hist.mean
+
+                head_motion = self._head_motion(geo.head, w)
+
+                # Calibration / Threshold
+                base_ear, ear_T, ready = self.calib.update(smooth_ear, head_motion, self.motion_tolerance)
+                a = per_dt(0.1, dt)
+                if ready:
+                    self.EAR_T += a*(ear_T - self.EAR_T)  # soft settle
+                else:
+                    # Pre-ready: provisional threshold toward 0.7 * current baseline
+                    self.EAR_T += a*(0.70*(base_ear if base_ear else smooth_ear) - self.EAR_T)
+
+                # Valid close only if head is not moving much
+                is_closed = (smooth_ear < self.EAR_T) if head_motion < self.motion_tolerance else False
+
+                # Blink detection with min-close + refractory
+                if is_closed:
+                    if self.closed_since is None: self.closed_since = now
+                else:
+                    if self.closed_since is not None and now - self.closed_since >= self.min_close_s:
+                        if now - self.last_blink_time >= self.refractory_s:
+                            self.blink_times.append(now)
+                            self.last_blink_time = now
+                    self.closed_since = None
+
+                blink_rate = self._blink_rate_per_min()
+                perclos = self._update_perclos(is_closed)
+
+                # Visual fatigue from EAR + PERCLOS + Blinks
+                ear_def = np.clip((self.EAR_T - smooth_ear)/(self.EAR_T*0.6), 0, 1)
+                blink_pen = np.clip((15.0 - blink_rate)/15.0, 0, 1)
+                visual = 0.6*perclos + 0.25*ear_def + 0.15*blink_pen
+                self.visual_last = float(visual)
+
+            with PROF.stage("fusion"):
+                # Fusion with CNN (weights adapt separately)
+                fused = fusion.fuse(visual, cnn_prob, cnn_age)
+
+                # EMA with attack/decay
+                α_up, α_down = 0.25, 0.1
+                self.fatigue += (fused - self.fatigue) * per_dt(α_up if fused > self.fatigue else α_down, dt)
+                self.fatigue = float(np.clip(self.fatigue, 0, 1))
+
+                # Trend info for adaptation
+                _, perclos_slope, _ = perclos_tracker.update(perclos, now)
+                fusion.adapt(perclos_slope, visual, cnn_prob, dt)
+
+            if self.draw_landmarks:
+                with PROF.stage("draw"): self.draw_face(frame, res)
+        self.last_res = res
 
         return {
             "ear": ear,
             "blink_per_min": blink_rate,
             "perclos_30s": perclos,
+            "perclos_5m": self.perclos_long.fraction,
             "fatigue": self.fatigue,
             "ear_thresh": float(self.EAR_T),
             "visual": self.visual_last
         }, frame
 
-# =========================== LOGGING ==========================
-def log_row(ts, ear, blinkpm, perclos, cnn, fatigue, cli, vsi, dwi, action, ear_t, wv, wc):
-    header = ["time","ear","blink_per_min","perclos_30s","cnn","fatigue","CLI","VSI","DWI","action","EAR_T","w_visual","w_cnn"]
-    exists = os.path.exists(LOG_PATH)
-    with open(LOG_PATH, "a", newline="") as f:
-        w = csv.writer(f)
-        if not exists: w.writerow(header)
-        w.writerow([ts, ear, blinkpm, perclos, cnn, fatigue, cli, vsi, dwi, action or "none", ear_t, wv, wc])
+# ======================= DRIVER SESSION =======================
+class DriverSession:
+    """
+    Everything downstream of the camera for one driver: vision, fusion, sensors,
+    DWI trigger, session stats and the log sink. All timing comes from `clock`,
+    so the same code runs live (time.time) or offline under replay.VirtualClock.
+    """
+    def __init__(self, clock=time.time, logger=None, vstress=None, rng=None, warmup_s=10.0, mesh=None,
+                 stats_checkpoint=None):
+        self.clock = clock
+        self.fusion = FusionEngine()
+        self.perclos_tracker = TrendTracker(alpha=0.1, window_s=30.0, clock=clock)
+        self.vision = VisionModule(warmup_s=warmup_s, perclos_horizon_s=30.0, clock=clock, mesh=mesh)
+        self.heart = HeartSource()
+        self.steer = SteeringSource()
+        self.imu   = IMUSource()
+        self.vstress = vstress
+        self.trigger = DWITrigger(rng=rng)
+        self.stats = SessionStats(clock(), DWI_HIGH, DWI_LOW, checkpoint_path=stats_checkpoint,
+                                  checkpoint_s=STATS_CHECKPOINT_S)
+        self.logger = logger
+        self.dwi_for_adapt = 0.0  # hint to vision for adaptation
+        self.pcl = 0.0
+
+    def process(self, frame, cnn_prob, cnn_age=0.0, res=None):
+        """One frame → (metrics dict, overlay). metrics["alert"] is (action, ctx) when one fires."""
+        vis, overlay = self.vision.step(frame, cnn_prob, self.dwi_for_adapt, self.perclos_tracker,
+                                        self.fusion, res=res, cnn_age=cnn_age)
+        now = self.clock()
+        f, br = vis["fatigue"], vis["blink_per_min"]
+        self.pcl = vis["perclos_30s"]
+        cnn_val = 0.0 if cnn_prob is None else cnn_prob   # HUD / log before the first CNN result
+
+        heart_m = self.heart.read()
+        steer_m = self.steer.read()
+        imu_m   = self.imu.read()
+
+        # Cognitive Load Index (simple proxy)
+        cli = float(np.clip(0.5*(steer_m["micro_var"]/0.02) + 0.5*(1 - min(br/20.0,1)), 0, 1))
+        # Voice Stress Index (0..1)
+        vsi = float(np.clip(getattr(self.vstress, "last_vsi", 0.0), 0.0, 1.0))
+        dwi = compute_dwi(f, heart_m["hrv"], cli, vsi, imu_m["accel_var"])
+        self.dwi_for_adapt = dwi
+
+        self.stats.update(now, f, br, dwi)
+        alert = self.trigger.update(now, dwi, vis["visual"], vsi, cli)
+
+        m = dict(vis)
+        m.update({"time": now, "cnn": cnn_val, "cnn_age": cnn_age, "hr": heart_m["hr"], "hrv": heart_m["hrv"],
+                  "cli": cli, "vsi": vsi, "dwi": dwi, "action": self.trigger.last_action, "alert": alert,
+                  "w_visual": self.fusion.w_visual, "w_cnn": self.fusion.w_cnn})
+        if self.logger is not None:
+            with PROF.stage("logging"):
+                log_row(now, m["ear"], br, self.pcl, cnn_val, f, cli, vsi, dwi, m["action"],
+                        m["ear_thresh"], self.fusion.w_visual, self.fusion.w_cnn, sink=self.logger)
+                if alert is not None: self.logger.flush(durable=True)   # keep the lead-up to an alert on disk
+        return m, overlay
+
+    def summary(self):
+        return self.stats.summary(self.clock())
 
-def write_summary(stats):
-    exists = os.path.exists(SUMMARY_PATH)
-    with open(SUMMARY_PATH, "a", newline="") as f:
+# =========================== LOGGING ==========================
+LOG_HEADER = ["time","ear","blink_per_min","perclos_30s","cnn","fatigue","CLI","VSI","DWI","action","EAR_T","w_visual","w_cnn"]
+log_sink = None   # SessionLogger, started on first log_row()
+
+def _log_sink():
+    global log_sink
+    if log_sink is None:
+        rec = RecordingWriter(RECORD_PATH) if RECORD_ENABLE else None
+        log_sink = SessionLogger(LOG_PATH, LOG_HEADER, recorder=rec); log_sink.start()
+    return log_sink
+
+def log_row(ts, ear, blinkpm, perclos, cnn, fatigue, cli, vsi, dwi, action, ear_t, wv, wc, sink=None):
+    # Enqueue only; rows are batched to disk by the SessionLogger thread
+    (sink or _log_sink()).log([ts, ear, blinkpm, perclos, cnn, fatigue, cli, vsi, dwi, action or "none", ear_t, wv, wc])
+
+def write_summary(stats, path=None):
+    path = path or SUMMARY_PATH
+    exists = os.path.exists(path)
+    with open(path, "a", newline="") as f:
         w = csv.writer(f)
         if not exists:
             w.writerow([
@@ -455,181 +786,235 @@ def write_summary(stats):
             round(stats["avg_blink"],2), int(stats["time_above_high_s"])
         ])
 
+# ============================= HUD ============================
+def draw_hud(overlay, m, fps, fusion, detail="full"):
+    """
+    Status text + DWI bar drawn in place on the frame (metrics dict from DriverSession.process).
+    detail="minimal" (quality governor under load) keeps one line and the bar.
+    """
+    f, ear, br, pcl, ear_t = m["fatigue"], m["ear"], m["blink_per_min"], m["perclos_30s"], m["ear_thresh"]
+    cli, vsi, dwi, hr, hrv = m["cli"], m["vsi"], m["dwi"], m["hr"], m["hrv"]
+    if detail == "minimal":
+        cv2.rectangle(overlay, (0,0), (overlay.shape[1], 130), (25,25,25), -1)
+        cv2.putText(overlay, f"Fatigue:{f:.2f} | DWI:{dwi:.2f} | FPS:{fps:.1f}", (10,40), 0, 0.55, (255,255,255), 2)
+    else:
+        cv2.rectangle(overlay, (0,0), (overlay.shape[1], 170), (25,25,25), -1)
+        hud1 = (f"EAR:{ear:.3f} (T:{ear_t:.3f}) | Blink/min:{br:.0f} | PERCLOS30:{pcl:.2f} | "
+                f"CNN:{m['cnn']:.2f} | Fatigue:{f:.2f} | HR:{hr} HRV:{hrv} | FPS:{fps:.1f}")
+        hud2 = (f"VSI:{vsi:.2f} | CLI:{cli:.2f} | DWI:{dwi:.2f} | wV:{fusion.w_visual:.2f} wC:{fusion.w_cnn:.2f}")
+        cv2.putText(overlay, hud1, (10,40), 0, 0.55, (255,255,255), 2)
+        cv2.putText(overlay, hud2, (10,70), 0, 0.55, (255,255,255), 2)
+
+    # DWI bar
+    bar_w = 360; x0, y0 = 10, 100
+    cv2.rectangle(overlay,(x0,y0),(x0+bar_w,y0+22),(60,60,60),1)
+    cv2.rectangle(overlay,(x0+1,y0+1),(x0+1+int(bar_w*dwi),y0+21),
+                  (0,200,0) if dwi<0.5 else ((0,200,200) if dwi<0.7 else (0,0,255)),-1)
+    return overlay
+
+def apply_quality(level, cap, vision, sched=None, pipe=None, draw=True):
+    """Push a governor.QualityLevel to the camera, FaceMesh, CNN scheduler and landmark drawing."""
+    actual = getattr(cap, "actual", {})                   # what the driver accepted (capture.Camera)
+    if level.capture is not None and level.capture != (actual.get("w"), actual.get("h")):
+        w, h = level.capture
+        props = {cv2.CAP_PROP_FRAME_WIDTH: w, cv2.CAP_PROP_FRAME_HEIGHT: h}
+        if pipe is not None: pipe.set_capture(props)      # capture thread owns the camera
+        else:
+            for k, v in props.items(): cap.set(k, v)
+    vision.set_refine(level.refine_landmarks)
+    vision.draw_landmarks = draw and level.hud == "full"
+    if sched is not None: sched.scale(level.cnn_rate)
+
+def no_display():
+    """Linux without an X11 / Wayland display (in-vehicle boxes, services)."""
+    return sys.platform.startswith("linux") and not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+def render_hud(frame, m, fps, fusion, vision, detail="full"):
+    """Headless on-demand HUD: landmarks + status onto a copy; the frame itself is never touched."""
+    overlay = frame.copy()
+    if detail == "full": vision.draw_face(overlay)
+    return draw_hud(overlay, m, fps, fusion, detail)
+
+def _save_jpeg(img, path):
+    tmp = path + ".tmp.jpg"
+    if cv2.imwrite(tmp, img): os.replace(tmp, path)    # viewers never read a half-written file
+
 # ============================ MAIN ============================
+def print_summary(summary, path=None):
+    print("\n================ Session Summary ================")
+    print(f"Duration: {int(summary['duration_s'])} s")
+    print(f"Fatigue avg/min/max: {summary['avg_fatigue']:.3f} / {summary['min_fatigue']:.3f} / {summary['max_fatigue']:.3f}")
+    print(f"Avg blink/min: {summary['avg_blink']:.1f}")
+    print(f"Time above high (DWI≥{DWI_HIGH}): {int(summary['time_above_high_s'])} s")
+    if "p50_fatigue" in summary:
+        print(f"Fatigue p50/p95: {summary['p50_fatigue']:.3f} / {summary['p95_fatigue']:.3f}")
+        print("Time per DWI band: " + ", ".join(f"{k}: {int(v)} s" for k, v in summary["dwi_bands_s"].items()))
+    print("Summary written to:", path or SUMMARY_PATH)
+
 def main():
-    # Engines
-    fusion = FusionEngine()
-    perclos_tracker = TrendTracker(alpha=0.1, window_s=30.0, fps_est=30)
+    # CNN + TTS warm up in the background; camera and visual scoring go live now
+    start_model_loader(); _tts()
+
+    # A checkpoint left behind means the last session died before writing its summary row
+    lost = recover_stats(STATS_CHECKPOINT)
+    if lost is not None:
+        write_summary(lost); os.remove(STATS_CHECKPOINT)
+        print(f"♻️ Recovered the summary of an interrupted session ({int(lost['duration_s'])} s)")
 
     # Workers
     audio  = AudioController()
     llm    = LLMWorker(audio); llm.start()
-
-    # Sensors
-    heart  = HeartSource()
-    steer  = SteeringSource()
-    imu    = IMUSource()
     vstress = VoiceStressWorker(); vstress.start()
 
-    # Vision
-    vision = VisionModule(warmup_s=10.0, perclos_horizon_s=30.0)
+    # Engines, sensors, vision, trigger and stats for this driver
+    session = DriverSession(logger=_log_sink(), vstress=vstress, stats_checkpoint=STATS_CHECKPOINT)
+    vision, fusion = session.vision, session.fusion
 
     # Camera
-    cap = cv2.VideoCapture(0)
+    cap = Camera(CAMERA_INDEX, CAMERA_SIZE, CAMERA_FPS, CAMERA_FOURCC, threaded=CAMERA_THREADED)
     if not cap.isOpened():
-        raise RuntimeError("❌ Could not open default camera.")
-
-    # Stats for session summary
-    session_start = time.time()
-    fatigue_series = []
-    blink_series = []
-    time_above_high = 0.0
-    last_above_t = None
-
-    # Trigger state
-    last_action = None
-    last_trigger_t = 0.0
-
-    prev = time.time(); fps = 0.0
-    dwi_for_adapt = 0.0  # hint to vision for adaptation
+        raise RuntimeError(f"❌ Could not open camera {CAMERA_INDEX}.")
+    latency = LatencyMeter()
+    cnn_resize = ResizeRing(IMG_SIZE)          # preallocated: no array per scored frame
+    cnn_prep = lambda fr: cnn_resize(vision.face_crop(fr))
+    sched = None
+    if CNN_POLICY != "every_frame":
+        sched = CNNScheduler(predict_model, policy=CNN_POLICY, every_n=CNN_EVERY_N,
+                             hz=CNN_HZ, prep=cnn_prep).start()
+    pipe = None
+    if PIPELINED:
+        # With a scheduler the CNN runs on its worker, not as a pipeline stage
+        pipe = FramePipeline(cap, predict_model if sched is None else None, vision.detect,
+                             cnn_prep=cnn_prep).start()
+
+    # Profiling surfaces; gauges are read only when a snapshot is taken
+    PROF.configure(enabled=PROFILE, report_s=PROFILE_REPORT_S, dump_path=PROFILE_DUMP)
+    logger = session.logger
+    PROF.gauge("log_q", logger.q.qsize)
+    PROF.gauge("log_dropped", lambda: logger.dropped)
+    if vstress.ok:
+        PROF.gauge("audio_dropped", lambda: vstress.dropped_blocks)
+        PROF.gauge("vsi_updates", lambda: vstress.updates)
+    if pipe is not None:
+        PROF.gauge("dropped", lambda: sum(pipe.dropped.values()))
+        PROF.gauge("mesh_q", lambda: len(pipe.mesh_q))
+    if sched is not None:
+        PROF.gauge("cnn_runs", lambda: sched.runs)
+        PROF.gauge("cnn_age_s", lambda: round(sched.age() or 0.0, 2))
+    PROF.gauge("alerts_q", lambda: len(llm.q) + len(_tts().q))
+    PROF.gauge("cap_to_dec_ms", lambda: round(latency.last_ms, 1))
+    PROF.gauge("cam_skipped", lambda: cap.skipped)
+    if PROFILE_PORT: PROF.serve(PROFILE_PORT)
+    hub = MetricsHub(port=METRICS_PORT).start() if METRICS_PORT else None
+
+    headless = no_display() if HEADLESS is None else HEADLESS
+    if headless:
+        vision.draw_landmarks = False
+        print("🖥️ Headless: no window; HUD " + (f"every {HUD_EVERY_N} frames → {HUD_SNAPSHOT}" if HUD_EVERY_N else "off")
+              + (f", on demand at http://127.0.0.1:{METRICS_PORT}/hud.jpg" if hub is not None else ""))
+    # SIGINT / SIGTERM end the session cleanly (summary written) — the only way out headless
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM): signal.signal(sig, lambda *_: stop.set())
+
+    # Quality governor: steps resolution / iris refinement / CNN rate / HUD to hold TARGET_FPS
+    gov = None
+    if GOVERNOR:
+        gov = FrameGovernor(target_fps=TARGET_FPS, levels=levels_for(CAMERA_SIZE),
+                            on_change=lambda lvl: apply_quality(lvl, cap, vision, sched, pipe, not headless))
+        apply_quality(gov.level, cap, vision, sched, pipe, not headless)
+        PROF.gauge("quality", lambda: gov.level.name)
+
+    prev = time.time(); fps = 0.0; n_frames = 0
 
     print("🚗 Running Phase 11.4 (Core Intelligence Upgrade, No Frontend)")
 
-    while True:
-        ok, frame = cap.read()
-        if not ok: break
-
-        cnn_prob = predict_model(frame)
-
-        vis, overlay = vision.step(frame, cnn_prob, dwi_for_adapt, perclos_tracker, fusion)
-        f     = vis["fatigue"]
-        ear   = vis["ear"]
-        br    = vis["blink_per_min"]
-        pcl   = vis["perclos_30s"]
-        ear_t = vis["ear_thresh"]
-        visual = vis["visual"]
-
-        heart_m = heart.read()
-        steer_m = steer.read()
-        imu_m   = imu.read()
-        hr, hrv = heart_m["hr"], heart_m["hrv"]
-
-        # Cognitive Load Index (simple proxy)
-        cli = np.clip(0.5*(steer_m["micro_var"]/0.02) + 0.5*(1 - min(br/20.0,1)), 0, 1)
+    while not stop.is_set():
+        if pipe is not None:
+            pkt = pipe.get()
+            if pkt is None: break
+            frame, res, frame_ts = pkt.frame, pkt.res, pkt.ts
+            cnn_prob, cnn_ts = pkt.cnn_prob, pkt.cnn_ts
+        else:
+            with PROF.stage("capture"): ok, frame = cap.read()
+            if not ok: break
+            res = None; frame_ts = cap.last_ts
+            cnn_prob, cnn_ts = (None, None) if sched is not None else (predict_model(vision.face_crop(frame)), frame_ts)
 
-        # Voice Stress Index (0..1)
-        vsi = float(np.clip(getattr(vstress, "last_vsi", 0.0), 0.0, 1.0))
-
-        # Driver Wellness Index (DWI) — include motion a bit
-        dwi = np.clip(
-            0.45*f +                 # fused fatigue (visual+cnn)
-            0.10*((80 - hrv)/65) +   # physio HRV penalty
-            0.20*cli +               # cognitive load
-            0.15*vsi +               # voice stress
-            0.10*(imu_m["accel_var"]/0.001), 0, 1
-        )
-        dwi_for_adapt = float(dwi)
-
-        # Session stats
-        fatigue_series.append(f)
-        blink_series.append(br)
+        if sched is not None:
+            sched.offer(frame, frame_ts, vision.fatigue, session.pcl)
+            cnn_prob, cnn_ts = sched.latest()
+        cnn_age = None if cnn_ts is None else max(0.0, frame_ts - cnn_ts)
 
-        now = time.time()
-        if dwi >= DWI_HIGH:
-            if last_above_t is None:
-                last_above_t = now
-        else:
-            if last_above_t is not None:
-                time_above_high += (now - last_above_t)
-                last_above_t = None
+        m, overlay = session.process(frame, cnn_prob, cnn_age, res=res)
 
         # FPS (smoothed)
+        now = time.time()
         fps = 0.9*fps + 0.1*(1.0 / max(1e-3, (now - prev)))
+        if gov is not None: gov.observe(now - prev, now - frame_ts, now)
         prev = now
 
-        # Hysteresis trigger on DWI
-        can_trigger = (now - last_trigger_t) > COOLDOWN_S
-        if can_trigger and dwi >= DWI_HIGH:
-            # Decide "why" (dominant factor)
-            reasons = []
-            if visual > 0.55: reasons.append("eye-fatigue (PERCLOS/blinks)")
-            if vsi > 0.55:    reasons.append("voice stress")
-            if cli > 0.55:    reasons.append("cognitive load")
-            dom = ", ".join(reasons) if reasons else "overall workload"
-
-            # Choose action
-            a = random.choice(["beep_alert","speak_break","speak_breathing"])
-            last_action = a; last_trigger_t = now
-
-            # Audio + LLM contextual message
+        # Audio + LLM contextual message
+        if m["alert"] is not None:
+            a, ctx = m["alert"]
             if a == "beep_alert": audio.play_alert()
-            ctx = f"DWI {dwi:.2f}. Likely causes: {dom}. Suggestion aligned to '{a}'."
-            llm.enqueue(ctx)
-
-        if dwi <= DWI_LOW and (now - last_trigger_t) > 3.0:
-            last_action = None
+            llm.enqueue(ctx, a, created=now, cause=session.trigger.last_cause)
+        latency.add(frame_ts)                      # sensor → alert decision for this frame
+        if hub is not None: hub.publish(m, fps)   # reference swap; clients pull at their own rate
 
         # ---------------- HUD ----------------
-        cv2.rectangle(overlay, (0,0), (overlay.shape[1], 170), (25,25,25), -1)
-        hud1 = (f"EAR:{ear:.3f} (T:{ear_t:.3f}) | Blink/min:{br:.0f} | PERCLOS30:{pcl:.2f} | "
-                f"CNN:{cnn_prob:.2f} | Fatigue:{f:.2f} | HR:{hr} HRV:{hrv} | FPS:{fps:.1f}")
-        hud2 = (f"VSI:{vsi:.2f} | CLI:{cli:.2f} | DWI:{dwi:.2f} | wV:{fusion.w_visual:.2f} wC:{fusion.w_cnn:.2f}")
-        cv2.putText(overlay, hud1, (10,40), 0, 0.55, (255,255,255), 2)
-        cv2.putText(overlay, hud2, (10,70), 0, 0.55, (255,255,255), 2)
-
-        # DWI bar
-        bar_w = 360; x0, y0 = 10, 100
-        cv2.rectangle(overlay,(x0,y0),(x0+bar_w,y0+22),(60,60,60),1)
-        cv2.rectangle(overlay,(x0+1,y0+1),(x0+1+int(bar_w*dwi),y0+21),
-                      (0,200,0) if dwi<0.5 else ((0,200,200) if dwi<0.7 else (0,0,255)),-1)
-
-        # Last LLM line
-        # (Shown for context; not a "frontend" — just HUD text)
-        # if needed:
-        # if llm.last_message:
-        #     cv2.putText(overlay, llm.last_message[:90], (10, overlay.shape[0]-15),
-        #                 0, 0.6, (200,255,200), 2)
-
-        # Log
-        log_row(time.time(), ear, br, pcl, cnn_prob, f, cli, vsi, dwi, last_action,
-                ear_t, fusion.w_visual, fusion.w_cnn)
-
-        # Show
-        cv2.imshow("Driver Wellness (Phase 11.4 Core Intelligence)", overlay)
-        if cv2.waitKey(1) & 0xFF == 27: break
-        time.sleep(0.005)
+        n_frames += 1
+        detail = gov.level.hud if gov is not None else "full"
+        if headless:
+            to_file = HUD_EVERY_N and n_frames % HUD_EVERY_N == 0
+            to_view = hub is not None and hub.hud_due(1.0 / HUD_VIEW_HZ)
+            if to_file or to_view:
+                with PROF.stage("render"):
+                    hud = render_hud(frame, m, fps, fusion, vision, detail)
+                    if to_file: _save_jpeg(hud, HUD_SNAPSHOT)
+                    if to_view: hub.set_hud(cv2.imencode(".jpg", hud)[1].tobytes())
+            PROF.frame(); PROF.tick(now)
+            if pipe is None: time.sleep(0.005)
+            continue
+        with PROF.stage("render"):
+            draw_hud(overlay, m, fps, fusion, detail)
+            PROF.panel(overlay)
+
+            # Last LLM line
+            # (Shown for context; not a "frontend" — just HUD text)
+            # if needed:
+            # if llm.last_message:
+            #     cv2.putText(overlay, llm.last_message[:90], (10, overlay.shape[0]-15),
+            #                 0, 0.6, (200,255,200), 2)
+
+            # Show
+            cv2.imshow("Driver Wellness (Phase 11.4 Core Intelligence)", overlay)
+            key = cv2.waitKey(1) & 0xFF
+        if key == 27: break
+        if key == ord("p"): PROF.toggle()
+        PROF.frame(); PROF.tick(now)
+        if pipe is None: time.sleep(0.005)
 
     # Close
-    cap.release(); cv2.destroyAllWindows()
+    if PROF.enabled and PROFILE_DUMP: PROF.dump(PROFILE_DUMP)
+    PROF.close()
+    if hub is not None: hub.stop()
+    _log_sink().close()
+    llm.stop()
+    if llm.q.counts["queued"]: print(llm.q.line()); print(_tts().q.line()); print("[phrases]", llm.phrases.stats())
+    if pipe is not None: pipe.stop()
+    if sched is not None: sched.stop()
+    cap.release()
+    if not headless: cv2.destroyAllWindows()        # GUI-less OpenCV builds raise here
     try: vstress.stop()
     except: pass
 
-    # Summary
-    session_end = time.time()
-    if last_above_t is not None:
-        time_above_high += (session_end - last_above_t)
-
-    avg_f = float(np.mean(fatigue_series)) if fatigue_series else 0.0
-    min_f = float(np.min(fatigue_series)) if fatigue_series else 0.0
-    max_f = float(np.max(fatigue_series)) if fatigue_series else 0.0
-    avg_b = float(np.mean(blink_series)) if blink_series else 0.0
-
-    summary = {
-        "start": int(session_start),
-        "end": int(session_end),
-        "duration_s": session_end - session_start,
-        "avg_fatigue": avg_f, "min_fatigue": min_f, "max_fatigue": max_f,
-        "avg_blink": avg_b,
-        "time_above_high_s": time_above_high
-    }
+    print(latency.line())
 
+    # Summary
+    summary = session.summary()
     write_summary(summary)
-    print("\n================ Session Summary ================")
-    print(f"Duration: {int(summary['duration_s'])} s")
-    print(f"Fatigue avg/min/max: {avg_f:.3f} / {min_f:.3f} / {max_f:.3f}")
-    print(f"Avg blink/min: {avg_b:.1f}")
-    print(f"Time above high (DWI≥{DWI_HIGH}): {int(time_above_high)} s")
-    print("Summary written to:", SUMMARY_PATH)
+    session.stats.discard_checkpoint()
+    print_summary(summary)
     print("🛑 Session Ended.")
 
 # ============================ BOOT ============================
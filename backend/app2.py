@@ -9,12 +9,21 @@ Driver Wellness Monitoring Prototype — Phase 10.8 (Stable + Fixed Fatigue Scor
 - CSV logging for post-analysis
 """
 
-import os, cv2, time, random, threading, subprocess, numpy as np, csv, queue
+import os, cv2, time, random, threading, numpy as np
 from collections import deque
 import tensorflow as tf
 from playsound import playsound
 import pyttsx3
 import mediapipe as mp
+from cnn_sched import CNNScheduler, staleness_weight
+from preprocess import Preprocessor
+from roi import FaceROITracker, to_frame_coords
+from geometry import landmarks_array, compute as compute_geometry
+from rolling import RollingStats, BucketedMean
+from session_log import SessionLogger
+from alerts import AlertQueue, CRITICAL, WARNING, SUPPORTIVE
+from llm_client import OllamaClient, PhraseCache
+from capture import Camera
 
 # ==========================================================
 # ---------------------- CONFIG ----------------------------
@@ -23,9 +32,27 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 
 USE_OLLAMA = False
+OLLAMA_URL = "http://127.0.0.1:11434"
+OLLAMA_MODEL = "llama3"
+LLM_CACHE_PATH = "llm_phrases.json"
 ALERT_SOUND = "alert.wav"
 IMG_SIZE = 224
+TFLITE_INPUT_IN_PLACE = True   # write CNN input straight into the interpreter's buffer
+FACE_ROI = True                # CNN + FaceMesh see only the padded face crop (roi.py)
+ROI_PAD = 0.35
 LOG_PATH = "fatigue_log.csv"
+PERCLOS_LONG_S = 300.0   # long-horizon PERCLOS (reported alongside the 30 s one)
+
+# Alert delivery (alerts.py): spoken within ALERT_DEADLINE_S of the trigger, or dropped
+ALERT_DEADLINE_S = 4.0
+ALERT_QUEUE_MAX = 4
+ALERT_PRIORITY = {"beep_alert": CRITICAL, "speak_break": WARNING, "speak_breathing": SUPPORTIVE}
+
+# CNN scheduling (cnn_sched.py). "every_frame" scores every frame as before.
+CNN_POLICY = "adaptive"   # "every_frame" | "every_n" | "hz" | "adaptive"
+CNN_EVERY_N = 10
+CNN_HZ = 2.0
+CNN_HALF_LIFE_S = 3.0
 
 
 # Automatically locate model files in the same directory as this script
@@ -62,20 +89,16 @@ def load_model():
     raise FileNotFoundError("❌ No model found!")
 
 model, IS_TFLITE = load_model()
+prep = Preprocessor(IMG_SIZE, interpreter=model if IS_TFLITE else None,
+                    use_interpreter_buffer=TFLITE_INPUT_IN_PLACE)
 
 def predict_model(frame):
-    img = cv2.resize(frame, (IMG_SIZE, IMG_SIZE))
-    img = np.expand_dims(img.astype("float32") / 255.0, axis=0)
+    # Preallocated input tensor + cached TFLite indices (preprocess.py)
     if IS_TFLITE:
-        inp = model.get_input_details()
-        out = model.get_output_details()
-        model.set_tensor(inp[0]['index'], img)
-        model.invoke()
-        res = model.get_tensor(out[0]['index'])
-        prob = float(res[0][0])
+        prob = prep.run_tflite(frame)
     else:
-        prob = float(model.predict(img, verbose=0)[0][0])
-    return float(np.clip(prob, 0.0, 1.0))
+        prob = float(model.predict(prep.fill(frame), verbose=0)[0][0])
+    return min(1.0, max(0.0, prob))
 
 # ==========================================================
 # ---------------------- TTS THREAD ------------------------
@@ -83,20 +106,21 @@ def predict_model(frame):
 class TTSWorker(threading.Thread):
     def __init__(self):
         super().__init__(daemon=True)
-        self.q = queue.Queue()
+        self.q = AlertQueue(ALERT_QUEUE_MAX, ALERT_DEADLINE_S, name="tts")
         self.tts = pyttsx3.init()
         self.tts.setProperty("rate", 175)
         self.tts.setProperty("volume", 1.0)
     def run(self):
         while True:
-            text = self.q.get()
+            a = self.q.get()
             try:
-                self.tts.say(text)
+                self.tts.say(a.text)
                 self.tts.runAndWait()
+                self.q.done(a)
             except Exception as e:
                 print("[TTS Error]", e)
-    def speak(self, text): 
-        self.q.put(text)
+    def speak(self, text, key=None, priority=WARNING, created=None, ttl_s=None):
+        return self.q.put(key or text, text, priority, ttl_s, created)
 
 tts_worker = TTSWorker()
 tts_worker.start()
@@ -120,8 +144,8 @@ class AudioController:
                 print("\a")
         except Exception as e: 
             print("[Alert Error]", e)
-    def speak(self, txt): 
-        tts_worker.speak(txt)
+    def speak(self, txt, **kw):
+        return tts_worker.speak(txt, **kw)
 
 # ==========================================================
 # ------------------- OLLAMA WORKER ------------------------
@@ -129,31 +153,26 @@ class AudioController:
 class LLMWorker(threading.Thread):
     def __init__(self, audio):
         super().__init__(daemon=True)
-        self.audio, self.q, self.last_message = audio, queue.Queue(), None
-    def enqueue(self, a, f): 
-        self.q.put((a, f))
+        self.audio, self.last_message = audio, None
+        self.q = AlertQueue(ALERT_QUEUE_MAX, ALERT_DEADLINE_S, name="llm")
+        self.phrases = PhraseCache(OllamaClient(OLLAMA_URL, OLLAMA_MODEL) if USE_OLLAMA else None,
+                                   LLM_CACHE_PATH)
+    def enqueue(self, context_text, action, created=None, cause="eyes"):
+        """One pending per action; `cause` picks the phrase bucket (visual-only here → "eyes")."""
+        return self.q.put(action, context_text, ALERT_PRIORITY.get(action, WARNING),
+                          created=created, meta=cause)
+    def start(self):
+        self.phrases.start(); super().start()
     def run(self):
         while True:
             try:
-                a, f = self.q.get()
-                base = {
-                    "beep_alert": "Wake up and focus.",
-                    "speak_break": "Take a short rest.",
-                    "speak_breathing": "Let’s breathe slowly.",
-                    "play_music": "Playing calm sounds."
-                }[a]
-                if USE_OLLAMA:
-                    proc = subprocess.Popen(
-                        ["ollama", "run", "llama3",
-                         f"Driver fatigue {f:.2f}. Short caring message like: {base}"],
-                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
-                    )
-                    out, _ = proc.communicate(timeout=6)
-                    msg = (out or "").strip() or base
-                else:
-                    msg = base
+                job = self.q.get()
+                # Served from the phrase cache, never a model call
+                msg = self.phrases.get(job.key, job.meta)
+                self.q.done(job)
                 self.last_message = msg
-                self.audio.speak(msg)
+                self.audio.speak(msg, key=job.key, priority=job.priority, created=job.created,
+                                 ttl_s=job.deadline - job.created)
             except Exception as e:
                 print("[LLM ERROR]", e)
             time.sleep(0.05)
@@ -174,15 +193,13 @@ class HeartSource:
 # ------------------ VISION MODULE -------------------------
 # ==========================================================
 class VisionModule:
-    LEFT = [33,160,158,133,153,144]
-    RIGHT = [362,385,387,263,373,380]
-    HEAD_POINTS = [1, 33, 263]
-
-    def __init__(self, warmup_s=10.0, perclos_horizon_s=30.0):
+    def __init__(self, warmup_s=10.0, perclos_horizon_s=30.0, face_roi=FACE_ROI):
         self.mesh = mp.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=True)
         self.draw = mp.solutions.drawing_utils
+        self.roi = FaceROITracker(pad=ROI_PAD) if face_roi else None
         self.ear_hist = deque(maxlen=15)
-        self.closed_samples = deque()
+        self.perclos_win = RollingStats(horizon=perclos_horizon_s)   # O(1) PERCLOS
+        self.perclos_long = BucketedMean(horizon=PERCLOS_LONG_S)     # 5-min PERCLOS, fixed memory
         self.blink_times = deque(maxlen=240)
         self.baseline_ear = None
         self.frames_closed = 0
@@ -205,31 +222,20 @@ class VisionModule:
 
 
 
-    def _ear(self, lm, idx, w, h):
-        def p(i): return np.array([lm[idx[i]].x*w, lm[idx[i]].y*h])
-        p1,p2,p3,p4,p5,p6 = [p(i) for i in range(6)]
-        vert = (np.linalg.norm(p2-p6)+np.linalg.norm(p3-p5))/2
-        horiz = np.linalg.norm(p1-p4)+1e-6
-        return vert/horiz
-
-    def _head_motion(self, lm, w, h):
-        pts = [np.array([lm[i].x*w, lm[i].y*h]) for i in self.HEAD_POINTS]
-        center = np.mean(pts, axis=0)
+    def _head_motion(self, center, w):
         if self.last_head_pos is None:
             self.last_head_pos = center
             return 0.0
-        dist = np.linalg.norm(center - self.last_head_pos) / w
+        dist = float(np.linalg.norm(center - self.last_head_pos)) / w
         self.last_head_pos = center
         return dist
 
     def _update_perclos(self, is_closed):
         now = time.time()
-        self.closed_samples.append((now, 1 if is_closed else 0))
-        while self.closed_samples and now - self.closed_samples[0][0] > self.perclos_horizon_s:
-            self.closed_samples.popleft()
-        if not self.closed_samples: return 0.0
-        vals = [c for _, c in self.closed_samples]
-        return sum(vals) / len(vals)
+        c = 1.0 if is_closed else 0.0
+        self.perclos_win.push(c, now)
+        self.perclos_long.push(c, now)
+        return self.perclos_win.fraction
 
     def _blink_rate_per_min(self):
         now = time.time()
@@ -237,40 +243,15 @@ class VisionModule:
             self.blink_times.popleft()
         return len(self.blink_times)
 
-    # ---------- Yawning Detection (MAR) ----------
-    def _mar(self, lm, w, h):
-        # Using mediapipe indices for upper/lower lips and mouth corners
-        top = np.array([lm[13].x*w, lm[13].y*h])
-        bottom = np.array([lm[14].x*w, lm[14].y*h])
-        # corners 78 and 308 are common mouth corners in MediaPipe
-        left = np.array([lm[78].x*w, lm[78].y*h])
-        right = np.array([lm[308].x*w, lm[308].y*h])
-        mar = np.linalg.norm(top - bottom) / (np.linalg.norm(left - right) + 1e-6)
-        return mar
-
-    # ---------- Head Nod Detection ----------
-        # ---------- Pitch angle (forehead->chin) ----------
-    def _pitch_angle(self, lm):
-        """
-        Compute pitch angle (degrees) of vector from forehead/top to chin/bottom.
-        Uses MediaPipe landmarks: forehead ~10, chin ~152 (normalized coords).
-        Returns angle in degrees where positive angle implies chin below forehead.
-        """
-        top = np.array([lm[10].x, lm[10].y])
-        bottom = np.array([lm[152].x, lm[152].y])
-        vec = bottom - top  # normalized vector
-        # angle relative to horizontal; convert to degrees
-        ang = np.degrees(np.arctan2(vec[1], vec[0]))
-        return ang
+    # MAR, pitch angle (forehead->chin) and gaze deviation come from geometry.compute()
 
     # ---------- Head nod detection using pitch angle ----------
-    def _head_nod_angle(self, lm, w, h):
+    def _head_nod_angle(self, ang):
         """
         Detect a quick down-then-up motion in pitch angle.
         Uses angle_hist to track recent pitch angles in degrees.
         Returns True when a nod pattern is detected.
         """
-        ang = self._pitch_angle(lm)
         self.angle_hist.append(ang)
 
         # need enough history to compute differences
@@ -298,32 +279,41 @@ class VisionModule:
 
         return False
 
-
-    # ---------- Gaze Off-road Detection ----------
-    def _gaze_direction(self, lm, w, h):
-        # Use iris landmarks (468..473) — compute average iris x and compare with eye center
-        # Note: indices are normalized (0..1), we return normalized deviation
-        try:
-            left_iris_x = lm[468].x
-            right_iris_x = lm[473].x
-            eye_center = (lm[33].x + lm[263].x) / 2.0
-            deviation = abs(((left_iris_x + right_iris_x) / 2.0) - eye_center)
-        except Exception:
-            deviation = 0.0
-        return deviation
-
-    def step(self, frame, cnn_prob):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    def detect(self, frame):
+        """
+        FaceMesh pass on the tracked face ROI when there is one, else the full frame.
+        """
+        h, w = frame.shape[:2]
+        region = self.roi.region(w, h) if self.roi is not None else None
+        res = None
+        if region is not None:
+            x0, y0, x1, y1 = region
+            res = self.mesh.process(cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2RGB))
+            if res.multi_face_landmarks:
+                to_frame_coords(res.multi_face_landmarks[0].landmark, region, w, h)
+            else:
+                res = None   # tracking lost → full-frame detection
+        if res is None:
+            res = self.mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        if self.roi is not None:
+            if res.multi_face_landmarks: self.roi.update(res.multi_face_landmarks[0].landmark, w, h)
+            else: self.roi.lost()
+        return res
+
+    def face_crop(self, frame):
+        """Face region for the CNN (zero-copy view; full frame when not tracking)."""
+        return self.roi.crop(frame) if self.roi is not None else frame
+
+    def step(self, frame, cnn_prob, cnn_age=0.0):
         h, w, _ = frame.shape
-        res = self.mesh.process(rgb)
+        res = self.detect(frame)
         ear = 0.0; blink_rate = 0.0; perclos = 0.0
         mar = 0.0; gaze_dev = 0.0; nod = False
 
         if res.multi_face_landmarks:
             lm = res.multi_face_landmarks[0].landmark
-            l = self._ear(lm, self.LEFT, w, h)
-            r = self._ear(lm, self.RIGHT, w, h)
-            ear = (l + r) / 2.0
+            geo = compute_geometry(landmarks_array(lm), w, h)   # one array, vectorized features
+            ear = (geo.ear_l + geo.ear_r) / 2.0
             self.ear_hist.append(ear)
             smooth_ear = np.mean(self.ear_hist)
 
@@ -334,7 +324,7 @@ class VisionModule:
                 self.baseline_ear = 0.95 * self.baseline_ear + 0.05 * smooth_ear
                 self.EAR_T = 0.7 * self.baseline_ear
 
-            head_motion = self._head_motion(lm, w, h)
+            head_motion = self._head_motion(geo.head, w)
             is_closed = smooth_ear < self.EAR_T if head_motion < self.motion_tolerance else False
 
             if is_closed:
@@ -348,15 +338,17 @@ class VisionModule:
             perclos = self._update_perclos(is_closed)
 
             # new feature computations
-            mar = self._mar(lm, w, h)
-            gaze_dev = self._gaze_direction(lm, w, h)
+            mar = geo.mar
+            gaze_dev = geo.gaze
             # replace chin-based nod with angle-based nod
-            nod = self._head_nod_angle(lm, w, h)
+            nod = self._head_nod_angle(geo.pitch)
 
             ear_deficit = np.clip((self.EAR_T - smooth_ear) / (self.EAR_T * 0.6), 0, 1)
             blink_penalty = np.clip((15.0 - blink_rate) / 15.0, 0, 1)
             visual = 0.6 * perclos + 0.25 * ear_deficit + 0.15 * blink_penalty
-            raw_fatigue = 0.6 * visual + 0.4 * cnn_prob
+            # CNN term fades out as its last (scheduled) result ages
+            w_cnn = 0.0 if cnn_prob is None else 0.4 * staleness_weight(cnn_age, CNN_HALF_LIFE_S)
+            raw_fatigue = (0.6 * visual + w_cnn * (cnn_prob or 0.0)) / (0.6 + w_cnn)
 
             α_up, α_down = 0.25, 0.1
             self.fatigue += (raw_fatigue - self.fatigue) * (α_up if raw_fatigue > self.fatigue else α_down)
@@ -396,6 +388,7 @@ class VisionModule:
             "ear": ear,
             "blink_per_min": blink_rate,
             "perclos_30s": perclos,
+            "perclos_5m": self.perclos_long.fraction,
             "fatigue": float(np.clip(self.fatigue, 0, 1)),
             "mar": float(mar),
             "gaze_dev": float(gaze_dev),
@@ -406,17 +399,22 @@ class VisionModule:
 # ==========================================================
 # ---------------------- LOGGING ---------------------------
 # ==========================================================
+LOG_HEADER = ["time", "ear", "blink_per_min", "perclos_30s", "cnn", "fatigue", "action", "mar", "gaze_dev", "head_nod"]
+log_sink = None   # SessionLogger, started on first log_row()
+
+def _log_sink():
+    global log_sink
+    if log_sink is None:
+        log_sink = SessionLogger(LOG_PATH, LOG_HEADER)
+        log_sink.start()
+    return log_sink
+
 def log_row(ts, ear, blinkpm, perclos, cnn, fatigue, action, mar=None, gaze_dev=None, head_nod=False):
-    header = ["time", "ear", "blink_per_min", "perclos_30s", "cnn", "fatigue", "action", "mar", "gaze_dev", "head_nod"]
-    exists = os.path.exists(LOG_PATH)
-    with open(LOG_PATH, "a", newline="") as f:
-        w = csv.writer(f)
-        if not exists:
-            w.writerow(header)
-        w.writerow([ts, ear, blinkpm, perclos, cnn, fatigue, action or "none",
-                    (None if mar is None else f"{mar:.3f}"),
-                    (None if gaze_dev is None else f"{gaze_dev:.3f}"),
-                    int(bool(head_nod))])
+    # Enqueue only; rows are batched to disk by the SessionLogger thread
+    _log_sink().log([ts, ear, blinkpm, perclos, cnn, fatigue, action or "none",
+                     (None if mar is None else f"{mar:.3f}"),
+                     (None if gaze_dev is None else f"{gaze_dev:.3f}"),
+                     int(bool(head_nod))])
 
 
 # ==========================================================
@@ -429,13 +427,18 @@ def main():
     llm.start()
     heart = HeartSource()
 
-    cap = cv2.VideoCapture(0)
+    cap = Camera(0)                 # newest frame only, buffer of 1 (capture.py)
     last_action = None
     last_trigger_t = 0.0
     FATIGUE_HIGH = 0.5
     FATIGUE_LOW  = 0.45
     COOLDOWN_S   = 15
     prev = time.time(); fps = 0.0
+    pcl = 0.0
+    sched = None
+    if CNN_POLICY != "every_frame":
+        sched = CNNScheduler(predict_model, policy=CNN_POLICY, every_n=CNN_EVERY_N, hz=CNN_HZ,
+                             prep=lambda fr: cv2.resize(vision.face_crop(fr), (IMG_SIZE, IMG_SIZE))).start()
 
     print("🚗 Running Phase 10.8 (Stable + Fixed Fatigue Scoring)")
 
@@ -443,8 +446,15 @@ def main():
         ok, frame = cap.read()
         if not ok: break
 
-        cnn_prob = predict_model(frame)
-        vis, overlay = vision.step(frame, cnn_prob)
+        if sched is not None:
+            t_frame = time.time()
+            sched.offer(frame, t_frame, vision.fatigue, pcl)
+            cnn_prob, cnn_ts = sched.latest()
+            cnn_age = None if cnn_ts is None else t_frame - cnn_ts
+        else:
+            cnn_prob, cnn_age = predict_model(vision.face_crop(frame)), 0.0
+        vis, overlay = vision.step(frame, cnn_prob, cnn_age)
+        cnn_prob = 0.0 if cnn_prob is None else cnn_prob
 
         f = vis["fatigue"]; ear = vis["ear"]; br = vis["blink_per_min"]
         pcl = vis["perclos_30s"]; hr = heart.read()["hr"]
@@ -463,7 +473,8 @@ def main():
             last_trigger_t = now
             print(f"[Trigger] {a} | fatigue={f:.2f}")
             if a == "beep_alert": audio.play_alert()
-            llm.enqueue(a, f)
+            llm.enqueue(f"Fatigue {f:.2f} (visual only).", a, created=now)
+            _log_sink().flush(durable=True)   # keep the lead-up to an alert on disk
 
         if f <= FATIGUE_LOW and (now - last_trigger_t) > 3.0:
             last_action = None
@@ -490,6 +501,10 @@ def main():
         if cv2.waitKey(1) & 0xFF == 27: break
         time.sleep(0.005)
 
+    if sched is not None: sched.stop()
+    _log_sink().close()
+    llm.phrases.stop()
+    if llm.q.counts["queued"]: print(llm.q.line()); print(tts_worker.q.line())
     cap.release()
     cv2.destroyAllWindows()
     print("🛑 Session Ended.")
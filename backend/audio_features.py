@@ -0,0 +1,204 @@
+"""
+Streaming voice-stress features — ring buffer + hop analysis, no per-block setup
+-------------------------------------------------------------------------------
+VoiceStressWorker used to rebuild np.hanning(n) and np.fft.rfftfreq(n) for
+every 0.5 s block, normalize through several temporary arrays, and hand each
+block from the sounddevice callback to a Queue(maxsize=4) that silently
+dropped audio when full.
+
+  RingBuffer   single-producer / single-consumer float32 ring. The audio
+               callback only copies into preallocated memory and bumps a
+               write index; the analysis thread only bumps the read index.
+               No locks; blocks that do not fit are counted, not hidden.
+  VSIEngine    window / frequency bins / scratch buffers computed once.
+               Analyses `win` samples every `hop` samples (0.5 s windows
+               every 0.25 s by default → 4 Hz VSI instead of 2 Hz for the
+               same FFT size). Scale-invariant features are computed on the
+               raw window, so the peak normalization is a single scalar.
+  WavSource    feeds a WAV file through the same ring (as fast as possible,
+               or paced in real time) for tests and benchmarks.
+
+VSI per window (unchanged): 0.5·rms_n + 0.3·zcr_n + 0.2·centroid_n, then an
+EMA whose 0.8/0.2 step is defined per 0.5 s and rescaled to the hop.
+
+    python audio_features.py speech.wav [--hop 0.25] [--realtime]
+"""
+
+import time, wave, argparse
+import numpy as np
+
+BLOCK_REF_S = 0.5        # the EMA constant below was tuned per 0.5 s block
+EMA_KEEP = 0.8
+
+
+# ========================= RING BUFFER ========================
+class RingBuffer:
+    """
+    SPSC ring of float32 samples. write() from the producer thread only,
+    peek()/advance() from the consumer thread only. Indices only grow.
+    """
+    def __init__(self, capacity):
+        self.cap = int(capacity)
+        self.buf = np.zeros(self.cap, np.float32)
+        self.w = 0                       # total samples written (producer-owned)
+        self.r = 0                       # total samples consumed (consumer-owned)
+        self.dropped_blocks = 0
+        self.dropped_samples = 0
+
+    def available(self): return self.w - self.r
+
+    def write(self, x):
+        """Copy a block in; returns False (and counts it) if it does not fit."""
+        n = len(x)
+        if n > self.cap - (self.w - self.r):
+            self.dropped_blocks += 1; self.dropped_samples += n
+            return False
+        i = self.w % self.cap
+        k = min(n, self.cap - i)
+        self.buf[i:i + k] = x[:k]
+        if k < n: self.buf[:n - k] = x[k:]
+        self.w += n                      # publish after the data is in place
+        return True
+
+    def peek(self, out):
+        """Copy the oldest len(out) samples into out (must be available)."""
+        n = len(out); i = self.r % self.cap
+        k = min(n, self.cap - i)
+        out[:k] = self.buf[i:i + k]
+        if k < n: out[k:] = self.buf[:n - k]
+        return out
+
+    def advance(self, n): self.r += n
+
+
+# ========================= VSI ENGINE =========================
+class VSIEngine:
+    """
+    feed(ring) analyses every complete window in the ring, advancing by hop;
+    returns the number of windows processed. last_vsi is the smoothed VSI.
+    """
+    def __init__(self, rate=16000, win_s=0.5, hop_s=0.25):
+        self.rate = rate
+        self.n = int(rate * win_s)
+        self.hop = max(1, int(rate * hop_s))
+        self.window = np.hanning(self.n).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(self.n, 1.0 / rate).astype(np.float32)
+        self.x = np.empty(self.n, np.float32)
+        self.tmp = np.empty(self.n, np.float32)
+        self.prod = np.empty(self.n - 1, np.float32)
+        self.neg = np.empty(self.n - 1, bool)
+        self.mag = np.empty(len(self.freqs), np.float32)
+        self.keep = EMA_KEEP ** (self.hop / (rate * BLOCK_REF_S))
+        self.last_vsi = 0.0
+        self.windows = 0
+
+    def features(self, x):
+        """(rms, zcr, spectral centroid) of one window, rms on the peak-normalized signal."""
+        mx = max(1e-6, float(x.max()), -float(x.min()))
+        rms = float(np.sqrt(np.dot(x, x) / len(x))) / mx
+        np.multiply(x[:-1], x[1:], out=self.prod)
+        zcr = float(np.count_nonzero(np.less(self.prod, 0, out=self.neg))) / len(x)
+        np.multiply(x, self.window, out=self.tmp)
+        np.abs(np.fft.rfft(self.tmp), out=self.mag)
+        s = float(self.mag.sum())
+        sc = float(np.dot(self.freqs, self.mag)) / s if s >= 1e-8 else 0.0
+        return rms, zcr, sc
+
+    def vsi(self, x):
+        rms, zcr, sc = self.features(x)
+        rms_n = min(1.0, max(0.0, (rms - 0.02) / 0.25))
+        zcr_n = min(1.0, max(0.0, (zcr - 0.02) / 0.25))
+        sc_n = min(1.0, max(0.0, sc / 4000.0))
+        v = 0.5*rms_n + 0.3*zcr_n + 0.2*sc_n
+        self.last_vsi = self.keep*self.last_vsi + (1 - self.keep)*v
+        self.windows += 1
+        return min(1.0, max(0.0, self.last_vsi))
+
+    def feed(self, ring):
+        k = 0
+        while ring.available() >= self.n:
+            self.vsi(ring.peek(self.x)); ring.advance(self.hop); k += 1
+        return k
+
+
+# =========================== SOURCES ==========================
+def read_wav(path, rate=None):
+    """Mono float32 in [-1, 1] (channel 0), linearly resampled to `rate` if given."""
+    with wave.open(path, "rb") as w:
+        sr, ch, width = w.getframerate(), w.getnchannels(), w.getsampwidth()
+        raw = w.readframes(w.getnframes())
+    if width == 1: x = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2: x = np.frombuffer(raw, "<i2").astype(np.float32) / 32768.0
+    elif width == 4: x = np.frombuffer(raw, "<i4").astype(np.float32) / 2147483648.0
+    else: raise ValueError(f"{path}: unsupported sample width {width}")
+    x = x.reshape(-1, ch)[:, 0]
+    if rate and rate != sr:
+        t = np.arange(int(len(x) * rate / sr)) / rate
+        x = np.interp(t, np.arange(len(x)) / sr, x).astype(np.float32)
+        sr = rate
+    return np.ascontiguousarray(x), sr
+
+
+class WavSource:
+    """Pushes a WAV file into a ring in `block`-sized chunks, like the mic callback."""
+    def __init__(self, path, rate=16000, block=1024, realtime=False):
+        self.x, self.rate = read_wav(path, rate)
+        self.block = block
+        self.realtime = realtime
+        self.pos = 0
+    def done(self): return self.pos >= len(self.x)
+    def pump(self, ring):
+        """Write blocks until the ring is full (or one block when pacing in real time)."""
+        while not self.done():
+            blk = self.x[self.pos:self.pos + self.block]
+            if len(blk) > ring.cap - ring.available(): return
+            ring.write(blk); self.pos += len(blk)
+            if self.realtime:
+                time.sleep(len(blk) / self.rate); return
+
+
+# ======================== BENCH / PARITY ======================
+def _legacy_vsi(x, sr, last):
+    """The pre-streaming per-block implementation (for parity and timing)."""
+    x = x.astype(np.float32); mx = max(1e-6, np.max(np.abs(x))); x = x / mx
+    rms = float(np.sqrt(np.mean(x*x))); zcr = float(((x[:-1]*x[1:]) < 0).sum()) / len(x)
+    n = len(x); win = np.hanning(n); X = np.abs(np.fft.rfft(x*win)); freqs = np.fft.rfftfreq(n, 1/sr)
+    s = X.sum(); sc = float((freqs*X).sum()/s) if s >= 1e-8 else 0.0
+    rms_n = np.clip((rms-0.02)/0.25, 0, 1); zcr_n = np.clip((zcr-0.02)/0.25, 0, 1); sc_n = np.clip(sc/4000.0, 0, 1)
+    last = 0.8*last + 0.2*float(0.5*rms_n + 0.3*zcr_n + 0.2*sc_n)
+    return last
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Streaming VSI on a WAV file (parity + throughput)")
+    ap.add_argument("wav")
+    ap.add_argument("--rate", type=int, default=16000)
+    ap.add_argument("--win", type=float, default=0.5)
+    ap.add_argument("--hop", type=float, default=0.25)
+    ap.add_argument("--realtime", action="store_true", help="pace the file like a microphone")
+    args = ap.parse_args()
+
+    src = WavSource(args.wav, args.rate, realtime=args.realtime)
+    eng = VSIEngine(src.rate, args.win, args.hop)
+    ring = RingBuffer(eng.n * 4)
+    t0 = time.perf_counter()
+    while not src.done() or ring.available() >= eng.n:
+        src.pump(ring)
+        eng.feed(ring)
+    t_new = time.perf_counter() - t0
+
+    # Legacy: non-overlapping blocks, rebuilt window / bins every block
+    n = eng.n; last = 0.0; t0 = time.perf_counter()
+    for i in range(0, len(src.x) - n + 1, n): last = _legacy_vsi(src.x[i:i + n], src.rate, last)
+    t_old = time.perf_counter() - t0
+    nb = max(1, len(src.x) // n)
+
+    # Parity: same engine with hop == win reproduces the legacy EMA exactly
+    e1 = VSIEngine(src.rate, args.win, args.win); r1 = RingBuffer(len(src.x) + 1); r1.write(src.x); e1.feed(r1)
+
+    dur = len(src.x) / src.rate
+    print(f"{dur:.1f} s of audio, {eng.windows} windows (hop {args.hop:.2f} s)")
+    print(f"streaming : {t_new*1e3/max(1, eng.windows):7.3f} ms/window  ({dur/max(1e-9, t_new):8.0f}x real-time)")
+    print(f"legacy    : {t_old*1e3/nb:7.3f} ms/block   ({dur/max(1e-9, t_old):8.0f}x real-time)")
+    print(f"parity    : |Δ final VSI| = {abs(e1.last_vsi - last):.2e} (hop = win)")
+    print(f"final VSI : {eng.last_vsi:.3f}   dropped: {ring.dropped_blocks} blocks")
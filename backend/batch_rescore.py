@@ -0,0 +1,243 @@
+"""
+Batch re-scoring — archived trips across a process pool
+-------------------------------------------------------
+Whenever DWI_HIGH, the fusion weights or the CNN model change, every archived
+trip has to be re-scored. replay.py does one video at a time; this shards a
+list of videos (or image-sequence directories) across worker processes:
+
+  - each worker imports app once (model loaded and kept warm) and creates one
+    FaceMesh that it reuses for every video it is handed
+  - workers run single-threaded TF / OpenCV / BLAS so N workers on N cores
+    scale close to linearly instead of fighting over the same cores
+  - the CNN backend is pinned (--set INFER_BACKEND=..., else the reference
+    model via app.resolve_backend()) so every worker and every rerun scores
+    with the same network, never the timing-based "auto" pick
+  - every finished trip is appended to progress.jsonl in the output dir,
+    tagged with a hash of the run config (--set overrides, pinned backend,
+    size + mtime of the model files, CNN policy, seed); a rerun with the same
+    config skips trips already in there (resume after a crash or Ctrl-C), a
+    rerun with a new model (even dropped in at the same path) or new
+    thresholds redoes them
+  - the fleet report is one write_summary()-style row per trip plus frames,
+    throughput and alert count, rebuilt from progress.jsonl at the end
+  - per-worker throughput (trips, frames, f/s, real-time factor) is printed
+
+Usage:
+    python batch_rescore.py trips/ --out rescore_0p65 --set DWI_HIGH=0.65
+    python batch_rescore.py trips/ --out rescore_w7 --set FUSION_W_VISUAL=0.7 --set FUSION_W_CNN=0.3
+    python batch_rescore.py a.mp4 b.mp4 --list more_trips.txt --workers 8
+"""
+
+import os, sys, csv, json, time, hashlib, argparse
+import multiprocessing as mp
+
+VIDEO_EXT = (".mp4", ".avi", ".mov", ".mkv", ".m4v")
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".bmp")
+PROGRESS_FILE = "progress.jsonl"
+REPORT_FILE = "fleet_report.csv"
+REPORT_HEADER = [
+    "source", "session_start", "session_end", "duration_s",
+    "avg_fatigue", "min_fatigue", "max_fatigue",
+    "avg_blink_per_min", "time_above_high_s",
+    "frames", "alerts", "replay_fps", "realtime_x", "worker", "cnn_backend",
+]
+
+# Per-worker state, set by _init_worker
+_W = {}
+
+
+# =========================== INPUTS ===========================
+def find_sources(paths, list_file=None):
+    """Expand args into replayable sources: video files, or dirs that are image sequences."""
+    if list_file:
+        with open(list_file) as f: paths = list(paths) + [l.strip() for l in f if l.strip() and not l.startswith("#")]
+    out = []
+    for p in paths:
+        if not os.path.isdir(p):
+            out.append(p); continue
+        names = sorted(os.listdir(p))
+        if any(n.lower().endswith(IMAGE_EXT) for n in names):
+            out.append(p); continue              # one trip stored as frames
+        for root, _, files in os.walk(p):
+            out.extend(os.path.join(root, n) for n in sorted(files) if n.lower().endswith(VIDEO_EXT))
+    seen = set()
+    return [os.path.abspath(p) for p in out if not (os.path.abspath(p) in seen or seen.add(os.path.abspath(p)))]
+
+
+def _out_name(src):
+    """Stable, collision-free per-trip file stem (parent dir + name)."""
+    parent = os.path.basename(os.path.dirname(src))
+    return f"{parent}__{os.path.splitext(os.path.basename(src))[0]}"
+
+
+def model_files(app):
+    """[path, size, mtime_ns] of every CNN model file present — a new model at the same path changes it."""
+    paths = list(app.MODEL_PATHS) + [app.TFLITE_PATH, app.TFLITE_INT8_PATH, app.ONNX_PATH]
+    out = []
+    for p in paths:
+        if p and os.path.exists(p):
+            st = os.stat(p); out.append([p, st.st_size, st.st_mtime_ns])
+    return out
+
+
+def config_key(overrides, cnn_policy=None, seed=0, models=()):
+    """Short stable hash of everything that changes a trip's result."""
+    doc = json.dumps({"set": overrides, "cnn_policy": cnn_policy, "seed": seed, "models": list(models)},
+                     sort_keys=True, default=str)
+    return hashlib.sha1(doc.encode()).hexdigest()[:12]
+
+
+def load_progress(path, config=None):
+    """source → result dict for every trip already finished under `config` (torn last line ignored)."""
+    done = {}
+    if not os.path.exists(path): return done
+    with open(path) as f:
+        for line in f:
+            try: r = json.loads(line)
+            except ValueError: continue
+            if r.get("ok") and r.get("config") == config: done[r["source"]] = r
+    return done
+
+
+# =========================== WORKER ===========================
+def _init_worker(overrides, out_dir, cnn_policy, seed):
+    # One core per worker: set before TF / cv2 / numpy create their pools
+    for k in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+              "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"):
+        os.environ[k] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import cv2
+    cv2.setNumThreads(1)
+    import app
+    for k, v in overrides.items(): setattr(app, k, v)   # before the model load: TFLITE_PATH, MODEL_PATHS, ...
+    app.ensure_model()                           # loads the model once per worker
+    import mediapipe as mp_
+    _W.update(app=app, out_dir=out_dir, cnn_policy=cnn_policy, seed=seed,
+              mesh=mp_.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=True))
+
+
+def _rescore(src):
+    """Replay one trip in this worker; returns a JSON-able result row."""
+    from replay import run_replay
+    stem = os.path.join(_W["out_dir"], _out_name(src))
+    log_path, summary_path = f"{stem}_replay.csv", f"{stem}_summary.csv"
+    for p in (log_path, summary_path):           # a previous attempt may have died half-way
+        if os.path.exists(p): os.remove(p)
+    t0 = time.perf_counter()
+    try:
+        summary, st = run_replay(src, log_path, summary_path, cnn_policy=_W["cnn_policy"],
+                                 seed=_W["seed"], mesh=_W["mesh"], quiet=True)
+    except Exception as e:
+        return {"source": src, "ok": False, "error": f"{type(e).__name__}: {e}",
+                "worker": os.getpid(), "wall_s": time.perf_counter() - t0}
+    return {"source": src, "ok": True, "worker": os.getpid(), "summary": summary,
+            "frames": st["frames"], "alerts": st["alerts"], "wall_s": st["wall_s"],
+            "fps": st["fps"], "realtime_x": st["realtime_x"], "log": log_path}
+
+
+# =========================== REPORT ===========================
+def write_report(results, path):
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(REPORT_HEADER)
+        for r in sorted(results, key=lambda r: r["source"]):
+            s = r["summary"]
+            w.writerow([
+                r["source"], s["start"], s["end"], int(s["duration_s"]),
+                round(s["avg_fatigue"],3), round(s["min_fatigue"],3), round(s["max_fatigue"],3),
+                round(s["avg_blink"],2), int(s["time_above_high_s"]),
+                r["frames"], r["alerts"], round(r["fps"],1), round(r["realtime_x"],2), r["worker"],
+                s.get("cnn_backend", ""),
+            ])
+
+
+def worker_stats(results):
+    """pid → {trips, frames, busy_s, fps, realtime_x} over this run's results."""
+    per = {}
+    for r in results:
+        p = per.setdefault(r["worker"], {"trips": 0, "frames": 0, "busy_s": 0.0, "video_s": 0.0})
+        p["trips"] += 1; p["frames"] += r["frames"]; p["busy_s"] += r["wall_s"]
+        p["video_s"] += r["realtime_x"] * r["wall_s"]
+    for p in per.values():
+        p["fps"] = p["frames"] / max(1e-9, p["busy_s"])
+        p["realtime_x"] = p["video_s"] / max(1e-9, p["busy_s"])
+    return per
+
+
+def _parse_set(items):
+    out = {}
+    for it in items or []:
+        k, _, v = it.partition("=")
+        if not _ or not k.isupper(): raise SystemExit(f"❌ --set expects NAME=VALUE with an app.py constant, got {it!r}")
+        try: out[k] = json.loads(v)
+        except ValueError: out[k] = v           # plain strings, e.g. CNN_POLICY=hz
+    return out
+
+
+# ============================ BOOT ============================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Re-score archived trips in parallel")
+    ap.add_argument("sources", nargs="*", help="video files, trip directories, or image-sequence dirs")
+    ap.add_argument("--list", help="text file with one source per line")
+    ap.add_argument("--out", default="rescore_out", help="output dir (logs, summaries, progress, report)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--set", action="append", metavar="NAME=VALUE",
+                    help="override an app.py constant in every worker, e.g. DWI_HIGH=0.65")
+    ap.add_argument("--cnn-policy", choices=["every_frame", "every_n", "hz", "adaptive"])
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--restart", action="store_true", help="ignore existing progress and redo every trip")
+    args = ap.parse_args(argv)
+
+    overrides = _parse_set(args.set)
+    import app                                   # resolve the model / backend the workers will use
+    unknown = [k for k in overrides if not hasattr(app, k)]
+    if unknown: raise SystemExit(f"❌ --set: no such app.py constant: {', '.join(unknown)}")
+    for k, v in overrides.items(): setattr(app, k, v)
+    overrides["INFER_BACKEND"] = app.INFER_BACKEND = app.resolve_backend()
+    os.makedirs(args.out, exist_ok=True)
+    progress_path = os.path.join(args.out, PROGRESS_FILE)
+    report_path = os.path.join(args.out, REPORT_FILE)
+    if args.restart and os.path.exists(progress_path): os.remove(progress_path)
+
+    sources = find_sources(args.sources, args.list)
+    if not sources: raise SystemExit("❌ No sources to re-score")
+    config = config_key(overrides, args.cnn_policy, args.seed, model_files(app))
+    done = load_progress(progress_path, config)
+    todo = [s for s in sources if s not in done]
+    print(f"🗂  {len(sources)} trips, {len(done)} already done, {len(todo)} to go on {args.workers} workers "
+          f"(config {config})")
+    if overrides: print("   overrides:", ", ".join(f"{k}={v}" for k, v in overrides.items()))
+
+    fresh, failed = [], 0
+    t0 = time.perf_counter()
+    if todo:
+        # spawn: TF / MediaPipe threads don't survive fork()
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(min(args.workers, len(todo)), initializer=_init_worker,
+                      initargs=(overrides, os.path.abspath(args.out), args.cnn_policy, args.seed)) as pool, \
+             open(progress_path, "a") as prog:
+            for i, r in enumerate(pool.imap_unordered(_rescore, todo, chunksize=1), 1):
+                r["config"] = config
+                prog.write(json.dumps(r, default=float) + "\n"); prog.flush()
+                if r["ok"]:
+                    fresh.append(r); done[r["source"]] = r
+                    print(f"[{i}/{len(todo)}] ✅ {os.path.basename(r['source'])}: {r['frames']} frames, "
+                          f"{r['fps']:.0f} f/s, {r['alerts']} alerts (pid {r['worker']})")
+                else:
+                    failed += 1
+                    print(f"[{i}/{len(todo)}] [X Error] {r['source']}: {r['error']}")
+    wall = time.perf_counter() - t0
+
+    write_report([done[s] for s in sources if s in done], report_path)
+    frames = sum(r["frames"] for r in fresh)
+    print("\n================ Batch Summary ================")
+    print(f"Re-scored {len(fresh)} trips ({failed} failed) in {wall:.1f} s — {frames / max(1e-9, wall):.0f} f/s overall")
+    for pid, p in sorted(worker_stats(fresh).items()):
+        print(f"  worker {pid}: {p['trips']} trips, {p['frames']} frames, {p['fps']:.1f} f/s, "
+              f"{p['realtime_x']:.1f}x real-time, busy {p['busy_s']:.0f} s")
+    print("Fleet report written to:", report_path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""
+Hot-path benchmarks — per-stage latency, fps and allocations with baselines
+---------------------------------------------------------------------------
+Runs each per-frame stage of app.py in isolation, plus the whole frame loop,
+on a synthetic frame and a canned 478-point landmark set, so numbers are
+reproducible without a camera, a face or a driver:
+
+  predict_model   CNN on the face crop (Keras or TFLite, whatever app loads)
+  facemesh        FaceMesh.process on the full RGB frame
+  detect          VisionModule.detect (ROI crop + FaceMesh + ROI update)
+  features        landmarks → array → geometry.compute
+  vision_step     VisionModule.step with canned landmarks (features, blink,
+                  PERCLOS, fusion, EMA, landmark drawing)
+  trend_update    TrendTracker.update
+  log_row         log_row() into a SessionLogger (frame-loop side: enqueue)
+  hud             draw_hud on the frame
+  frame_loop      detect + CNN every CNN_EVERY_N frames + DriverSession.process + HUD
+  frame_loop_headless  the same without landmark drawing and HUD (HEADLESS mode)
+
+For every stage: p50 / p95 / p99 / mean latency, fps (1 / mean) and, from a
+separate tracemalloc pass, the transient allocation peak and retained bytes
+per call, plus allocations per call: heap blocks allocated by the call's
+Python code, temporaries included (count_allocs, opcode-level tracing).
+Results are JSON; --baseline fails (exit 1) when a stage's p50 / p95,
+allocation peak or allocation count regresses past the stored numbers by
+more than --tolerance.
+
+Usage:
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --baseline bench_baseline.json --json bench.json
+    python bench.py --stages features,vision_step,trend_update --iters 2000
+"""
+
+import os, sys, json, time, tempfile, platform, argparse, tracemalloc
+import numpy as np
+import cv2
+
+from geometry import synthetic_landmarks, landmarks_array, compute as compute_geometry
+
+STAGES = {}
+FRAME_DT = 1.0 / 30.0
+NOISE_FLOOR_MS = 0.05        # latency deltas below this are never a regression
+ALLOC_SLACK_KB = 1.0
+ALLOC_SLACK_N = 2.0           # allocations per call a stage may gain before it counts as a regression
+
+
+def stage(name):
+    def reg(fn): STAGES[name] = fn; return fn
+    return reg
+
+
+# ========================== FIXTURES ==========================
+def synthetic_frame(w, h, seed=0):
+    """Deterministic BGR frame: smooth gradient plus noise (JPEG-like texture)."""
+    rng = np.random.default_rng(seed)
+    gx = np.linspace(40, 200, w, dtype=np.float32)[None, :, None]
+    gy = np.linspace(0, 40, h, dtype=np.float32)[:, None, None]
+    img = gx + gy + rng.normal(0, 12, (h, w, 3)).astype(np.float32)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+class CannedResult:
+    """Stand-in for a FaceMesh result with one face (real landmark protos, so drawing works)."""
+    def __init__(self, n=478, seed=0):
+        from mediapipe.framework.formats import landmark_pb2
+        face = landmark_pb2.NormalizedLandmarkList()
+        for p in synthetic_landmarks(n, seed):
+            face.landmark.add(x=p.x, y=p.y, z=p.z)
+        self.multi_face_landmarks = [face]
+
+
+class Fixture:
+    """Shared inputs plus cleanups for the stages of one run."""
+    def __init__(self, w, h):
+        from replay import VirtualClock
+        self.w, self.h = w, h
+        self.frame = synthetic_frame(w, h)
+        self.clock = VirtualClock(0.0)
+        self.cleanups = []
+        self._res = None
+    @property
+    def res(self):
+        if self._res is None: self._res = CannedResult()
+        return self._res
+    def tick(self): self.clock.set(self.clock() + FRAME_DT)
+    def logger(self):
+        import app
+        from session_log import SessionLogger
+        fd, path = tempfile.mkstemp(suffix=".csv", prefix="vg_bench_"); os.close(fd)
+        sink = SessionLogger(path, app.LOG_HEADER, maxsize=1 << 16); sink.start()
+        self.cleanups.append(lambda: (sink.close(), os.remove(path)))
+        return sink
+    def close(self):
+        for fn in self.cleanups:
+            try: fn()
+            except Exception as e: print("[Bench cleanup Error]", e)
+
+
+# =========================== STAGES ===========================
+# Each returns a callable f(i) for iteration i.
+@stage("predict_model")
+def _predict(fx):
+    import app
+    app.ensure_model()
+    crop = fx.frame[: fx.h // 2, fx.w // 4: fx.w * 3 // 4]
+    return lambda i: app.predict_model(crop)
+
+@stage("facemesh")
+def _facemesh(fx):
+    import mediapipe as mp
+    mesh = mp.solutions.face_mesh.FaceMesh(max_num_faces=1, refine_landmarks=True)
+    fx.cleanups.append(mesh.close)
+    return lambda i: mesh.process(cv2.cvtColor(fx.frame, cv2.COLOR_BGR2RGB))
+
+@stage("detect")
+def _detect(fx):
+    import app
+    vision = app.VisionModule(clock=fx.clock)
+    return lambda i: vision.detect(fx.frame)
+
+@stage("features")
+def _features(fx):
+    lm = fx.res.multi_face_landmarks[0].landmark
+    return lambda i: compute_geometry(landmarks_array(lm), fx.w, fx.h)
+
+@stage("vision_step")
+def _vision_step(fx):
+    import app
+    vision = app.VisionModule(clock=fx.clock)
+    trend, fusion = app.TrendTracker(alpha=0.1, window_s=30.0, clock=fx.clock), app.FusionEngine()
+    frame = fx.frame.copy()                           # step draws landmarks in place
+    def f(i):
+        fx.tick()
+        return vision.step(frame, 0.3, 0.0, trend, fusion, res=fx.res)
+    return f
+
+@stage("trend_update")
+def _trend(fx):
+    import app
+    trend = app.TrendTracker(alpha=0.1, window_s=30.0, clock=fx.clock)
+    def f(i):
+        fx.tick()
+        return trend.update(0.1 + 0.05 * ((i * 7919) % 13) / 13.0)
+    return f
+
+@stage("log_row")
+def _log_row(fx):
+    import app
+    sink = fx.logger()
+    return lambda i: app.log_row(i * FRAME_DT, 0.27, 14.0, 0.08, 0.3, 0.25, 0.2, 0.1, 0.3,
+                                 None, 0.23, 0.6, 0.4, sink=sink)
+
+@stage("hud")
+def _hud(fx):
+    import app
+    m = {"fatigue": 0.25, "ear": 0.27, "blink_per_min": 14.0, "perclos_30s": 0.08, "ear_thresh": 0.23,
+         "cnn": 0.3, "cli": 0.2, "vsi": 0.1, "dwi": 0.55, "hr": 72, "hrv": 48}
+    fusion = app.FusionEngine(); frame = fx.frame.copy()
+    return lambda i: app.draw_hud(frame, m, 30.0, fusion)
+
+def _loop(fx, headless):
+    import app
+    app.ensure_model()
+    session = app.DriverSession(clock=fx.clock, logger=fx.logger())
+    vision = session.vision
+    vision.draw_landmarks = not headless
+    state = {"prob": None}; frame = fx.frame.copy()
+    def f(i):
+        fx.tick()
+        vision.detect(frame)                          # real mesh cost (no face in the synthetic frame)
+        if i % max(1, app.CNN_EVERY_N) == 0: state["prob"] = app.predict_model(vision.face_crop(frame))
+        m, overlay = session.process(frame, state["prob"], 0.0, res=fx.res)
+        return m if headless else app.draw_hud(overlay, m, 30.0, session.fusion)
+    return f
+
+@stage("frame_loop")
+def _frame_loop(fx): return _loop(fx, headless=False)
+
+@stage("frame_loop_headless")
+def _frame_loop_headless(fx): return _loop(fx, headless=True)
+
+
+# ========================== MEASURE ===========================
+def count_allocs(fn, i):
+    """
+    Heap blocks allocated on this thread during fn(i), freed or not: the
+    pymalloc block count is read at every opcode (sys.settrace with
+    f_trace_opcodes) and every increase is summed, so temporaries such as the
+    intermediates of `a * b + c` count. Freelist reuse (floats, dicts, small
+    tuples) is not an allocation; blocks allocated and freed inside a single
+    native call (cv2, FaceMesh internals) are invisible, which is what the
+    tracemalloc byte peak covers.
+    """
+    get = sys.getallocatedblocks
+    st = [0, 0]                              # [blocks allocated, count at the previous event]
+    def tracer(frame, event, arg):
+        frame.f_trace_opcodes = True
+        n = get()
+        if n > st[1]: st[0] += n - st[1]
+        st[1] = get() - 1                    # -1: the int just stored replaces (frees) the previous one
+        return tracer
+    st[1] = get()
+    sys.settrace(tracer)
+    try: fn(i)
+    finally: sys.settrace(None)
+    return st[0]
+
+
+def _alloc_overhead():
+    """count_allocs() of a no-op: the tracer's own enter / exit blocks."""
+    return min(count_allocs(lambda i: None, 0) for _ in range(5))
+
+
+def measure(fn, iters, warmup, alloc_iters):
+    for i in range(warmup): fn(i)
+    lat = np.empty(iters, np.float64)
+    clock = time.perf_counter_ns
+    for i in range(iters):
+        t0 = clock(); fn(warmup + i); lat[i] = clock() - t0
+    lat /= 1e6
+    out = {"iters": iters,
+           "p50_ms": float(np.percentile(lat, 50)), "p95_ms": float(np.percentile(lat, 95)),
+           "p99_ms": float(np.percentile(lat, 99)), "mean_ms": float(lat.mean()),
+           "fps": float(1000.0 / max(1e-9, lat.mean())),
+           "alloc_peak_kb": None, "retained_b": None, "allocs": None}
+    if alloc_iters and hasattr(tracemalloc, "reset_peak"):
+        # Separate pass: tracemalloc slows everything down, so it never touches the timings
+        tracemalloc.start()
+        peak = 0; retained = 0
+        try:
+            for i in range(alloc_iters):
+                tracemalloc.reset_peak()
+                c0 = tracemalloc.get_traced_memory()[0]
+                fn(warmup + iters + i)
+                c1, pk = tracemalloc.get_traced_memory()
+                peak += pk - c0; retained += c1 - c0
+        finally:
+            tracemalloc.stop()
+        out["alloc_peak_kb"] = peak / alloc_iters / 1024.0
+        out["retained_b"] = retained / alloc_iters
+        # Allocation count: opcode tracing is ~100x slower, so fewer calls
+        n = max(1, alloc_iters // 5); base = _alloc_overhead()
+        allocs = sorted(count_allocs(fn, warmup + iters + alloc_iters + i) for i in range(n))
+        out["allocs"] = float(max(0, allocs[n // 2] - base))          # median: one-off cache fills aside
+    return out
+
+
+def run(names, iters=300, warmup=30, alloc_iters=50, size=(1280, 720), quiet=False):
+    fx = Fixture(*size)
+    results = {}
+    try:
+        for name in names:
+            try: fn = STAGES[name](fx)
+            except Exception as e:
+                print(f"⚠️ Skipping {name}: {type(e).__name__}: {e}"); continue
+            iters_n = iters if name not in ("predict_model", "facemesh", "frame_loop") else max(10, iters // 3)
+            results[name] = r = measure(fn, iters_n, warmup, alloc_iters)
+            if not quiet:
+                alloc = "" if r["alloc_peak_kb"] is None else \
+                    f" | {r['alloc_peak_kb']:8.1f} KB/call, {r['allocs']:6.1f} allocs/call"
+                print(f"{name:>14}: p50 {r['p50_ms']:8.3f} | p95 {r['p95_ms']:8.3f} | p99 {r['p99_ms']:8.3f} ms"
+                      f" | {r['fps']:9.1f} /s{alloc}")
+    finally:
+        fx.close()
+    return results
+
+
+def meta(size):
+    return {"time": time.time(), "python": platform.python_version(), "platform": platform.platform(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "frame": list(size)}
+
+
+def check(results, baseline, tolerance=0.20):
+    """List of human-readable regressions of `results` vs baseline["stages"]."""
+    bad = []
+    for name, r in results.items():
+        b = baseline.get("stages", {}).get(name)
+        if b is None: continue
+        for k in ("p50_ms", "p95_ms"):
+            if r[k] > b[k] * (1 + tolerance) and r[k] - b[k] > NOISE_FLOOR_MS:
+                bad.append(f"{name}.{k}: {r[k]:.3f} > {b[k]:.3f} (+{(r[k]/max(1e-9, b[k])-1)*100:.0f}%)")
+        ra, ba = r.get("alloc_peak_kb"), b.get("alloc_peak_kb")
+        if ra is not None and ba is not None and ra > ba * (1 + tolerance) + ALLOC_SLACK_KB:
+            bad.append(f"{name}.alloc_peak_kb: {ra:.1f} > {ba:.1f}")
+        ra, ba = r.get("allocs"), b.get("allocs")
+        if ra is not None and ba is not None and ra > ba * (1 + tolerance) + ALLOC_SLACK_N:
+            bad.append(f"{name}.allocs: {ra:.1f} > {ba:.1f} per call")
+    return bad
+
+
+# ============================ BOOT ============================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-frame hot-path benchmarks")
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    ap.add_argument("--iters", type=int, default=300)
+    ap.add_argument("--warmup", type=int, default=30)
+    ap.add_argument("--alloc-iters", type=int, default=50, help="tracemalloc pass length (0 = off)")
+    ap.add_argument("--size", default="1280x720", help="synthetic frame WxH")
+    ap.add_argument("--json", help="write results as JSON ('-' = stdout)")
+    ap.add_argument("--baseline", help="fail if a stage regresses past this JSON")
+    ap.add_argument("--tolerance", type=float, default=0.20, help="allowed relative regression")
+    ap.add_argument("--save-baseline", help="write results as the new baseline")
+    args = ap.parse_args(argv)
+
+    names = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in names if s not in STAGES]
+    if unknown: raise SystemExit(f"❌ Unknown stage(s): {', '.join(unknown)}")
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    quiet = args.json == "-"
+    doc = {"meta": meta(size), "stages": run(names, args.iters, args.warmup, args.alloc_iters, size, quiet)}
+    if args.json == "-": json.dump(doc, sys.stdout, indent=2); print()
+    elif args.json:
+        with open(args.json, "w") as f: json.dump(doc, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f: json.dump(doc, f, indent=2)
+        if not quiet: print("✅ Baseline written to:", args.save_baseline)
+
+    if args.baseline:
+        with open(args.baseline) as f: base = json.load(f)
+        bad = check(doc["stages"], base, args.tolerance)
+        for b in bad: print("[X Regression]", b, file=sys.stderr)
+        if bad: return 1
+        if not quiet: print(f"✅ No regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
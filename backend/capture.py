@@ -0,0 +1,198 @@
+"""
+Low-latency camera capture — explicit format, newest frame only, timestamps
+---------------------------------------------------------------------------
+cv2.VideoCapture(0) was opened with driver defaults: unknown resolution and
+pixel format, and an internal queue of several frames, so read() could hand
+back a frame captured well over 100 ms earlier. Camera wraps VideoCapture:
+
+  settings   FOURCC first (MJPG for 720p30 over USB2, YUYV for the lowest
+             decode cost at small sizes), then size, FPS and BUFFERSIZE=1;
+             the values the driver actually accepted are read back and
+             printed, since drivers silently ignore what they can't do
+  grab       a dedicated thread grab()s continuously and decodes into a
+             single "newest" slot stamped with the grab time. read() waits
+             for a frame newer than the last one returned and never sees a
+             queued one; frames superseded before anyone read them are
+             counted as skipped.
+  gray       gray=True delivers the luminance plane only: the Y bytes of the
+             raw YUYV buffer (no colour conversion at all) or a grayscale
+             JPEG decode for MJPG; read_gray() gives it for colour frames.
+             FaceMesh needs colour, so the app keeps gray off.
+  latency    LatencyMeter histograms capture → decision time (capture
+             timestamp to the alert decision in the frame loop).
+
+Camera is a drop-in for what the app and FramePipeline use: read(), set(),
+get(), isOpened(), release(); last_ts is the capture time of the frame
+returned by the last read().
+
+    python capture.py [--size 1280x720] [--fourcc MJPG] [--seconds 10]
+"""
+
+import time, threading, argparse
+import cv2
+
+from infer_server import Histogram
+
+LATENCY_BOUNDS_MS = [5, 10, 15, 20, 25, 33, 40, 50, 66, 80, 100, 133, 166, 200, 300, 500, 1000]
+
+
+def fourcc_str(v):
+    v = int(v)
+    return "".join(chr((v >> 8 * i) & 0xFF) for i in range(4)).strip("\0") if v > 0 else "?"
+
+
+class Camera:
+    def __init__(self, index=0, size=(1280, 720), fps=30, fourcc="MJPG", buffer_size=1, api=cv2.CAP_ANY,
+                 threaded=True, gray=False, name="vg-grab"):
+        self.index = index
+        self.threaded = threaded
+        self.gray = gray
+        self.cap = cv2.VideoCapture(index, api)
+        self.cv = threading.Condition()
+        self.frame = None; self.ts = None; self.seq = 0
+        self.last_seq = 0; self.last_ts = None
+        self.pending = {}                   # set() calls for the grab thread
+        self.ended = False
+        self.grabbed = 0; self.delivered = 0; self.skipped = 0
+        self._stop = False
+        self._thread = None
+        self.actual = {}
+        if not self.cap.isOpened(): return
+        if fourcc: self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        if size:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, size[0]); self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        if fps: self.cap.set(cv2.CAP_PROP_FPS, fps)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+        if gray: self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)      # raw buffer: YUYV bytes / JPEG stream
+        self.actual = self.settings()
+        print("📷 Camera {index}: {w}x{h} @ {fps:.0f} fps, {fourcc}, buffer {buffer}".format(index=index, **self.actual))
+        if threaded:
+            self._thread = threading.Thread(target=self._grab_loop, daemon=True, name=name)
+            self._thread.start()
+
+    def settings(self):
+        g = self.cap.get
+        return {"w": int(g(cv2.CAP_PROP_FRAME_WIDTH)), "h": int(g(cv2.CAP_PROP_FRAME_HEIGHT)),
+                "fps": g(cv2.CAP_PROP_FPS), "fourcc": fourcc_str(g(cv2.CAP_PROP_FOURCC)),
+                "buffer": int(g(cv2.CAP_PROP_BUFFERSIZE))}
+
+    # ------------------------- decoding -----------------------
+    def _to_gray(self, raw):
+        """Raw (CONVERT_RGB=0) buffer → Y plane; falls back to a colour conversion."""
+        if raw.ndim == 3 and raw.shape[2] == 2: return raw[:, :, 0]              # YUYV as (h, w, 2)
+        if raw.ndim == 3 and raw.shape[2] == 3: return cv2.cvtColor(raw, cv2.COLOR_BGR2GRAY)
+        w, h = self.actual["w"], self.actual["h"]
+        if raw.size == w * h * 2: return raw.reshape(h, w, 2)[:, :, 0]          # packed YUYV bytes
+        return cv2.imdecode(raw.reshape(-1), cv2.IMREAD_GRAYSCALE)               # MJPG stream
+
+    def _grab_one(self):
+        if self.pending:
+            props, self.pending = self.pending, {}
+            for k, v in props.items(): self.cap.set(k, v)
+            if props: self.actual = self.settings()
+        if not self.cap.grab(): return None, None
+        ts = time.time()                                  # as close to the sensor as user space gets
+        ok, frame = self.cap.retrieve()
+        if not ok or frame is None: return None, None
+        return (self._to_gray(frame) if self.gray else frame), ts
+
+    def _grab_loop(self):
+        fails = 0
+        while not self._stop:
+            frame, ts = self._grab_one()
+            if frame is None:
+                fails += 1
+                if fails < 10: time.sleep(0.01); continue
+                break
+            fails = 0
+            with self.cv:
+                if self.seq > self.last_seq: self.skipped += 1     # previous one was never read
+                self.frame, self.ts = frame, ts; self.seq += 1; self.grabbed += 1
+                self.cv.notify_all()
+        with self.cv:
+            self.ended = True; self.cv.notify_all()
+
+    # ------------------------- VideoCapture API ---------------
+    def read(self, timeout=5.0):
+        """(ok, newest frame not returned before). Blocks up to timeout for a new one."""
+        if not self.threaded:
+            frame, ts = self._grab_one()
+            if frame is None: return False, None
+            self.last_ts = ts; self.grabbed += 1; self.delivered += 1
+            return True, frame
+        with self.cv:
+            if not self.cv.wait_for(lambda: self.seq > self.last_seq or self.ended, timeout) or \
+                    self.seq <= self.last_seq:
+                return False, None
+            self.last_seq, self.last_ts = self.seq, self.ts
+            self.delivered += 1
+            return True, self.frame
+
+    def read_gray(self, timeout=5.0):
+        ok, frame = self.read(timeout)
+        if not ok: return False, None
+        return True, (frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+
+    def set(self, prop, value):
+        """Applied by the grab thread between frames (VideoCapture isn't thread-safe)."""
+        if self.threaded: self.pending = {**self.pending, prop: value}; return True
+        return self.cap.set(prop, value)
+
+    def get(self, prop): return self.cap.get(prop)
+    def isOpened(self): return self.cap.isOpened() and not self.ended
+
+    def age(self):
+        """Seconds since the newest grabbed frame was captured."""
+        return None if self.ts is None else time.time() - self.ts
+
+    def stats(self):
+        return {"grabbed": self.grabbed, "delivered": self.delivered, "skipped": self.skipped, **self.actual}
+
+    def release(self):
+        self._stop = True
+        if self._thread is not None: self._thread.join(timeout=1.0)
+        self.cap.release()
+
+
+class LatencyMeter:
+    """Capture → decision latency (ms): add(capture_ts) when the frame's decision is made."""
+    def __init__(self, bounds=LATENCY_BOUNDS_MS, clock=time.time):
+        self.hist = Histogram(bounds)
+        self.clock = clock
+        self.last_ms = 0.0
+    def add(self, capture_ts, now=None):
+        now = self.clock() if now is None else now
+        self.last_ms = (now - capture_ts) * 1000.0
+        self.hist.add(self.last_ms)
+        return self.last_ms
+    def line(self):
+        h = self.hist
+        return (f"⏱ Capture→decision: mean {h.total / max(1, h.n):.1f} ms, p50 ≤{h.quantile(0.5):g} "
+                f"p95 ≤{h.quantile(0.95):g} p99 ≤{h.quantile(0.99):g} ms over {h.n} frames")
+
+
+# ============================= CLI ============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Camera settings + latency check")
+    ap.add_argument("--index", type=int, default=0)
+    ap.add_argument("--size", default="1280x720")
+    ap.add_argument("--fps", type=float, default=30)
+    ap.add_argument("--fourcc", default="MJPG")
+    ap.add_argument("--gray", action="store_true")
+    ap.add_argument("--unthreaded", action="store_true", help="compare: grab + decode inline in read()")
+    ap.add_argument("--work-ms", type=float, default=40.0, help="simulated per-frame processing time")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    args = ap.parse_args()
+
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    cam = Camera(args.index, (w, h), args.fps, args.fourcc or None, threaded=not args.unthreaded, gray=args.gray)
+    if not cam.isOpened(): raise SystemExit("❌ Could not open camera.")
+    lat = LatencyMeter(); t_end = time.time() + args.seconds
+    while time.time() < t_end:
+        ok, frame = cam.read()
+        if not ok: break
+        time.sleep(args.work_ms / 1000.0)                 # stand-in for FaceMesh + fusion
+        lat.add(cam.last_ts)
+    print(lat.line())
+    print(cam.stats())
+    cam.release()
@@ -0,0 +1,137 @@
+"""
+CNN scheduling — decimated / asynchronous fatigue CNN scoring
+-------------------------------------------------------------
+The CNN fatigue probability moves on a timescale of seconds, so scoring every
+frame wastes most of the per-frame budget. CNNScheduler decides *when* a frame
+is worth scoring and runs predict_model on a background worker; the frame loop
+only ever reads the latest (prob, ts) pair and never waits for inference.
+
+Policies:
+  every_n  : score every `every_n`-th offered frame
+  hz       : score at a fixed rate of `hz` inferences per second
+  adaptive : between min_hz and max_hz, faster while visual fatigue / PERCLOS
+             are changing quickly, slower while they are steady
+
+staleness_weight() lets FusionEngine fade the CNN term out as its last result ages.
+
+sync=True runs the selected frames inline instead of on the worker, which
+keeps offline replay deterministic (same frames scored, same results).
+"""
+
+import threading, time
+from pipeline import LatestQueue
+
+POLICIES = ("every_n", "hz", "adaptive")
+
+
+def staleness_weight(age_s, half_life_s=3.0, grace_s=1.0):
+    """1.0 while the CNN result is fresh (≤ grace_s), then halves every half_life_s."""
+    if age_s is None: return 0.0
+    return 0.5 ** (max(0.0, age_s - grace_s) / max(1e-3, half_life_s))
+
+
+class CNNScheduler:
+    """
+    Offer frames with offer(); the scheduler scores the ones its policy selects
+    on a worker thread. latest() returns (prob, ts) where ts is the timestamp of
+    the frame that was scored (None until the first result).
+    """
+    def __init__(self, predict_fn, policy="adaptive", every_n=10, hz=2.0,
+                 min_hz=0.5, max_hz=5.0, rate_ref=0.5, prep=None, sync=False):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown CNN policy {policy!r} (expected one of {POLICIES})")
+        self.predict_fn = predict_fn
+        self.policy = policy
+        self.every_n = max(1, int(every_n))
+        self.hz = hz
+        self.min_hz, self.max_hz = min_hz, max_hz
+        self.rate_ref = rate_ref            # |Δfatigue|+|ΔPERCLOS| per second that maps to max_hz
+        self.prep = prep or (lambda f: f.copy())
+        self.sync = sync
+        self.base = (self.every_n, hz, min_hz, max_hz)
+        self.q = LatestQueue(1)
+        self.result = (None, None)          # (prob, ts) swapped atomically
+        self.busy = False
+        self.runs = 0
+        self.offered = 0
+        self._last_submit = None
+        self._prev = None                   # (t, fatigue, perclos)
+        self._rate = 0.0                    # EMA of signal change per second
+        self._stop = False
+        self.worker = threading.Thread(target=self._run, daemon=True, name="vg-cnn-sched")
+
+    def start(self):
+        if not self.sync: self.worker.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self.q.close()
+
+    def scale(self, k):
+        """Run at k × the configured rate (quality governor); k=1 restores it."""
+        k = max(1e-3, k)
+        every_n, hz, min_hz, max_hz = self.base
+        self.every_n = max(1, int(round(every_n / k)))
+        self.hz, self.min_hz, self.max_hz = hz * k, min_hz * k, max_hz * k
+
+    # ------------------------- policy -------------------------
+    def target_hz(self):
+        if self.policy == "hz": return self.hz
+        k = min(1.0, self._rate / max(1e-6, self.rate_ref))
+        return self.min_hz + (self.max_hz - self.min_hz) * k
+
+    def _observe(self, now, fatigue, perclos):
+        if fatigue is None or perclos is None: return
+        if self._prev is not None:
+            dt = now - self._prev[0]
+            if dt > 1e-3:
+                r = (abs(fatigue - self._prev[1]) + abs(perclos - self._prev[2])) / dt
+                self._rate = 0.9 * self._rate + 0.1 * r
+        self._prev = (now, fatigue, perclos)
+
+    def due(self, now):
+        if self.policy == "every_n":
+            return (self.offered - 1) % self.every_n == 0
+        if self._last_submit is None: return True
+        return (now - self._last_submit) >= 1.0 / max(1e-3, self.target_hz())
+
+    def offer(self, frame, now=None, fatigue=None, perclos=None):
+        """Called once per frame; returns True when the frame was handed to the worker."""
+        now = time.time() if now is None else now
+        self.offered += 1
+        self._observe(now, fatigue, perclos)
+        if not self.due(now) or (self.busy and self.policy != "every_n"):
+            return False
+        self._last_submit = now
+        if self.sync:
+            self._score(now, self.prep(frame))
+        else:
+            self.q.put((now, self.prep(frame)))
+        return True
+
+    def latest(self):
+        return self.result
+
+    def age(self, now=None):
+        ts = self.result[1]
+        if ts is None: return None
+        return (time.time() if now is None else now) - ts
+
+    # ------------------------- worker -------------------------
+    def _run(self):
+        while not self._stop:
+            item = self.q.get(timeout=0.5)
+            if item is None: continue
+            self._score(*item)
+
+    def _score(self, ts, img):
+        self.busy = True
+        try:
+            prob = self.predict_fn(img)
+            if prob is None: return             # no face / model not ready: keep the last real result
+            self.result = (prob, ts); self.runs += 1
+        except Exception as e:
+            print("[CNN Scheduler Error]", e)
+        finally:
+            self.busy = False
@@ -0,0 +1,343 @@
+"""
+Fleet server — many live driver sessions in one process
+-------------------------------------------------------
+app.main() is one camera per process with module-level singletons (model,
+tts_worker, log_sink). For a depot box FleetServer hosts N sessions side by
+side, each with its own app.DriverSession (VisionModule + FaceMesh, FusionEngine,
+DWI trigger, session stats) and its own SessionLogger / summary files, while
+the expensive parts are shared:
+
+  CNN       one infer_server.BatchInferenceServer; every session's
+            CNNScheduler submits to it, so crops from all streams share
+            micro-batched forward passes
+  workers   one thread pool runs session steps (FaceMesh / OpenCV release
+            the GIL); a session never has more than one step in flight, and
+            the dispatcher always hands it the newest frame
+  budgets   each session owns `cpu_budget` cores (0.25 → 250 ms of step time
+            per second) as a token bucket charged with the measured wall time
+            of its steps (FaceMesh runs on its own graph threads, which
+            per-thread CPU clocks would miss). A session that has spent its
+            budget skips frames instead of starving its neighbours.
+  admission add() refuses a session when max_sessions is reached or the
+            committed budgets would exceed cpu_capacity (cores × max_util).
+
+Sources: a camera index, an rtsp:// / http:// URL (capture.Camera), or a
+video file / image directory played back in real time like a live stream.
+
+Per-session stats (fps, frames skipped for budget, step p50 / p95 ms,
+capture→decision latency, alerts, last DWI) are printed every report_s and
+served as JSON on --port (GET /sessions; POST /sessions?id=&source=[&budget=]
+to add one, DELETE /sessions/<id> to stop one).
+
+    python fleet_server.py --source cab1=0 --source cab2=rtsp://10.0.0.7/s1 \\
+                           --source yard=trips/a.mp4 --cpu-budget 0.5 --port 9120
+"""
+
+import os, json, time, random, argparse, functools, threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from infer_server import BatchInferenceServer, Histogram
+from cnn_sched import CNNScheduler
+from session_log import SessionLogger
+from capture import Camera, LatencyMeter
+
+STEP_BOUNDS_MS = [2, 5, 10, 15, 20, 25, 33, 40, 50, 66, 100, 150, 250, 500]
+
+
+class AdmissionError(RuntimeError):
+    pass
+
+
+# =========================== SOURCES ==========================
+class FileStream:
+    """
+    Video file / image directory played in real time on its own thread,
+    newest frame only — behaves like a live camera (read(), last_ts, ended).
+    """
+    def __init__(self, path, fps=None, loop=False):
+        self.path, self.fps, self.loop = path, fps, loop
+        self.cv = threading.Condition()
+        self.frame = None; self.ts = None; self.seq = 0
+        self.last_seq = 0; self.last_ts = None
+        self.ended = False; self._stop = False
+        self.grabbed = 0; self.skipped = 0
+        threading.Thread(target=self._play, daemon=True, name="vg-file").start()
+
+    def _play(self):
+        from replay import open_source
+        while not self._stop:
+            t0 = time.time()
+            for ts, frame in open_source(self.path, self.fps):
+                if self._stop: break
+                wait = t0 + ts - time.time()
+                if wait > 0: time.sleep(wait)
+                with self.cv:
+                    if self.seq > self.last_seq: self.skipped += 1
+                    self.frame, self.ts = frame, time.time(); self.seq += 1; self.grabbed += 1
+                    self.cv.notify_all()
+            if not self.loop: break
+        with self.cv:
+            self.ended = True; self.cv.notify_all()
+
+    def read(self, timeout=5.0):
+        with self.cv:
+            if not self.cv.wait_for(lambda: self.seq > self.last_seq or self.ended, timeout) or \
+                    self.seq <= self.last_seq:
+                return False, None
+            self.last_seq, self.last_ts = self.seq, self.ts
+            return True, self.frame
+
+    def isOpened(self): return not self.ended
+    def release(self): self._stop = True
+
+
+def open_stream(spec, loop=False):
+    """"0" → camera 0; "rtsp://..." → network stream; anything else → file / image dir."""
+    if spec.isdigit(): return Camera(int(spec))
+    if "://" in spec: return Camera(spec, size=None, fps=None, fourcc=None)
+    if not os.path.exists(spec): raise FileNotFoundError(f"❌ No such source {spec}")
+    return FileStream(spec, loop=loop)
+
+
+# =========================== SESSION ==========================
+class FleetSession:
+    """One driver: stream, DriverSession, CNN scheduler, log, budget and stats."""
+    def __init__(self, sid, source, infer, out_dir, cpu_budget, burst_s=0.25, seed=0, loop=False):
+        import app
+        self.id = sid
+        self.spec = source
+        self.stream = open_stream(source, loop)
+        if not self.stream.isOpened(): raise RuntimeError(f"❌ Could not open source {source}")
+        self.log_path = os.path.join(out_dir, f"{sid}.csv")
+        self.summary_path = os.path.join(out_dir, f"{sid}_summary.csv")
+        self.logger = SessionLogger(self.log_path, app.LOG_HEADER); self.logger.start()
+        self.session = app.DriverSession(logger=self.logger, rng=random.Random(seed))
+        self.session.vision.draw_landmarks = False            # no display on a depot box
+        vision = self.session.vision
+        self.sched = CNNScheduler(functools.partial(infer.predict, sid), policy=app.CNN_POLICY,
+                                  every_n=app.CNN_EVERY_N, hz=app.CNN_HZ, prep=vision.face_crop).start()
+        self.cpu_budget = cpu_budget
+        self.burst_s = burst_s
+        self.tokens = burst_s
+        self.refill_t = time.time()
+        self.busy = False
+        self.closed = False
+        self.latency = LatencyMeter()
+        self.step_ms = Histogram(STEP_BOUNDS_MS)
+        self.started = time.time()
+        self.frames = 0; self.budget_skips = 0; self.alerts = 0; self.errors = 0
+        self.last = {}
+
+    def refill(self, now):
+        self.tokens = min(self.burst_s, self.tokens + (now - self.refill_t) * self.cpu_budget)
+        self.refill_t = now
+
+    def step(self, frame, ts):
+        """Runs on a pool worker; one at a time per session."""
+        t0 = time.perf_counter()
+        try:
+            vision = self.session.vision
+            self.sched.offer(frame, ts, vision.fatigue, self.session.pcl)
+            prob, cnn_ts = self.sched.latest()
+            m, _ = self.session.process(frame, prob, None if cnn_ts is None else max(0.0, ts - cnn_ts))
+            self.latency.add(ts)
+            if m["alert"] is not None:
+                self.alerts += 1
+                print(f"🚨 [{self.id}] {m['alert'][0]} | {m['alert'][1]}")
+            self.last = {"fatigue": round(m["fatigue"], 3), "dwi": round(m["dwi"], 3), "action": m["action"]}
+            self.frames += 1
+        except Exception as e:
+            self.errors += 1; print(f"[Fleet {self.id} Error]", e)
+        finally:
+            cost = time.perf_counter() - t0
+            self.step_ms.add(cost * 1000.0)
+            self.tokens -= cost
+            self.busy = False
+
+    def stats(self):
+        el = max(1e-6, time.time() - self.started); h = self.latency.hist
+        return {"id": self.id, "source": self.spec, "cpu_budget": self.cpu_budget, "fps": self.frames / el,
+                "frames": self.frames, "budget_skips": self.budget_skips,
+                "stream_skipped": getattr(self.stream, "skipped", 0), "errors": self.errors,
+                "step_p50_ms": self.step_ms.quantile(0.5), "step_p95_ms": self.step_ms.quantile(0.95),
+                "latency_p95_ms": h.quantile(0.95), "cnn_runs": self.sched.runs, "alerts": self.alerts,
+                **self.last}
+
+    def close(self):
+        import app
+        self.closed = True
+        self.stream.release(); self.sched.stop()
+        self.logger.close()
+        app.write_summary(self.session.summary(), self.summary_path)
+        try: self.session.vision.mesh.close()
+        except Exception: pass
+
+
+# ============================ SERVER ==========================
+class FleetServer:
+    def __init__(self, max_sessions=8, cpu_capacity=None, max_util=0.85, workers=None, out_dir="fleet_logs",
+                 max_batch=8, max_wait_ms=15.0, report_s=10.0, loop=False):
+        import app
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.max_sessions = max_sessions
+        self.cpu_capacity = (cpu_capacity or os.cpu_count() or 1) * max_util
+        self.report_s = report_s
+        self.loop = loop
+        model, is_tflite = app.load_model()
+        self.infer = BatchInferenceServer(model, is_tflite, max_batch, max_wait_ms).start()
+        self.pool = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4, thread_name_prefix="vg-fleet")
+        self.sessions = {}
+        self.reserved = {}                  # id → cores, admitted sessions incl. ones still opening
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self._stop = threading.Event()
+        self._httpd = None
+        self.dispatcher = threading.Thread(target=self._dispatch, daemon=True, name="vg-fleet-dispatch")
+
+    def start(self):
+        self.dispatcher.start(); return self
+
+    # ------------------------ admission -----------------------
+    def committed(self): return sum(self.reserved.values())
+
+    def add(self, sid, source, cpu_budget=0.5, seed=None):
+        # Only the admission check and the reservation hold the lock: opening the
+        # source (an RTSP connect can take seconds) must not stall the dispatcher
+        with self.lock:
+            if sid in self.reserved: raise AdmissionError(f"session {sid!r} already running")
+            if len(self.reserved) >= self.max_sessions:
+                self.rejected += 1; raise AdmissionError(f"max_sessions={self.max_sessions} reached")
+            if self.committed() + cpu_budget > self.cpu_capacity + 1e-9:
+                self.rejected += 1
+                raise AdmissionError(f"CPU budget {cpu_budget:.2f} exceeds free capacity "
+                                     f"{self.cpu_capacity - self.committed():.2f} cores")
+            self.reserved[sid] = cpu_budget
+            n = len(self.reserved) - 1
+        try:
+            s = FleetSession(sid, source, self.infer, self.out_dir, cpu_budget,
+                             seed=n if seed is None else seed, loop=self.loop)
+        except BaseException:
+            with self.lock: self.reserved.pop(sid, None)
+            raise
+        with self.lock: self.sessions[sid] = s
+        print(f"✅ Session {sid} ← {source} ({cpu_budget:.2f} cores; {self.committed():.2f}/{self.cpu_capacity:.2f} committed)")
+        return s
+
+    def remove(self, sid):
+        with self.lock: s = self.sessions.pop(sid, None)
+        if s is None: return False
+        s.closed = True
+        while s.busy: time.sleep(0.01)
+        s.close(); print(f"🛑 Session {sid} closed → {s.summary_path}")
+        with self.lock: self.reserved.pop(sid, None)
+        return True
+
+    # ------------------------ dispatch ------------------------
+    def _dispatch(self):
+        last_report = time.time()
+        while not self._stop.is_set():
+            sent = 0; now = time.time()
+            with self.lock: sessions = list(self.sessions.values())
+            for s in sessions:
+                if s.busy or s.closed: continue
+                ok, frame = s.stream.read(timeout=0)        # newest frame, never a queued one
+                if not ok:
+                    if not s.stream.isOpened():
+                        s.closed = True             # one remover thread; skipped from now on
+                        threading.Thread(target=self.remove, args=(s.id,), daemon=True).start()
+                    continue
+                s.refill(now)
+                if s.tokens < 0: s.budget_skips += 1; continue
+                s.busy = True
+                self.pool.submit(s.step, frame, s.stream.last_ts); sent += 1
+            if now - last_report >= self.report_s:
+                last_report = now; self.report()
+            if not sent: time.sleep(0.002)
+
+    # -------------------------- stats -------------------------
+    def stats(self):
+        with self.lock: sessions = list(self.sessions.values())
+        return {"sessions": [s.stats() for s in sessions], "committed_cores": self.committed(),
+                "capacity_cores": self.cpu_capacity, "rejected": self.rejected, "infer": self.infer.stats()}
+
+    def report(self):
+        st = self.stats()
+        for s in st["sessions"]:
+            print(f"[{s['id']}] {s['fps']:.1f} fps | budget skips {s['budget_skips']} | step p50/p95 "
+                  f"{s['step_p50_ms']:g}/{s['step_p95_ms']:g} ms | cap→dec p95 {s['latency_p95_ms']:g} ms | "
+                  f"DWI {s.get('dwi', 0.0):.2f} | alerts {s['alerts']}")
+        self.infer.report()
+
+    def serve(self, port, host="127.0.0.1"):
+        fleet = self
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code, body):
+                data = json.dumps(body, default=str).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers(); self.wfile.write(data)
+            def do_GET(self):
+                if self.path.startswith("/sessions"): self._send(200, fleet.stats())
+                else: self.send_error(404)
+            def do_POST(self):
+                u = urlparse(self.path); q = {k: v[0] for k, v in parse_qs(u.query).items()}
+                if u.path != "/sessions" or "id" not in q or "source" not in q: return self.send_error(400)
+                try: fleet.add(q["id"], q["source"], float(q.get("budget", 0.5)))
+                except AdmissionError as e: return self._send(409, {"error": str(e)})
+                except Exception as e: return self._send(400, {"error": str(e)})
+                self._send(200, {"ok": True, "id": q["id"]})
+            def do_DELETE(self):
+                sid = urlparse(self.path).path.rsplit("/", 1)[-1]
+                self._send(200 if fleet.remove(sid) else 404, {"id": sid})
+            def log_message(self, *a): pass
+        try:
+            self._httpd = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print("⚠️ Fleet endpoint disabled:", e); return None
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="vg-fleet-http").start()
+        print(f"✅ Fleet stats at http://{host}:{port}/sessions")
+        return self._httpd
+
+    def stop(self):
+        self._stop.set(); self.dispatcher.join(timeout=2.0)
+        for sid in list(self.sessions): self.remove(sid)
+        self.pool.shutdown(wait=True)
+        self.infer.stop()
+        if self._httpd is not None: self._httpd.shutdown()
+
+
+# ============================ BOOT ============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Host many driver sessions in one process")
+    ap.add_argument("--source", action="append", default=[], help="id=camera-index|url|file (repeatable)")
+    ap.add_argument("--max-sessions", type=int, default=8)
+    ap.add_argument("--cpu-budget", type=float, default=0.5, help="cores per session")
+    ap.add_argument("--capacity", type=float, help="cores available (default: os.cpu_count())")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--out", default="fleet_logs")
+    ap.add_argument("--max-batch", type=int, default=8)
+    ap.add_argument("--max-wait-ms", type=float, default=15.0)
+    ap.add_argument("--report-s", type=float, default=10.0)
+    ap.add_argument("--loop", action="store_true", help="loop file sources (soak tests)")
+    ap.add_argument("--port", type=int, help="JSON stats / control endpoint")
+    args = ap.parse_args()
+
+    fleet = FleetServer(args.max_sessions, args.capacity, workers=args.workers, out_dir=args.out,
+                        max_batch=args.max_batch, max_wait_ms=args.max_wait_ms, report_s=args.report_s,
+                        loop=args.loop).start()
+    for spec in args.source:
+        sid, _, src = spec.partition("=")
+        try: fleet.add(sid, src, args.cpu_budget)
+        except (AdmissionError, RuntimeError, FileNotFoundError) as e: print(f"⚠️ {sid}: {e}")
+    if args.port: fleet.serve(args.port)
+    try:
+        while fleet.sessions or args.port: time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    fleet.report(); fleet.stop()
+    print("🛑 Fleet stopped.")
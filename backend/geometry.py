@@ -0,0 +1,132 @@
+"""
+Landmark geometry — vectorized per-frame face features
+------------------------------------------------------
+VisionModule used to build one small np.array per landmark per feature
+(_ear, _head_motion, _mar, _pitch_angle, _gaze_direction), i.e. dozens of
+Python-level allocations per frame. Here only the landmarks the features
+use (21 points, plus the 2 iris centres with refine_landmarks) are read out
+of the MediaPipe list, once per frame, into a single small float32 array,
+and every feature comes out of a handful of vectorized ops on it. Converting
+all 478 protobuf landmarks in Python cost more than the vectorized math
+saved.
+
+Shared by app.py and app2.py.
+
+Microbenchmark (old per-landmark path vs this module, synthetic landmarks):
+    python geometry.py [--frames 5000]
+"""
+
+import math
+from collections import namedtuple
+import numpy as np
+
+LEFT_EYE  = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+HEAD_POINTS = [1, 33, 263]
+MOUTH = [13, 14, 78, 308]        # top, bottom, left corner, right corner
+PITCH = [10, 152]                # forehead, chin
+EYE_CORNERS = [33, 263]
+IRIS = [468, 473]                # only present with refine_landmarks=True
+
+# The only landmarks read per frame; the index lists below address rows of landmarks_array()
+_IDX = LEFT_EYE + RIGHT_EYE + HEAD_POINTS + MOUTH + PITCH
+# Every distance in one gather: EAR pairs (p2,p6), (p3,p5), (p1,p4) for each
+# eye, then mouth top–bottom and left–right corners
+_DIST_A = np.array([1, 2, 0, 7, 8, 6, 15, 17], np.intp)
+_DIST_B = np.array([5, 4, 3, 11, 10, 9, 16, 18], np.intp)
+# Head points, forehead / chin, eye corners 33 / 263 (iris centres are rows 21, 22)
+_SCALARS = [12, 13, 14, 19, 20, 0, 9]
+
+Geometry = namedtuple("Geometry", "ear_l ear_r mar head pitch gaze")
+
+
+def landmarks_array(lm):
+    """
+    MediaPipe landmark list → (23, 2) float32 array of normalized x, y for _IDX
+    then IRIS ((21, 2) when the mesh has no iris points).
+    """
+    idx = _IDX + IRIS if len(lm) > IRIS[1] else _IDX
+    pts = [lm[i] for i in idx]
+    return np.array([(p.x, p.y) for p in pts], np.float32)
+
+
+def compute(pts, w, h):
+    """
+    All per-frame geometry from one landmark array.
+      ear_l / ear_r : eye aspect ratios (pixel space)
+      mar           : mouth aspect ratio (pixel space)
+      head          : (2,) pixel center of nose + eye corners
+      pitch         : forehead→chin angle in degrees (normalized space)
+      gaze          : |mean iris x − eye-corner center x| (normalized), 0 without iris
+    """
+    wh = np.array((w, h), np.float32)
+    v = (pts[_DIST_A] - pts[_DIST_B]) * wh
+    d = np.sqrt(np.einsum("ij,ij->i", v, v)).tolist()      # 8 pixel distances
+    ear_l = (d[0] + d[1]) / 2 / (d[2] + 1e-6)
+    ear_r = (d[3] + d[4]) / 2 / (d[5] + 1e-6)
+    mar = d[6] / (d[7] + 1e-6)
+
+    # head, pitch and gaze are a few scalars: plain floats beat numpy on 0-d values
+    p = pts[_SCALARS].tolist()
+    head = np.array(((p[0][0] + p[1][0] + p[2][0]) / 3 * w, (p[0][1] + p[1][1] + p[2][1]) / 3 * h))
+    (fx, fy), (cx, cy) = p[3], p[4]
+    pitch = math.degrees(math.atan2(cy - fy, cx - fx))
+
+    gaze = 0.0
+    if len(pts) > 21:
+        ix = pts[21:, 0].tolist()
+        gaze = abs((ix[0] + ix[1]) / 2.0 - (p[5][0] + p[6][0]) / 2.0)
+
+    return Geometry(ear_l, ear_r, mar, head, pitch, gaze)
+
+
+# ======================== MICROBENCHMARK ======================
+def _legacy(lm, w, h):
+    """The pre-vectorization per-landmark implementations, for timing and parity."""
+    def ear(idx):
+        def p(i): return np.array([lm[idx[i]].x*w, lm[idx[i]].y*h])
+        p1, p2, p3, p4, p5, p6 = [p(i) for i in range(6)]
+        return ((np.linalg.norm(p2-p6)+np.linalg.norm(p3-p5))/2) / (np.linalg.norm(p1-p4)+1e-6)
+    head = np.mean([np.array([lm[i].x*w, lm[i].y*h]) for i in HEAD_POINTS], axis=0)
+    top = np.array([lm[13].x*w, lm[13].y*h]); bottom = np.array([lm[14].x*w, lm[14].y*h])
+    left = np.array([lm[78].x*w, lm[78].y*h]); right = np.array([lm[308].x*w, lm[308].y*h])
+    mar = np.linalg.norm(top - bottom) / (np.linalg.norm(left - right) + 1e-6)
+    vec = np.array([lm[152].x, lm[152].y]) - np.array([lm[10].x, lm[10].y])
+    pitch = np.degrees(np.arctan2(vec[1], vec[0]))
+    gaze = abs(((lm[468].x + lm[473].x) / 2.0) - (lm[33].x + lm[263].x) / 2.0)
+    return Geometry(ear(LEFT_EYE), ear(RIGHT_EYE), mar, head, pitch, gaze)
+
+
+class _LM:
+    __slots__ = ("x", "y", "z")
+    def __init__(self, x, y, z): self.x, self.y, self.z = x, y, z
+
+
+def synthetic_landmarks(n=478, seed=0):
+    """Canned landmark set with MediaPipe's attribute layout (for benchmarks)."""
+    rng = np.random.default_rng(seed)
+    xyz = rng.uniform(0.3, 0.7, size=(n, 3))
+    return [_LM(float(x), float(y), float(z)) for x, y, z in xyz]
+
+
+if __name__ == "__main__":
+    import argparse, time
+    ap = argparse.ArgumentParser(description="Per-frame landmark feature microbenchmark")
+    ap.add_argument("--frames", type=int, default=5000)
+    args = ap.parse_args()
+    lm = synthetic_landmarks(); w, h = 1920, 1080
+
+    t0 = time.perf_counter()
+    for _ in range(args.frames): old = _legacy(lm, w, h)
+    t_old = (time.perf_counter() - t0) / args.frames
+
+    t0 = time.perf_counter()
+    for _ in range(args.frames): new = compute(landmarks_array(lm), w, h)
+    t_new = (time.perf_counter() - t0) / args.frames
+
+    err = max(abs(old.ear_l - new.ear_l), abs(old.ear_r - new.ear_r), abs(old.mar - new.mar),
+              float(np.abs(old.head - new.head).max()) / w, abs(old.pitch - new.pitch) / 360.0,
+              abs(old.gaze - new.gaze))
+    print(f"per-landmark : {t_old*1e6:8.1f} µs/frame")
+    print(f"vectorized   : {t_new*1e6:8.1f} µs/frame  (incl. landmark → array conversion)")
+    print(f"speed-up     : {t_old/t_new:8.2f}x   max rel. diff {err:.2e}")
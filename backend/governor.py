@@ -0,0 +1,128 @@
+"""
+Adaptive quality governor — hold a target FPS by trading quality for latency
+----------------------------------------------------------------------------
+On a thermally throttled car PC the frame loop used to just slow down. The
+governor watches the end-to-end frame interval (and capture→display latency)
+over a short time window and walks a ladder of quality levels:
+
+  level  capture   refine_landmarks  CNN rate  HUD
+  full   1280x720  yes               1.0x      full (landmarks + text + bar)
+  cnn    1280x720  yes               0.5x      full
+  res    960x540   yes               0.5x      basic (no landmark drawing)
+  mesh   640x360   no                0.25x     basic
+  min    640x360   no                0.25x     minimal (DWI bar + one line)
+
+It steps down as soon as the windowed FPS falls below target * down_margin
+(or latency exceeds the budget) and steps back up only after up_hold_s of
+headroom above target * up_margin. A step up that has to be undone soon
+after doubles the hold, so the governor settles rather than oscillating.
+
+The capture sizes above are for a 1280x720 camera; levels_for(size) scales
+the ladder to the configured capture size (app.CAMERA_SIZE), so the top
+level never overrides it.
+
+The governor only decides; the app applies a level through the callback
+passed as on_change(level) (see app.apply_quality).
+"""
+
+import time
+from collections import namedtuple
+from rolling import RollingStats
+
+QualityLevel = namedtuple("QualityLevel", "name capture refine_landmarks cnn_rate hud")
+
+LEVELS = [
+    QualityLevel("full", (1280, 720), True,  1.0,  "full"),
+    QualityLevel("cnn",  (1280, 720), True,  0.5,  "full"),
+    QualityLevel("res",  (960, 540),  True,  0.5,  "basic"),
+    QualityLevel("mesh", (640, 360),  False, 0.25, "basic"),
+    QualityLevel("min",  (640, 360),  False, 0.25, "minimal"),
+]
+
+
+def levels_for(size, levels=LEVELS):
+    """
+    LEVELS with capture sizes scaled so the top level is `size`; size None
+    (driver default) → capture None at every level, i.e. resolution is left alone.
+    """
+    top = levels[0].capture
+    def scaled(c):
+        if size is None: return None
+        return (int(size[0] * c[0] / top[0]) // 2 * 2, int(size[1] * c[1] / top[1]) // 2 * 2)
+    return [l._replace(capture=scaled(l.capture)) for l in levels]
+
+
+class FrameGovernor:
+    """
+    observe(frame_dt, latency, now) once per displayed frame; returns the new
+    QualityLevel when it changes (after calling on_change), else None.
+    """
+    def __init__(self, target_fps=20.0, levels=LEVELS, window_s=2.0, down_margin=0.9, up_margin=1.3,
+                 down_hold_s=2.0, up_hold_s=10.0, max_up_hold_s=120.0, latency_budget_s=None,
+                 on_change=None, clock=time.time, start=0):
+        self.target_fps = target_fps
+        self.levels = list(levels)
+        self.window_s = window_s
+        self.down_margin, self.up_margin = down_margin, up_margin
+        self.down_hold_s = down_hold_s
+        self.base_up_hold_s = self.up_hold_s = up_hold_s
+        self.max_up_hold_s = max_up_hold_s
+        self.latency_budget_s = latency_budget_s or 3.0 / target_fps
+        self.on_change = on_change
+        self.clock = clock
+        self.idx = max(0, min(start, len(self.levels) - 1))
+        self.dt = RollingStats(horizon=window_s)
+        self.lat = RollingStats(horizon=window_s)
+        self.changed_t = None
+        self.last_up_t = None
+        self.headroom_since = None
+        self.changes = 0
+
+    @property
+    def level(self): return self.levels[self.idx]
+
+    @property
+    def fps(self):
+        m = self.dt.mean
+        return 1.0 / m if m > 0 else 0.0
+
+    def observe(self, frame_dt, latency=None, now=None):
+        now = self.clock() if now is None else now
+        if self.changed_t is None: self.changed_t = now
+        if frame_dt > 0: self.dt.push(frame_dt, now)
+        if latency is not None: self.lat.push(latency, now)
+        # Judge a level only on a full window of frames produced at that level
+        if now - self.changed_t < max(self.window_s, self.down_hold_s) or self.dt.n < 5: return None
+        fps = self.fps
+        slow = fps < self.target_fps * self.down_margin or (self.lat.n and self.lat.mean > self.latency_budget_s)
+        if slow:
+            self.headroom_since = None
+            if self.idx + 1 < len(self.levels):
+                # Undoing a recent step up → wait longer before the next attempt
+                if self.last_up_t is not None and now - self.last_up_t < 2 * self.up_hold_s:
+                    self.up_hold_s = min(self.max_up_hold_s, self.up_hold_s * 2)
+                return self._set(self.idx + 1, now)
+            return None
+        if fps > self.target_fps * self.up_margin and self.idx > 0:
+            if self.headroom_since is None: self.headroom_since = now
+            if now - self.headroom_since >= self.up_hold_s:
+                self.last_up_t = now
+                return self._set(self.idx - 1, now)
+        else:
+            self.headroom_since = None
+            # A level that held for a long time earns back the short hold
+            if self.last_up_t is not None and now - self.last_up_t > self.max_up_hold_s:
+                self.up_hold_s = self.base_up_hold_s
+        return None
+
+    def _set(self, idx, now):
+        old = self.level
+        self.idx = idx; self.changed_t = now; self.headroom_since = None
+        self.dt.clear(); self.lat.clear()
+        self.changes += 1
+        lvl = self.level
+        print(f"⚙️ Quality {old.name} → {lvl.name} (target {self.target_fps:.0f} FPS)")
+        if self.on_change is not None:
+            try: self.on_change(lvl)
+            except Exception as e: print("[Governor Error]", e)
+        return lvl
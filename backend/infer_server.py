@@ -0,0 +1,264 @@
+"""
+Batched CNN inference server — many camera streams, one model
+-------------------------------------------------------------
+Each camera stream normally runs predict_model() at batch size 1. For
+multi-camera cabs and fleet-depot replay, BatchInferenceServer collects frames
+from many streams, micro-batches them (up to max_batch, or until the oldest
+request has waited max_wait_ms) and runs one forward pass per batch on the
+model returned by app.load_model() (Keras or TFLite).
+
+In-process:
+    server = BatchInferenceServer(model, is_tflite).start()
+    prob = server.predict("cab3-left", frame)                   # blocking
+    fut  = server.submit("cab3-left", frame)                    # Future
+    sched = CNNScheduler(functools.partial(server.predict, "cab3-left"))
+
+Over a Unix socket (one process owns the model, others connect):
+    python infer_server.py --socket /tmp/vg_infer.sock --max-batch 16
+    InferenceClient("/tmp/vg_infer.sock", "cab3-left").predict(frame)
+
+stats() reports batch-size and queue-wait histograms plus throughput.
+"""
+
+import os, time, threading, queue, struct, socket, socketserver, bisect, argparse
+from concurrent.futures import Future
+import numpy as np
+import cv2
+
+IMG_SIZE = 224
+
+
+# ========================= HISTOGRAM ==========================
+class Histogram:
+    """
+    Fixed-bucket histogram: bounds are bucket upper edges, the last bucket is +inf.
+    """
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.n = 0; self.total = 0.0
+    def add(self, v):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.n += 1; self.total += v
+    def quantile(self, q):
+        if self.n == 0: return 0.0
+        k = q * self.n; acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= k: return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+    def snapshot(self):
+        return {"le": self.bounds + ["inf"], "counts": list(self.counts), "n": self.n,
+                "mean": self.total / self.n if self.n else 0.0,
+                "p50": self.quantile(0.50), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+# ======================= BATCH SERVER =========================
+class _Request:
+    __slots__ = ("stream_id", "frame", "t_enq", "future")
+    def __init__(self, stream_id, frame):
+        self.stream_id = stream_id; self.frame = frame
+        self.t_enq = time.perf_counter(); self.future = Future()
+
+
+class BatchInferenceServer:
+    """
+    Micro-batching front end for the fatigue CNN.
+      max_batch   : largest batch handed to the model
+      max_wait_ms : latency deadline — a batch is flushed once its oldest request
+                    has waited this long, even if it is not full
+    """
+    def __init__(self, model, is_tflite, max_batch=8, max_wait_ms=10.0, img_size=IMG_SIZE):
+        self.model = model
+        self.is_tflite = is_tflite
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.img_size = img_size
+        self.q = queue.Queue()
+        # Preallocated batch tensors (uint8 resize target + float32 model input)
+        self.u8 = np.empty((self.max_batch, img_size, img_size, 3), np.uint8)
+        self.batch = np.empty((self.max_batch, img_size, img_size, 3), np.float32)
+        if is_tflite:
+            # Sized once at max_batch: micro-batch sizes vary with arrival timing, and
+            # re-allocating tensors per size change would eat the batching gain
+            self._in_idx = model.get_input_details()[0]["index"]
+            self._out_idx = model.get_output_details()[0]["index"]
+            model.resize_tensor_input(self._in_idx, [self.max_batch, img_size, img_size, 3])
+            model.allocate_tensors()
+        self.batch_hist = Histogram(range(1, self.max_batch + 1))
+        self.wait_hist = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100, 200])   # ms
+        self.infer_hist = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500])  # ms per batch
+        self.frames = 0
+        self.per_stream = {}
+        self.t_start = None
+        self._stop = False
+        self.worker = threading.Thread(target=self._run, daemon=True, name="vg-infer-batch")
+
+    def start(self):
+        self.t_start = time.time()
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self._stop = True
+        self.q.put(None)
+
+    def submit(self, stream_id, frame):
+        req = _Request(stream_id, frame)
+        self.q.put(req)
+        return req.future
+
+    def predict(self, stream_id, frame, timeout=5.0):
+        return self.submit(stream_id, frame).result(timeout=timeout)
+
+    # ------------------------- batching -----------------------
+    def _collect(self):
+        first = self.q.get()
+        if first is None: return []
+        reqs = [first]
+        deadline = first.t_enq + self.max_wait_s
+        while len(reqs) < self.max_batch:
+            left = deadline - time.perf_counter()
+            try:
+                r = self.q.get(timeout=left) if left > 0 else self.q.get_nowait()
+            except queue.Empty:
+                break
+            if r is None: self._stop = True; break
+            reqs.append(r)
+        return reqs
+
+    def _forward(self, n):
+        if self.is_tflite:
+            # Always the full max_batch tensor; rows past n are stale padding, sliced off below
+            self.model.set_tensor(self._in_idx, self.batch)
+            self.model.invoke()
+            out = self.model.get_tensor(self._out_idx)
+        else:
+            out = np.asarray(self.model(self.batch[:n], training=False))
+        return np.clip(out.reshape(len(out), -1)[:n, 0], 0.0, 1.0)
+
+    def _run(self):
+        while not self._stop:
+            reqs = self._collect()
+            if not reqs: continue
+            n = len(reqs)
+            t0 = time.perf_counter()
+            for i, r in enumerate(reqs):
+                self.wait_hist.add((t0 - r.t_enq) * 1000.0)
+                cv2.resize(r.frame, (self.img_size, self.img_size), dst=self.u8[i])
+            np.multiply(self.u8[:n], 1.0 / 255.0, out=self.batch[:n], casting="unsafe")
+            try:
+                probs = self._forward(n)
+            except Exception as e:
+                print("[Inference Server Error]", e)
+                for r in reqs: r.future.set_exception(e)
+                continue
+            self.infer_hist.add((time.perf_counter() - t0) * 1000.0)
+            self.batch_hist.add(n)
+            self.frames += n
+            for r, p in zip(reqs, probs):
+                self.per_stream[r.stream_id] = self.per_stream.get(r.stream_id, 0) + 1
+                r.future.set_result(float(p))
+
+    # ------------------------- stats --------------------------
+    def stats(self):
+        el = max(1e-6, time.time() - (self.t_start or time.time()))
+        return {
+            "frames": self.frames,
+            "frames_per_s": self.frames / el,
+            "queue_depth": self.q.qsize(),
+            "streams": dict(self.per_stream),
+            "batch_size": self.batch_hist.snapshot(),
+            "queue_wait_ms": self.wait_hist.snapshot(),
+            "batch_infer_ms": self.infer_hist.snapshot(),
+        }
+
+    def report(self):
+        s = self.stats()
+        print(f"[Infer] {s['frames']} frames | {s['frames_per_s']:.1f} f/s | "
+              f"batch avg {s['batch_size']['mean']:.1f} | wait p50/p95 "
+              f"{s['queue_wait_ms']['p50']}/{s['queue_wait_ms']['p95']} ms | q={s['queue_depth']}")
+
+
+# ======================== UNIX SOCKET =========================
+# request : !16sHHB  stream_id, height, width, channels  + h*w*c uint8 bytes
+# response: !f       probability (NaN on error)
+_REQ = struct.Struct("!16sHHB")
+_RESP = struct.Struct("!f")
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n); view = memoryview(buf); got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0: raise ConnectionError("socket closed")
+        got += k
+    return buf
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        srv = self.server.infer
+        while True:
+            try:
+                sid, h, w, c = _REQ.unpack(_recv_exact(self.request, _REQ.size))
+                frame = np.frombuffer(_recv_exact(self.request, h * w * c), np.uint8).reshape(h, w, c)
+            except ConnectionError:
+                return
+            try:
+                p = srv.predict(sid.rstrip(b"\0").decode(), frame)
+            except Exception as e:
+                print("[Inference Socket Error]", e); p = float("nan")
+            self.request.sendall(_RESP.pack(p))
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve_unix(server, path):
+    """Expose a running BatchInferenceServer on a Unix socket (blocks)."""
+    if os.path.exists(path): os.unlink(path)
+    with _UnixServer(path, _Handler) as us:
+        us.infer = server
+        print(f"✅ Inference server listening on {path}")
+        us.serve_forever()
+
+
+class InferenceClient:
+    """Blocking client for serve_unix(); one persistent connection per stream."""
+    def __init__(self, path, stream_id):
+        self.stream_id = stream_id.encode()[:16]
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+    def predict(self, frame):
+        frame = np.ascontiguousarray(frame, np.uint8)
+        h, w, c = frame.shape
+        self.sock.sendall(_REQ.pack(self.stream_id, h, w, c))
+        self.sock.sendall(memoryview(frame).cast("B"))
+        return _RESP.unpack(_recv_exact(self.sock, _RESP.size))[0]
+    def close(self): self.sock.close()
+
+
+# ============================ BOOT ============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Batched fatigue-CNN inference server")
+    ap.add_argument("--socket", default="/tmp/vg_infer.sock")
+    ap.add_argument("--max-batch", type=int, default=8)
+    ap.add_argument("--max-wait-ms", type=float, default=10.0)
+    ap.add_argument("--report-s", type=float, default=10.0, help="stats print interval (0 = off)")
+    args = ap.parse_args()
+
+    import app   # reuses app.load_model() and its model search paths
+    model, is_tflite = app.load_model()
+    srv = BatchInferenceServer(model, is_tflite, args.max_batch, args.max_wait_ms).start()
+    if args.report_s > 0:
+        def _report():
+            while True: time.sleep(args.report_s); srv.report()
+        threading.Thread(target=_report, daemon=True).start()
+    try:
+        serve_unix(srv, args.socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.stop(); srv.report()
@@ -0,0 +1,311 @@
+"""
+Inference backends — one interface for the fatigue CNN, picked by benchmark
+---------------------------------------------------------------------------
+load_model() only knew full Keras (.h5, driven through model.predict(),
+which builds a tf.data pipeline per call — painfully slow for one frame) and
+a default-configured TFLite interpreter. Every backend here takes a BGR face
+crop and returns the raw fatigue probability:
+
+  keras        direct model.__call__ inside a fixed-signature tf.function
+  tflite       TFLite interpreter, num_threads, XNNPACK on/off; float or
+               int8-quantized models (uint8/int8 I/O is (de)quantized here)
+  onnx         ONNX Runtime CPU execution provider, intra-op threads
+
+select_backend() builds every backend whose model file and runtime exist,
+warms each one up, times it on a few frames and checks parity against the
+reference (Keras when present) — then keeps the fastest one within the
+parity tolerance. The report is printed at startup.
+
+Model tooling:
+    python inference.py export model.h5 --tflite m.tflite --int8 m_int8.tflite \\
+                                         --onnx m.onnx --calib face_crops/
+    python inference.py bench                # backends from app.py config
+    python inference.py bench --keras m.h5 --tflite m_int8.tflite --onnx m.onnx --threads 2
+"""
+
+import os, abc, time, argparse
+import numpy as np
+import cv2
+
+from preprocess import Preprocessor
+
+IMG_SIZE = 224
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+# ========================== BACKENDS ==========================
+class Backend(abc.ABC):
+    """
+    predict(frame) → float probability; predict_batch(frames) → list of them
+    in one forward pass where the runtime allows it (multi-face mode).
+    """
+    name = "base"
+    def __init__(self, path): self.path = path
+    @abc.abstractmethod
+    def predict(self, frame): ...
+    def predict_batch(self, frames): return [self.predict(f) for f in frames]
+    def close(self): pass
+    def __repr__(self): return f"{self.name}({os.path.basename(self.path)})"
+
+
+class KerasBackend(Backend):
+    name = "keras"
+    def __init__(self, path, size=IMG_SIZE, threads=None):
+        super().__init__(path)
+        import tensorflow as tf
+        if threads:
+            try:
+                tf.config.threading.set_intra_op_parallelism_threads(threads)
+            except RuntimeError: pass          # runtime already initialised
+        self.model = tf.keras.models.load_model(path, compile=False)
+        self.model.trainable = False
+        self.prep = Preprocessor(size)
+        # Direct __call__ in a traced graph: no predict() data pipeline per frame
+        self.fn = tf.function(lambda x: self.model(x, training=False),
+                              input_signature=[tf.TensorSpec((None, size, size, 3), tf.float32)])
+    def predict(self, frame):
+        return float(np.asarray(self.fn(self.prep.fill(frame)))[0][0])
+    def predict_batch(self, frames):
+        if not frames: return []
+        return [float(v) for v in np.asarray(self.fn(self.prep.fill_batch(frames))).reshape(len(frames), -1)[:, 0]]
+
+
+def _tflite_interpreter(path, threads=None, xnnpack=True):
+    try:
+        from tflite_runtime.interpreter import Interpreter, OpResolverType   # slim runtime when installed
+    except ImportError:
+        import tensorflow as tf
+        Interpreter, OpResolverType = tf.lite.Interpreter, tf.lite.experimental.OpResolverType
+    # AUTO applies the default delegates (XNNPACK); the other one runs plain builtin kernels
+    resolver = OpResolverType.AUTO if xnnpack else OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+    it = Interpreter(model_path=path, num_threads=threads, experimental_op_resolver_type=resolver)
+    it.allocate_tensors()
+    return it
+
+
+class TFLiteBackend(Backend):
+    name = "tflite"
+    def __init__(self, path, size=IMG_SIZE, threads=None, xnnpack=True, in_place=True, max_batch=4):
+        super().__init__(path)
+        self.interp = it = _tflite_interpreter(path, threads, xnnpack)
+        self.max_batch = max_batch              # batches are padded to this, so the input shape stays fixed
+        self.threads, self.xnnpack = threads, xnnpack
+        din, dout = it.get_input_details()[0], it.get_output_details()[0]
+        self.in_idx, self.out_idx = din["index"], dout["index"]
+        self.size = size
+        self.n = 1                              # current input batch dimension
+        self.quantized = din["dtype"] != np.float32
+        if not self.quantized:
+            self.prep = Preprocessor(size, interpreter=it, use_interpreter_buffer=in_place)
+            return
+        # Integer I/O: pixel/255 → q = pixel / (255*scale) + zero_point, into preallocated buffers
+        self.name = "tflite_int8"
+        scale, zp = din["quantization"]
+        self.q_mul = np.float32(1.0 / (255.0 * scale)); self.q_zp = np.float32(zp)
+        info = np.iinfo(din["dtype"]); self.q_lo, self.q_hi = info.min, info.max
+        self.o_scale, self.o_zp = dout["quantization"]
+        self.dsize = (size, size)
+        self.u8 = np.empty((size, size, 3), np.uint8)
+        self.f32 = np.empty((size, size, 3), np.float32)
+        self.qin = np.empty((1, size, size, 3), din["dtype"])
+    def _resize(self, n):
+        # Re-allocating tensors is costly: only when switching between single and batched calls
+        if n == self.n: return
+        self.interp.resize_tensor_input(self.in_idx, [n, self.size, self.size, 3])
+        self.interp.allocate_tensors(); self.n = n
+    def predict_batch(self, frames):
+        if not frames: return []
+        if self.quantized: return [self.predict(f) for f in frames]
+        self._resize(self.max_batch)
+        it = self.interp; out = []
+        for i in range(0, len(frames), self.max_batch):
+            chunk = frames[i:i + self.max_batch]
+            it.set_tensor(self.in_idx, self.prep.fill_batch(chunk, pad_to=self.max_batch)); it.invoke()
+            out += [float(v) for v in it.get_tensor(self.out_idx).reshape(self.max_batch, -1)[:len(chunk), 0]]
+        return out
+    def predict(self, frame):
+        self._resize(1)
+        if not self.quantized: return self.prep.run_tflite(frame)
+        it = self.interp
+        cv2.resize(frame, self.dsize, dst=self.u8)
+        np.multiply(self.u8, self.q_mul, out=self.f32, dtype=np.float32)
+        self.f32 += self.q_zp
+        np.rint(self.f32, out=self.f32); np.clip(self.f32, self.q_lo, self.q_hi, out=self.f32)
+        self.qin[0] = self.f32
+        it.set_tensor(self.in_idx, self.qin); it.invoke()
+        out = float(it.get_tensor(self.out_idx)[0][0])
+        return (out - self.o_zp) * self.o_scale if self.o_scale else out
+    def __repr__(self):
+        return f"{self.name}({os.path.basename(self.path)}, threads={self.threads}, xnnpack={self.xnnpack})"
+
+
+class ONNXBackend(Backend):
+    name = "onnx"
+    def __init__(self, path, size=IMG_SIZE, threads=None):
+        super().__init__(path)
+        import onnxruntime as ort
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads: so.intra_op_num_threads = threads
+        self.sess = ort.InferenceSession(path, so, providers=["CPUExecutionProvider"])
+        self.in_name = self.sess.get_inputs()[0].name
+        self.out_names = [self.sess.get_outputs()[0].name]
+        self.prep = Preprocessor(size)
+        self.dynamic = not isinstance(self.sess.get_inputs()[0].shape[0], int)   # exported with batch None
+    def predict(self, frame):
+        out = self.sess.run(self.out_names, {self.in_name: self.prep.fill(frame)})[0]
+        return float(out.reshape(-1)[0])
+    def predict_batch(self, frames):
+        if not frames: return []
+        if not self.dynamic: return [self.predict(f) for f in frames]
+        out = self.sess.run(self.out_names, {self.in_name: self.prep.fill_batch(frames)})[0]
+        return [float(v) for v in out.reshape(len(frames), -1)[:, 0]]
+
+
+BACKENDS = {"keras": KerasBackend, "tflite": TFLiteBackend, "tflite_int8": TFLiteBackend, "onnx": ONNXBackend}
+
+
+# ========================= SELECTION ==========================
+def backend_specs(keras_paths=(), tflite_path=None, tflite_int8_path=None, onnx_path=None, threads=None,
+                  tflite_in_place=True):
+    """(kind, path, kwargs) for every model file that exists; Keras first (it is the reference)."""
+    specs = [("keras", p, {"threads": threads}) for p in keras_paths if p and os.path.exists(p)][:1]
+    if tflite_path and os.path.exists(tflite_path):
+        for xnn in (True, False):
+            specs.append(("tflite", tflite_path, {"threads": threads, "xnnpack": xnn, "in_place": tflite_in_place}))
+    if tflite_int8_path and os.path.exists(tflite_int8_path):
+        specs.append(("tflite_int8", tflite_int8_path, {"threads": threads}))
+    if onnx_path and os.path.exists(onnx_path):
+        specs.append(("onnx", onnx_path, {"threads": threads}))
+    return specs
+
+
+def sample_frames(n=8, size=IMG_SIZE, frames_dir=None, seed=0):
+    """Parity / benchmark inputs: images from frames_dir when given, else seeded synthetic crops."""
+    if frames_dir and os.path.isdir(frames_dir):
+        files = sorted(f for f in os.listdir(frames_dir) if f.lower().endswith(IMAGE_EXT))[:n]
+        imgs = [cv2.imread(os.path.join(frames_dir, f)) for f in files]
+        imgs = [im for im in imgs if im is not None]
+        if imgs: return imgs
+    rng = np.random.default_rng(seed)
+    base = np.linspace(30, 220, size, dtype=np.float32)[None, :, None]
+    return [np.clip(base + rng.normal(0, 25, (size, size, 3)), 0, 255).astype(np.uint8) for _ in range(n)]
+
+
+def benchmark(be, frames, iters=20):
+    """Warm up, then median latency in ms and the outputs on `frames`."""
+    outs = [be.predict(f) for f in frames]                  # warm-up + parity outputs
+    lat = []
+    for i in range(iters):
+        t0 = time.perf_counter(); be.predict(frames[i % len(frames)]); lat.append(time.perf_counter() - t0)
+    return float(np.median(lat) * 1000.0), outs
+
+
+def select_backend(specs, prefer="auto", parity_tol=0.05, frames=None, iters=20, quiet=False):
+    """
+    Build / time / parity-check the candidates; returns (backend, report rows).
+    prefer="auto" keeps the fastest backend within parity_tol of the reference;
+    a backend kind ("tflite", "onnx", ...) picks the first candidate of that kind.
+    """
+    if prefer != "auto":
+        specs = [s for s in specs if s[0] == prefer] or specs
+        if not quiet and specs[0][0] != prefer: print(f"⚠️ No {prefer} model available, using {specs[0][0]}")
+        specs = specs[:1]
+    frames = frames or sample_frames()
+    rows, built, ref = [], [], None
+    for kind, path, kw in specs:
+        row = {"backend": kind, "path": path, **kw}
+        try:
+            t0 = time.perf_counter()
+            be = BACKENDS[kind](path, **kw)
+            row["load_s"] = time.perf_counter() - t0
+            row["p50_ms"], outs = benchmark(be, frames, iters)
+        except Exception as e:
+            row["error"] = f"{type(e).__name__}: {e}"; rows.append(row); continue
+        if ref is None: ref = outs                              # first built one is the reference
+        row["parity"] = float(np.max(np.abs(np.subtract(outs, ref))))
+        row["ok"] = row["parity"] <= parity_tol
+        rows.append(row); built.append((row, be))
+    if not built:
+        raise FileNotFoundError("❌ No usable CNN backend: " + "; ".join(r.get("error", r["path"]) for r in rows))
+    ok = [(r, b) for r, b in built if r["ok"]] or built[:1]
+    row, best = min(ok, key=lambda rb: rb[0]["p50_ms"])
+    row["chosen"] = True
+    for r, b in built:
+        if b is not best: b.close()
+    if not quiet: print_report(rows, parity_tol)
+    return best, rows
+
+
+def print_report(rows, parity_tol=0.05):
+    print("---------------- CNN backends ----------------")
+    for r in rows:
+        desc = r["backend"] + ("" if "xnnpack" not in r else (" +xnnpack" if r["xnnpack"] else " -xnnpack"))
+        if "error" in r:
+            print(f"  {desc:<20} unavailable: {r['error']}"); continue
+        flag = "✅" if r.get("chosen") else ("  " if r["ok"] else "❌")
+        print(f"{flag} {desc:<20} {r['p50_ms']:7.2f} ms  parity Δ {r['parity']:.4f}"
+              f"{'' if r['ok'] else f' > {parity_tol}'}  ({os.path.basename(r['path'])})")
+
+
+# =========================== EXPORT ===========================
+def representative_frames(calib_dir, size=IMG_SIZE, limit=200):
+    """Calibration tensors for int8 quantization, preprocessed exactly like at runtime."""
+    prep = Preprocessor(size)
+    frames = sample_frames(limit, size, calib_dir)
+    if not (calib_dir and os.path.isdir(calib_dir)):
+        print("⚠️ No --calib dir: quantizing with synthetic frames (accuracy will suffer)")
+    def gen():
+        for f in frames: yield [prep.fill(f).copy()]
+    return gen
+
+
+def export(h5_path, tflite_path=None, int8_path=None, onnx_path=None, calib_dir=None, size=IMG_SIZE):
+    import tensorflow as tf
+    model = tf.keras.models.load_model(h5_path, compile=False)
+    if tflite_path:
+        conv = tf.lite.TFLiteConverter.from_keras_model(model)
+        with open(tflite_path, "wb") as f: f.write(conv.convert())
+        print("✅ TFLite (float32) →", tflite_path)
+    if int8_path:
+        conv = tf.lite.TFLiteConverter.from_keras_model(model)
+        conv.optimizations = [tf.lite.Optimize.DEFAULT]
+        conv.representative_dataset = representative_frames(calib_dir, size)
+        conv.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        conv.inference_input_type = tf.uint8        # feed camera pixels directly
+        conv.inference_output_type = tf.uint8
+        with open(int8_path, "wb") as f: f.write(conv.convert())
+        print("✅ TFLite (int8) →", int8_path)
+    if onnx_path:
+        try:
+            import tf2onnx
+        except ImportError:
+            print("⚠️ ONNX export disabled: pip install tf2onnx"); return
+        spec = [tf.TensorSpec((None, size, size, 3), tf.float32, name="input")]
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=onnx_path)
+        print("✅ ONNX →", onnx_path)
+
+
+# ============================ CLI =============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Fatigue CNN backends: export / quantize / benchmark")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    e = sub.add_parser("export"); e.add_argument("h5")
+    e.add_argument("--tflite"); e.add_argument("--int8"); e.add_argument("--onnx")
+    e.add_argument("--calib", help="dir of face-crop images for int8 calibration")
+    b = sub.add_parser("bench")
+    b.add_argument("--keras"); b.add_argument("--tflite"); b.add_argument("--int8"); b.add_argument("--onnx")
+    b.add_argument("--threads", type=int); b.add_argument("--frames", help="dir of sample crops for parity")
+    b.add_argument("--tol", type=float, default=0.05); b.add_argument("--iters", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.cmd == "export":
+        export(args.h5, args.tflite, args.int8, args.onnx, args.calib)
+    else:
+        if any((args.keras, args.tflite, args.int8, args.onnx)):
+            specs = backend_specs([args.keras], args.tflite, args.int8, args.onnx, args.threads)
+        else:
+            import app
+            specs = backend_specs(app.MODEL_PATHS, app.TFLITE_PATH, app.TFLITE_INT8_PATH, app.ONNX_PATH,
+                                  args.threads or app.INFER_THREADS)
+        select_backend(specs, "auto", args.tol, sample_frames(8, IMG_SIZE, args.frames), args.iters)
@@ -0,0 +1,274 @@
+"""
+Local LLM phrasing — persistent client + precomputed phrase cache
+-----------------------------------------------------------------
+LLMWorker used to fork `ollama run llama3` for every alert, paying process
+start-up and model load each time and often hitting its timeout, so the
+driver heard the raw context text seconds later. Alerts are now phrased
+from a cache and the model is only ever asked in the background:
+
+  OllamaClient  one keep-alive HTTP connection to the local model server
+                (POST /api/generate, stream=false, keep_alive so the model
+                stays resident); reconnects once on a dropped connection
+  PhraseCache   a few phrasings per (action, cause bucket) — 3 actions × 8
+                buckets. get() never waits: cached phrasing, else the canned
+                template. A refresher thread fills missing keys first
+                (requested ones ahead of the rest), then re-phrases the
+                oldest key every refresh_s so wording keeps varying. The
+                cache is saved to JSON, so a restart speaks LLM phrasings
+                from the first alert.
+
+Cause buckets come from DWITrigger: the sorted subset of {eyes, voice, load}
+above 0.55, or "overall".
+
+    python llm_client.py --stub            # bench against a local stand-in server
+    python llm_client.py --url http://127.0.0.1:11434 --fill
+"""
+
+import os, json, time, random, argparse, threading, http.client
+from urllib.parse import urlparse
+
+ACTIONS = ["beep_alert", "speak_break", "speak_breathing"]
+CAUSES = ["eyes", "voice", "load"]
+BUCKETS = ["overall", "eyes", "voice", "load", "eyes+voice", "eyes+load", "load+voice", "eyes+load+voice"]
+
+BASE = {"beep_alert": "Wake up and focus.",
+        "speak_break": "Take a short rest.",
+        "speak_breathing": "Let's breathe slowly."}
+CAUSE_TEXT = {"overall": "overall workload", "eyes": "eye fatigue", "voice": "voice stress", "load": "cognitive load"}
+
+
+def cause_bucket(tags):
+    """{"voice", "eyes"} → "eyes+voice"; empty → "overall"."""
+    return "+".join(sorted(tags)) if tags else "overall"
+
+
+def describe(bucket):
+    return ", ".join(CAUSE_TEXT[c] for c in bucket.split("+"))
+
+
+def fallback(action, bucket="overall"):
+    """Canned phrasing used until the cache has an LLM one."""
+    base = BASE.get(action, "Stay safe.")
+    return base if bucket == "overall" else f"{base} Signs of {describe(bucket)}."
+
+
+def prompt(action, bucket):
+    return (f"You are an in-car driver assistant. The driver shows {describe(bucket)}. "
+            f"Say one short, caring sentence (max 15 words) in the spirit of: \"{BASE.get(action, '')}\". "
+            f"Reply with the sentence only.")
+
+
+# =========================== CLIENT ===========================
+class OllamaClient:
+    """
+    generate(prompt) → text over one persistent HTTP/1.1 connection.
+    Not shared across threads without the lock it holds internally.
+    """
+    def __init__(self, url="http://127.0.0.1:11434", model="llama3", timeout=30.0, keep_alive="30m",
+                 max_tokens=40):
+        u = urlparse(url)
+        self.host, self.port = u.hostname or "127.0.0.1", u.port or 11434
+        self.model = model
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.max_tokens = max_tokens
+        self.conn = None
+        self.lock = threading.Lock()
+        self.calls = 0; self.errors = 0; self.total_s = 0.0
+
+    def _connect(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _post(self, body):
+        if self.conn is None: self._connect()
+        self.conn.request("POST", "/api/generate", body, {"Content-Type": "application/json"})
+        r = self.conn.getresponse(); data = r.read()       # read fully so the connection is reusable
+        if r.status != 200: raise RuntimeError(f"HTTP {r.status}: {data[:200]!r}")
+        return json.loads(data)
+
+    def generate(self, text):
+        body = json.dumps({"model": self.model, "prompt": text, "stream": False, "keep_alive": self.keep_alive,
+                           "options": {"num_predict": self.max_tokens}})
+        t0 = time.perf_counter()
+        with self.lock:
+            try:
+                try: out = self._post(body)
+                except (http.client.HTTPException, ConnectionError):
+                    self.close(); out = self._post(body)     # server closed the idle connection
+            except Exception:
+                self.errors += 1; self.close(); raise
+            finally:
+                self.calls += 1; self.total_s += time.perf_counter() - t0
+        return (out.get("response") or "").strip()
+
+    def close(self):
+        if self.conn is not None:
+            try: self.conn.close()
+            except Exception: pass
+            self.conn = None
+
+
+# ============================ CACHE ===========================
+def _clean(text):
+    """First line, quotes stripped, capped — the model sometimes adds preamble or a second option."""
+    line = next((l for l in text.splitlines() if l.strip()), "").strip().strip('"').strip()
+    return line[:160]
+
+
+class PhraseCache(threading.Thread):
+    """
+    get(action, bucket) → phrase, immediately. The thread keeps the cache
+    filled and fresh through `client` (None → canned phrases only).
+    """
+    def __init__(self, client=None, path=None, per_key=3, refresh_s=300.0, retry_s=30.0,
+                 actions=ACTIONS, buckets=BUCKETS, rng=None):
+        super().__init__(daemon=True, name="vg-phrases")
+        self.client = client
+        self.path = path
+        self.per_key = per_key
+        self.refresh_s = refresh_s
+        self.retry_s = retry_s
+        self.keys = [(a, b) for a in actions for b in buckets]
+        self.rng = rng or random.Random()
+        self.phrases = {}                 # (action, bucket) → [phrase, ...]
+        self.updated = {}                 # (action, bucket) → wall time of last refresh
+        self.wanted = []                  # keys asked for while still missing
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self._stop = False
+        self.hits = 0; self.misses = 0
+        if path: self.load(path)
+
+    # ------------------------- hot path -----------------------
+    def get(self, action, bucket="overall"):
+        key = (action, bucket)
+        with self.lock:
+            opts = self.phrases.get(key)
+            if opts:
+                self.hits += 1
+                return self.rng.choice(opts)
+            self.misses += 1
+            if key not in self.wanted: self.wanted.append(key)
+        self.wake.set()
+        return fallback(action, bucket)
+
+    # ------------------------- refresher ----------------------
+    def _next_key(self):
+        with self.lock:
+            if self.wanted: return self.wanted.pop(0)
+            missing = [k for k in self.keys if len(self.phrases.get(k, ())) < self.per_key]
+            if missing: return missing[0]
+            oldest = min(self.keys, key=lambda k: self.updated.get(k, 0.0))
+        return oldest if time.time() - self.updated.get(oldest, 0.0) >= self.refresh_s else None
+
+    def refresh(self, key):
+        """Ask the model for one phrasing of key; returns it (or None)."""
+        text = _clean(self.client.generate(prompt(*key)))
+        if not text: return None
+        with self.lock:
+            opts = self.phrases.setdefault(key, [])
+            if text not in opts: opts.append(text)
+            del opts[:-self.per_key]
+            self.updated[key] = time.time()
+        return text
+
+    def run(self):
+        if self.client is None: return
+        dirty = 0
+        while not self._stop:
+            key = self._next_key()
+            if key is None:
+                if dirty and self.path: self.save(self.path); dirty = 0
+                self.wake.wait(min(self.refresh_s, 60.0)); self.wake.clear(); continue
+            try:
+                if self.refresh(key): dirty += 1
+            except Exception as e:
+                print("[LLM cache]", e)
+                if dirty and self.path: self.save(self.path); dirty = 0
+                self.wake.wait(self.retry_s); self.wake.clear()
+            if dirty >= 10 and self.path: self.save(self.path); dirty = 0
+
+    def stop(self):
+        self._stop = True; self.wake.set()
+        if self.path: self.save(self.path)
+        if self.client is not None: self.client.close()
+
+    # ------------------------ persistence ---------------------
+    def load(self, path):
+        try:
+            with open(path) as f: doc = json.load(f)
+        except (OSError, ValueError): return
+        with self.lock:
+            for k, opts in doc.get("phrases", {}).items():
+                a, _, b = k.partition("|")
+                self.phrases[(a, b)] = list(opts)[-self.per_key:]
+                self.updated[(a, b)] = float(doc.get("updated", {}).get(k, 0.0))
+
+    def save(self, path):
+        with self.lock:
+            doc = {"phrases": {f"{a}|{b}": v for (a, b), v in self.phrases.items()},
+                   "updated": {f"{a}|{b}": t for (a, b), t in self.updated.items()}}
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f: json.dump(doc, f, indent=1)
+            os.replace(tmp, path)
+        except OSError as e: print("[LLM cache save Error]", e)
+
+    def stats(self):
+        with self.lock:
+            filled = sum(1 for k in self.keys if self.phrases.get(k))
+        c = self.client
+        return {"keys": len(self.keys), "filled": filled, "hits": self.hits, "misses": self.misses,
+                "llm_calls": c.calls if c else 0, "llm_errors": c.errors if c else 0,
+                "llm_mean_s": (c.total_s / c.calls) if c and c.calls else 0.0}
+
+
+# ======================= STAND-IN SERVER ======================
+def stub_server(port=0, delay_s=0.8):
+    """Local /api/generate stand-in (fixed delay, canned reply) for tests and benchmarks."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"                       # keep-alive, like ollama
+        def do_POST(self):
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            time.sleep(delay_s)
+            spirit = req.get("prompt", "").split('spirit of: "')[-1].split('"')[0]
+            data = json.dumps({"response": f"Hey, {spirit.lower()} You've got this.", "done": True}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers(); self.wfile.write(data)
+        def log_message(self, *a): pass
+    srv = ThreadingHTTPServer(("127.0.0.1", port), Handler); srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="LLM phrase cache: fill / bench")
+    ap.add_argument("--url", default="http://127.0.0.1:11434")
+    ap.add_argument("--model", default="llama3")
+    ap.add_argument("--cache", default=None, help="JSON cache path")
+    ap.add_argument("--stub", action="store_true", help="use a local stand-in server (0.8 s per reply)")
+    ap.add_argument("--fill", action="store_true", help="fill every key, then exit")
+    args = ap.parse_args()
+
+    if args.stub:
+        srv = stub_server(); args.url = f"http://127.0.0.1:{srv.server_address[1]}"
+    client = OllamaClient(args.url, args.model)
+    cache = PhraseCache(client, args.cache, per_key=1)
+
+    # Cold alert path: one generate() per alert (what the subprocess did, minus process start-up)
+    t0 = time.perf_counter(); first = client.generate(prompt("speak_break", "eyes")); cold = time.perf_counter() - t0
+    print(f"direct generate : {cold*1e3:8.1f} ms  → {_clean(first)!r}")
+
+    if args.fill or args.stub:
+        t0 = time.perf_counter()
+        for k in cache.keys: cache.refresh(k)
+        print(f"filled {len(cache.keys)} keys in {time.perf_counter() - t0:.1f} s")
+        if args.cache: cache.save(args.cache)
+    n = 10000; t0 = time.perf_counter()
+    for i in range(n): cache.get(ACTIONS[i % 3], BUCKETS[i % len(BUCKETS)])
+    print(f"cached get      : {(time.perf_counter() - t0)*1e6/n:8.2f} µs  → {cache.get('speak_break', 'eyes')!r}")
+    print(cache.stats())
+    client.close()
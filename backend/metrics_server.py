@@ -0,0 +1,331 @@
+"""
+Live metrics stream — local SSE / WebSocket server for the dashboard
+--------------------------------------------------------------------
+The backend exposed nothing but the OpenCV window and CSV files. MetricsHub
+serves the per-frame metrics dict (ear, PERCLOS, CNN, fatigue, CLI, VSI, DWI,
+fusion weights, action, alerts) from an asyncio loop on its own thread:
+
+  publish(m, fps)   the only call the frame loop makes: it swaps one
+                    reference (and appends to a small deque when an alert
+                    fired). No encoding, no locks, no socket I/O, no loop
+                    wake-up — the cost does not depend on the client count.
+  per client        each client runs at its own rate (?hz=, capped at
+                    max_hz) and, on each tick, takes the *newest* snapshot.
+                    A client whose socket buffer is still above
+                    `high_water` skips the tick (drop-to-latest, nothing
+                    queues up), and one that stays stuck for `stall_s` is
+                    disconnected. Alerts are never coalesced: every client
+                    gets each alert once.
+  deltas            after a full keyframe only changed fields are sent;
+                    a new keyframe every keyframe_s. Values are rounded so
+                    sensor noise below display precision is not "a change".
+  encoding          compact JSON; WebSocket clients may ask for ?fmt=msgpack
+                    (binary frames) when the msgpack package is installed.
+
+Endpoints (bound to 127.0.0.1 by default):
+  GET /events     Server-Sent Events      (EventSource in the browser)
+  GET /ws         WebSocket (RFC 6455, server → client; ping / close handled)
+  GET /snapshot   latest full snapshot as JSON
+  GET /stats      hub counters
+  GET /hud.jpg    latest HUD image in headless mode; polling it is what makes
+                  the app render one (hud_due), so no viewer → no rendering
+
+Messages: {"t":"full"|"delta","seq":N,"d":{...}} and {"t":"alert","seq":N,"action":...,"ctx":...}
+A delta carries changed keys; a key that went back to None (action, cnn_age)
+is sent as null and means "remove it".
+"""
+
+import json, time, base64, struct, asyncio, hashlib, threading
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import msgpack
+except Exception:
+    msgpack = None
+
+# Published fields → decimals kept (None: sent as is)
+FIELDS = {"time": 3, "fps": 1, "ear": 3, "ear_thresh": 3, "blink_per_min": 1, "perclos_30s": 3, "cnn": 3,
+          "cnn_age": 2, "fatigue": 3, "cli": 3, "vsi": 3, "dwi": 3, "hr": 0, "hrv": 0,
+          "w_visual": 3, "w_cnn": 3, "action": None}
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def compact(m, fps=None):
+    """Metrics dict → flat dict of plain, rounded values (numpy scalars converted)."""
+    out = {}
+    for k, nd in FIELDS.items():
+        v = fps if k == "fps" else m.get(k)
+        if v is None: continue
+        if nd is None: out[k] = v if isinstance(v, (str, int, bool)) else str(v)
+        else: out[k] = round(float(v), nd) if nd else int(round(float(v)))
+    return out
+
+
+def delta(prev, cur):
+    """Changed keys of cur, plus removed keys as None (null on the wire)."""
+    d = {k: v for k, v in cur.items() if prev.get(k) != v}
+    for k in prev.keys() - cur.keys(): d[k] = None
+    return d
+
+
+# ============================ FRAMING ==========================
+def ws_frame(payload, binary=False, opcode=None):
+    op = opcode if opcode is not None else (0x2 if binary else 0x1)
+    n = len(payload)
+    if n < 126: head = struct.pack("!BB", 0x80 | op, n)
+    elif n < 65536: head = struct.pack("!BBH", 0x80 | op, 126, n)
+    else: head = struct.pack("!BBQ", 0x80 | op, 127, n)
+    return head + payload
+
+
+async def ws_read_frame(reader):
+    """One client frame → (opcode, payload). Client frames are always masked."""
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126: n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127: n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if n > 1 << 16: raise ConnectionError("client frame too large")
+    mask = await reader.readexactly(4) if b1 & 0x80 else b"\0\0\0\0"
+    data = bytearray(await reader.readexactly(n))
+    for i in range(n): data[i] ^= mask[i & 3]
+    return b0 & 0x0F, bytes(data)
+
+
+class _Client:
+    __slots__ = ("kind", "writer", "hz", "binary", "sent", "last_full", "alert_seq", "stuck_since",
+                 "skipped", "msgs", "closed")
+    def __init__(self, kind, writer, hz, binary, alert_seq):
+        self.kind = kind; self.writer = writer; self.hz = hz; self.binary = binary
+        self.sent = {}; self.last_full = 0.0; self.alert_seq = alert_seq
+        self.stuck_since = None; self.skipped = 0; self.msgs = 0; self.closed = False
+
+
+# ============================== HUB ============================
+class MetricsHub:
+    def __init__(self, host="127.0.0.1", port=8765, max_hz=15.0, default_hz=5.0, keyframe_s=5.0,
+                 high_water=64 * 1024, stall_s=10.0, max_clients=32):
+        self.host, self.port = host, port
+        self.max_hz, self.default_hz = max_hz, default_hz
+        self.keyframe_s = keyframe_s
+        self.high_water = high_water
+        self.stall_s = stall_s
+        self.max_clients = max_clients
+        self.latest = None                  # (seq, metrics dict, fps) — replaced, never mutated
+        self.alerts = deque(maxlen=64)      # (seq, action, ctx)
+        self.seq = 0
+        self.clients = set()
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._cache = (None, None)          # (seq, compact dict) shared by all clients
+        self.hud_jpeg = None
+        self.hud_req_t = float("-inf")      # last /hud.jpg request (monotonic)
+        self.hud_set_t = float("-inf")
+        self.counts = {"published": 0, "connected": 0, "rejected": 0, "disconnected_slow": 0, "sent": 0,
+                       "skipped_slow": 0, "bytes": 0}
+
+    # ----------------------- frame-loop side ------------------
+    def publish(self, m, fps=None):
+        self.seq += 1
+        alert = m.get("alert")
+        if alert is not None: self.alerts.append((self.seq, alert[0], alert[1]))
+        self.latest = (self.seq, m, fps)
+        self.counts["published"] += 1
+
+    def hud_due(self, period_s, viewer_s=3.0):
+        """True when a viewer polled /hud.jpg within viewer_s and the image is older than period_s."""
+        now = time.monotonic()
+        return now - self.hud_req_t < viewer_s and now - self.hud_set_t >= period_s
+
+    def set_hud(self, jpeg):
+        self.hud_jpeg = jpeg; self.hud_set_t = time.monotonic()
+
+    # ------------------------- lifecycle ----------------------
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="vg-metrics")
+        self._thread.start()
+        self._ready.wait(5.0)
+        return self if self._server is not None else None
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port))
+            print(f"✅ Metrics stream at http://{self.host}:{self.port}/events (SSE) and ws://{self.host}:{self.port}/ws")
+        except OSError as e:
+            print("⚠️ Metrics stream disabled:", e); self._ready.set(); return
+        self._ready.set()
+        try: self.loop.run_forever()
+        finally:
+            self._server.close()
+            for c in list(self.clients): c.closed = True
+            tasks = asyncio.all_tasks(self.loop)
+            for t in tasks: t.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread is not None: self._thread.join(timeout=2.0)
+
+    def stats(self):
+        return {"clients": len(self.clients), "seq": self.seq, **self.counts,
+                "per_client": [{"kind": c.kind, "hz": c.hz, "msgs": c.msgs, "skipped": c.skipped}
+                               for c in list(self.clients)]}
+
+    # ------------------------- loop side ----------------------
+    def _snapshot(self):
+        latest = self.latest
+        if latest is None: return None, None
+        seq = latest[0]
+        if self._cache[0] != seq: self._cache = (seq, compact(latest[1], latest[2]))
+        return self._cache
+
+    def _encode(self, c, msg):
+        if c.binary and msgpack is not None: return msgpack.packb(msg, use_bin_type=True)
+        return json.dumps(msg, separators=(",", ":")).encode()
+
+    def _write(self, c, msg):
+        data = self._encode(c, msg)
+        if c.kind == "ws": c.writer.write(ws_frame(data, binary=c.binary and msgpack is not None))
+        else: c.writer.write(b"data: " + data + b"\n\n")
+        c.msgs += 1; self.counts["sent"] += 1; self.counts["bytes"] += len(data)
+
+    async def _pump(self, c):
+        """Per-client loop: at c.hz, send pending alerts + the newest snapshot (full or delta)."""
+        period = 1.0 / c.hz
+        last_seq = None
+        while not c.closed:
+            await asyncio.sleep(period)
+            tr = c.writer.transport
+            if tr.is_closing(): break
+            now = time.monotonic()
+            if tr.get_write_buffer_size() > self.high_water:
+                c.skipped += 1; self.counts["skipped_slow"] += 1      # drop-to-latest: skip, don't queue
+                if c.stuck_since is None: c.stuck_since = now
+                elif now - c.stuck_since > self.stall_s:
+                    self.counts["disconnected_slow"] += 1; break
+                continue
+            c.stuck_since = None
+            for seq, action, ctx in list(self.alerts):
+                if seq > c.alert_seq:
+                    self._write(c, {"t": "alert", "seq": seq, "action": action, "ctx": ctx}); c.alert_seq = seq
+            seq, snap = self._snapshot()
+            if snap is None or seq == last_seq: continue
+            last_seq = seq
+            if not c.sent or now - c.last_full >= self.keyframe_s:
+                self._write(c, {"t": "full", "seq": seq, "d": snap}); c.last_full = now
+            else:
+                d = delta(c.sent, snap)
+                if d: self._write(c, {"t": "delta", "seq": seq, "d": d})
+            c.sent = snap
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+        except Exception:
+            writer.close(); return
+        lines = head.decode("latin-1").split("\r\n")
+        try: method, target, _ = lines[0].split(" ", 2)
+        except ValueError: writer.close(); return
+        hdrs = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:] if l)}
+        url = urlparse(target); qs = parse_qs(url.query)
+        if method != "GET": return self._reply(writer, 405, b"")
+        if url.path == "/snapshot":
+            return self._reply(writer, 200, json.dumps(self._snapshot()[1] or {}).encode())
+        if url.path == "/stats":
+            return self._reply(writer, 200, json.dumps(self.stats()).encode())
+        if url.path == "/hud.jpg":
+            self.hud_req_t = time.monotonic()
+            if self.hud_jpeg is None: return self._reply(writer, 503, b"")   # first one is being rendered
+            return self._reply(writer, 200, self.hud_jpeg, "image/jpeg")
+        if url.path not in ("/events", "/ws"): return self._reply(writer, 404, b"")
+        if len(self.clients) >= self.max_clients:
+            self.counts["rejected"] += 1; return self._reply(writer, 503, b"")
+        try: hz = float(qs.get("hz", [self.default_hz])[0])
+        except ValueError: hz = self.default_hz
+        hz = min(self.max_hz, max(0.2, hz))
+        binary = qs.get("fmt", ["json"])[0] == "msgpack"
+        alert_seq = self.alerts[-1][0] if self.alerts else 0      # only alerts raised after connecting
+
+        if url.path == "/ws":
+            key = hdrs.get("sec-websocket-key")
+            if hdrs.get("upgrade", "").lower() != "websocket" or not key:
+                return self._reply(writer, 400, b"")
+            accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+            writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+            c = _Client("ws", writer, hz, binary, alert_seq)
+            ctl = asyncio.ensure_future(self._ws_control(reader, c))
+        else:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                         b"Connection: keep-alive\r\nAccess-Control-Allow-Origin: *\r\n\r\n"
+                         b"retry: 2000\n\n")
+            c = _Client("sse", writer, hz, False, alert_seq)
+            ctl = asyncio.ensure_future(self._sse_control(reader, c))
+        self.clients.add(c); self.counts["connected"] += 1
+        try:
+            await self._pump(c)
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass        # shutdown cancels us mid-sleep; swallow it so the server callback logs no traceback
+        finally:
+            c.closed = True; ctl.cancel(); self.clients.discard(c)
+            try: writer.close()
+            except Exception: pass
+
+    async def _ws_control(self, reader, c):
+        """Answer pings, honour close; anything else from the client is ignored."""
+        try:
+            while True:
+                op, data = await ws_read_frame(reader)
+                if op == 0x8:
+                    c.writer.write(ws_frame(data[:2], opcode=0x8)); break
+                if op == 0x9: c.writer.write(ws_frame(data, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        c.closed = True
+
+    async def _sse_control(self, reader, c):
+        """An EventSource never sends; EOF means the tab went away."""
+        try: await reader.read()
+        except (ConnectionError, OSError): pass
+        c.closed = True
+
+    def _reply(self, writer, status, body, ctype="application/json"):
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                  503: "Service Unavailable"}[status]
+        writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: {ctype}\r\n"
+                      f"Content-Length: {len(body)}\r\nAccess-Control-Allow-Origin: *\r\n"
+                      "Connection: close\r\n\r\n").encode() + body)
+        writer.close()
+
+
+# ============================ DEMO ============================
+if __name__ == "__main__":
+    import math, random, argparse
+    ap = argparse.ArgumentParser(description="Metrics stream with synthetic 30 FPS data")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    hub = MetricsHub(port=args.port).start()
+    if hub is None: raise SystemExit(1)
+    t0 = time.time(); k = 0; cost = 0.0
+    try:
+        while True:
+            t = time.time() - t0; f = 0.5 + 0.4 * math.sin(t / 10)
+            m = {"time": time.time(), "ear": 0.28 - 0.1 * f, "blink_per_min": 15 + 5 * f, "perclos_30s": f / 2,
+                 "cnn": f, "fatigue": f, "cli": 0.3, "vsi": 0.2, "dwi": f, "hr": 75, "hrv": 40,
+                 "w_visual": 0.6, "w_cnn": 0.4, "action": None,
+                 "alert": ("speak_break", f"DWI {f:.2f}") if random.random() < 0.002 else None}
+            t1 = time.perf_counter(); hub.publish(m, 30.0); cost += time.perf_counter() - t1; k += 1
+            if k % 300 == 0:
+                s = hub.stats()
+                print(f"publish {cost / k * 1e6:.2f} µs | {s['clients']} clients | sent {s['sent']} "
+                      f"| skipped {s['skipped_slow']} | {s['bytes'] / 1024:.0f} KiB")
+            time.sleep(1 / 30)
+    except KeyboardInterrupt:
+        hub.stop()
@@ -0,0 +1,229 @@
+"""
+Multi-face mode — several drivers / seats from one camera
+---------------------------------------------------------
+VisionModule tracks one face. For buses and shared cabins MultiFaceMonitor
+runs one FaceMesh(max_num_faces=N) pass per frame and keeps fully independent
+state per tracked face: each face gets its own VisionModule (EAR history,
+blink counter, PERCLOS windows, CalibrationWizard, fatigue EMA — all sharing
+the one FaceMesh), TrendTracker and FusionEngine.
+
+  FaceTracker   associates this frame's face boxes with existing tracks by
+                greedy IoU, then by centroid distance for faces that moved a
+                lot; unmatched tracks expire after max_missed_s
+  CNN           one shared cadence for all faces: every cnn_period_s the
+                crops of every tracked face are scored in a single
+                app.predict_model_batch() call, so CNN cost grows with the
+                batch, not with one forward pass per face (per-face timers
+                would drift out of phase and degrade to batches of one)
+  seats         optional fixed seat zones, e.g. [("driver", 0.5, 1.0),
+                ("co-driver", 0.0, 0.5)] by normalized box centre x
+
+Run standalone (camera, per-face HUD, per-face CSV):
+    python multiface.py [--faces 2] [--seats driver:0.5:1,co-driver:0:0.5]
+"""
+
+import time, argparse
+from collections import namedtuple
+import numpy as np
+import cv2
+import mediapipe as mp
+
+from roi import OUTLINE
+from capture import Camera
+
+MF_LOG_PATH = "driver_wellness_multiface.csv"
+MF_LOG_HEADER = ["time","face","seat","ear","blink_per_min","perclos_30s","cnn","fatigue","EAR_T"]
+
+_OneFace = namedtuple("_OneFace", "multi_face_landmarks")   # FaceMesh-result shape for VisionModule.step
+
+
+def face_box(lm):
+    """Normalized (x0, y0, x1, y1) of a face from its outline landmarks."""
+    xs = [lm[i].x for i in OUTLINE]; ys = [lm[i].y for i in OUTLINE]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0])); iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _center(b): return (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+
+
+# =========================== TRACKER ==========================
+class Track:
+    __slots__ = ("id", "box", "last_seen", "state")
+    def __init__(self, tid, box, now): self.id = tid; self.box = box; self.last_seen = now; self.state = None
+
+
+class FaceTracker:
+    """
+    Cheap frame-to-frame association. update(boxes, now) → (pairs, new, expired):
+    pairs = [(track, det_idx)], new = tracks created for unmatched boxes,
+    expired = tracks not seen for max_missed_s.
+    """
+    def __init__(self, iou_thresh=0.3, max_dist=0.12, max_missed_s=1.5):
+        self.iou_thresh = iou_thresh
+        self.max_dist = max_dist            # normalized centroid distance for the fallback match
+        self.max_missed_s = max_missed_s
+        self.tracks = {}
+        self.next_id = 1
+
+    def update(self, boxes, now):
+        tracks = list(self.tracks.values())
+        cand = sorted(((iou(t.box, b), ti, di) for ti, t in enumerate(tracks) for di, b in enumerate(boxes)),
+                      reverse=True)
+        used_t, used_d, pairs = set(), set(), []
+        for score, ti, di in cand:
+            if score < self.iou_thresh: break
+            if ti in used_t or di in used_d: continue
+            used_t.add(ti); used_d.add(di); pairs.append((tracks[ti], di))
+        # Fast movers: nearest unmatched centroid within max_dist
+        dist = sorted((np.hypot(*np.subtract(_center(t.box), _center(b))), ti, di)
+                      for ti, t in enumerate(tracks) if ti not in used_t
+                      for di, b in enumerate(boxes) if di not in used_d)
+        for d, ti, di in dist:
+            if d > self.max_dist: break
+            if ti in used_t or di in used_d: continue
+            used_t.add(ti); used_d.add(di); pairs.append((tracks[ti], di))
+        for t, di in pairs: t.box = boxes[di]; t.last_seen = now
+        new = []
+        for di, b in enumerate(boxes):
+            if di in used_d: continue
+            t = Track(self.next_id, b, now); self.next_id += 1
+            self.tracks[t.id] = t; new.append(t); pairs.append((t, di))
+        expired = [t for t in tracks if now - t.last_seen > self.max_missed_s]
+        for t in expired: del self.tracks[t.id]
+        return pairs, new, expired
+
+
+# ========================== MONITOR ===========================
+class FaceState:
+    """Everything per face: vision pipeline state, trend, fusion weights, last CNN result."""
+    def __init__(self, track, label, clock, mesh, warmup_s):
+        import app
+        self.id = track.id
+        self.label = label
+        self.vision = app.VisionModule(warmup_s=warmup_s, face_roi=False, clock=clock, mesh=mesh)
+        self.trend = app.TrendTracker(alpha=0.1, window_s=30.0, clock=clock)
+        self.fusion = app.FusionEngine()
+        self.cnn_prob = None
+        self.cnn_ts = None
+        self.last = {}
+
+
+class MultiFaceMonitor:
+    def __init__(self, max_faces=2, seats=None, clock=time.time, warmup_s=10.0, refine_landmarks=True,
+                 cnn_period_s=0.5, pad=0.35, predict_batch=None):
+        import app
+        self.clock = clock
+        self.mesh = mp.solutions.face_mesh.FaceMesh(max_num_faces=max_faces, refine_landmarks=refine_landmarks)
+        self.tracker = FaceTracker()
+        self.seats = seats or []
+        self.warmup_s = warmup_s
+        self.cnn_period_s = cnn_period_s
+        self.pad = pad
+        self.predict_batch = predict_batch or app.predict_model_batch
+        self.faces = {}
+        self.last_cnn_t = None              # shared CNN cadence for every tracked face
+        self.batches = 0; self.batched_faces = 0
+
+    def _label(self, track):
+        cx = _center(track.box)[0]
+        for name, x0, x1 in self.seats:
+            if x0 <= cx < x1 and all(f.label != name for f in self.faces.values()): return name
+        return f"face{track.id}"
+
+    def _crop(self, frame, box):
+        h, w = frame.shape[:2]
+        bw, bh = box[2] - box[0], box[3] - box[1]
+        x0 = max(0, int((box[0] - self.pad*bw) * w)); x1 = min(w, int((box[2] + self.pad*bw) * w))
+        y0 = max(0, int((box[1] - self.pad*bh) * h)); y1 = min(h, int((box[3] + self.pad*bh) * h))
+        return frame[y0:y1, x0:x1] if x1 - x0 > 8 and y1 - y0 > 8 else frame
+
+    def process(self, frame):
+        """One frame → list of per-face metric dicts (id, label, box, ear, fatigue, ...)."""
+        now = self.clock()
+        res = self.mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        faces = res.multi_face_landmarks or []
+        pairs, new, expired = self.tracker.update([face_box(f.landmark) for f in faces], now)
+        for t in expired: self.faces.pop(t.id, None)
+        for t in new:
+            self.faces[t.id] = FaceState(t, self._label(t), self.clock, self.mesh, self.warmup_s)
+
+        # Every cnn_period_s: one CNN call for every tracked face
+        if pairs and (self.last_cnn_t is None or now - self.last_cnn_t >= self.cnn_period_s):
+            probs = self.predict_batch([self._crop(frame, t.box) for t, _ in pairs])
+            if probs is not None:
+                self.last_cnn_t = now
+                self.batches += 1; self.batched_faces += len(pairs)
+                for (t, _), p in zip(pairs, probs):
+                    st = self.faces[t.id]; st.cnn_prob, st.cnn_ts = p, now
+
+        out = []
+        for t, di in sorted(pairs, key=lambda p: p[0].id):
+            st = self.faces[t.id]
+            age = None if st.cnn_ts is None else now - st.cnn_ts
+            m, _ = st.vision.step(frame, st.cnn_prob, 0.0, st.trend, st.fusion,
+                                  res=_OneFace([faces[di]]), cnn_age=age)
+            m.update({"id": t.id, "label": st.label, "box": t.box,
+                      "cnn": 0.0 if st.cnn_prob is None else st.cnn_prob, "time": now})
+            st.last = m; out.append(m)
+        return out
+
+    def draw(self, overlay, results):
+        h, w = overlay.shape[:2]
+        for m in results:
+            b = m["box"]; f = m["fatigue"]
+            color = (0,200,0) if f < 0.5 else ((0,200,200) if f < 0.7 else (0,0,255))
+            p0, p1 = (int(b[0]*w), int(b[1]*h)), (int(b[2]*w), int(b[3]*h))
+            cv2.rectangle(overlay, p0, p1, color, 2)
+            cv2.putText(overlay, f"{m['label']} F:{f:.2f} P:{m['perclos_30s']:.2f} B:{m['blink_per_min']:.0f}",
+                        (p0[0], max(15, p0[1] - 8)), 0, 0.5, color, 2)
+        return overlay
+
+    def close(self): self.mesh.close()
+
+
+def parse_seats(spec):
+    """"driver:0.5:1,co-driver:0:0.5" → [("driver", 0.5, 1.0), ("co-driver", 0.0, 0.5)]"""
+    seats = []
+    for part in (spec or "").split(","):
+        if not part.strip(): continue
+        name, x0, x1 = part.split(":")
+        seats.append((name.strip(), float(x0), float(x1)))
+    return seats
+
+
+# ============================ BOOT ============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Multi-face fatigue monitoring from one camera")
+    ap.add_argument("--faces", type=int, default=2)
+    ap.add_argument("--seats", help="name:x0:x1,... by normalized box centre x")
+    ap.add_argument("--camera", type=int, default=0)
+    ap.add_argument("--log", default=MF_LOG_PATH)
+    args = ap.parse_args()
+
+    import app
+    from session_log import SessionLogger
+    app.start_model_loader()
+    mon = MultiFaceMonitor(max_faces=args.faces, seats=parse_seats(args.seats))
+    logger = SessionLogger(args.log, MF_LOG_HEADER); logger.start()
+    cap = Camera(args.camera)
+    if not cap.isOpened(): raise RuntimeError("❌ Could not open camera.")
+    print(f"🚌 Multi-face mode: up to {args.faces} faces")
+    while True:
+        ok, frame = cap.read()
+        if not ok: break
+        results = mon.process(frame)
+        for m in results:
+            logger.log([m["time"], m["id"], m["label"], m["ear"], m["blink_per_min"], m["perclos_30s"],
+                        m["cnn"], m["fatigue"], m["ear_thresh"]])
+        mon.draw(frame, results)
+        cv2.imshow("Driver Wellness (multi-face)", frame)
+        if cv2.waitKey(1) & 0xFF == 27: break
+    logger.close(); mon.close(); cap.release(); cv2.destroyAllWindows()
+    if mon.batches: print(f"CNN: {mon.batches} batched calls, {mon.batched_faces / mon.batches:.2f} faces/call")
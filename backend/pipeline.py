@@ -0,0 +1,168 @@
+"""
+Pipelined frame loop — capture → (CNN ∥ FaceMesh) → fuse/render/log
+--------------------------------------------------------------------
+The sequential loop in app.main() pays capture + CNN + FaceMesh + render on
+every frame. FramePipeline splits that into stages on their own threads:
+
+  capture thread  ──► cnn_q  ──► CNN thread  ──► cnn history (seq, ts, prob)
+                  └─► mesh_q ──► mesh thread ──► out_q ──► caller (fuse/render/log)
+
+All queues are bounded and latest-frame-wins, so a slow stage drops stale
+frames instead of building latency. Every result carries the capture seq and
+timestamp; get() pairs each FaceMesh result with the CNN result of the same
+frame, or the one captured closest to it, so FusionEngine.fuse never mixes a
+probability with landmarks from a different moment than it has to.
+"""
+
+import threading, time
+from collections import deque, namedtuple
+from profiling import PROF
+
+# A frame after both inference stages. cnn_ts is the capture time of the frame
+# the CNN actually scored (== ts when both stages saw the same frame).
+FramePacket = namedtuple("FramePacket", "seq ts frame res cnn_prob cnn_ts")
+
+
+class LatestQueue:
+    """
+    Bounded, non-blocking-put queue: when full the oldest item is dropped.
+    """
+    def __init__(self, maxsize=1):
+        self.buf = deque(maxlen=maxsize)
+        self.cv = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+    def put(self, item):
+        with self.cv:
+            if len(self.buf) == self.buf.maxlen: self.dropped += 1
+            self.buf.append(item)
+            self.cv.notify()
+    def get(self, timeout=None):
+        """Oldest queued item (the only one when maxsize=1); None on timeout/close."""
+        with self.cv:
+            self.cv.wait_for(lambda: self.buf or self.closed, timeout)
+            return self.buf.popleft() if self.buf else None
+    def close(self):
+        with self.cv:
+            self.closed = True
+            self.cv.notify_all()
+    def __len__(self): return len(self.buf)
+
+
+class FramePipeline:
+    """
+    Runs capture, CNN and FaceMesh concurrently; get() returns FramePackets.
+      cap       : object with read() -> (ok, frame)  (capture.Camera or cv2.VideoCapture)
+      cnn_fn    : frame -> probability, or None when the CNN is scheduled
+                  elsewhere (cnn_sched.CNNScheduler); packets then carry cnn_prob=None
+      mesh_fn   : frame -> FaceMesh result (VisionModule.detect)
+      cnn_prep  : optional frame -> CNN input, run on the capture thread so the
+                  CNN stage never reads a frame the render stage is drawing on
+    """
+    def __init__(self, cap, cnn_fn, mesh_fn, cnn_prep=None, maxsize=1, history=8):
+        self.cap = cap
+        self.cnn_fn = cnn_fn
+        self.mesh_fn = mesh_fn
+        self.cnn_prep = cnn_prep or (lambda f: f.copy())
+        self.cnn_q = LatestQueue(maxsize)
+        self.mesh_q = LatestQueue(maxsize)
+        self.out_q = LatestQueue(maxsize)
+        self.cnn_hist = deque(maxlen=history)   # (seq, ts, prob)
+        self.cnn_lock = threading.Lock()
+        self.cnn_ready = threading.Event()
+        self._warm = False                        # first get() already waited for the CNN
+        self.captured = 0
+        self.cap_props = {}                     # pending cap.set() calls, applied between reads
+        self._stop = threading.Event()
+        self.threads = [
+            threading.Thread(target=self._capture_loop, daemon=True, name="vg-capture"),
+            threading.Thread(target=self._mesh_loop, daemon=True, name="vg-mesh"),
+        ]
+        if cnn_fn is not None:
+            self.threads.append(threading.Thread(target=self._cnn_loop, daemon=True, name="vg-cnn"))
+        else:
+            self.cnn_ready.set()
+
+    def start(self):
+        for t in self.threads: t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for q in (self.cnn_q, self.mesh_q, self.out_q): q.close()
+        for t in self.threads:
+            if t is not threading.current_thread(): t.join(timeout=1.0)
+
+    def set_capture(self, props):
+        """Queue {cv2.CAP_PROP_*: value} for the camera; applied on the capture thread between reads."""
+        self.cap_props = {**self.cap_props, **props}
+
+    @property
+    def dropped(self):
+        return {"cnn": self.cnn_q.dropped, "mesh": self.mesh_q.dropped, "out": self.out_q.dropped}
+
+    # ------------------------- stages -------------------------
+    def _capture_loop(self):
+        seq = 0
+        while not self._stop.is_set():
+            if self.cap_props:
+                props, self.cap_props = self.cap_props, {}
+                for k, v in props.items(): self.cap.set(k, v)
+            with PROF.stage("capture"): ok, frame = self.cap.read()
+            if not ok: break
+            # capture.Camera stamps frames at grab time; plain VideoCapture only after read()
+            seq += 1; ts = getattr(self.cap, "last_ts", None) or time.time()
+            self.captured = seq
+            if self.cnn_fn is not None: self.cnn_q.put((seq, ts, self.cnn_prep(frame)))
+            self.mesh_q.put((seq, ts, frame))
+        # camera gone → let downstream drain and finish
+        self.cnn_q.close(); self.mesh_q.close()
+
+    def _cnn_loop(self):
+        while not self._stop.is_set():
+            item = self.cnn_q.get(timeout=0.5)
+            if item is None:
+                if self.cnn_q.closed: break
+                continue
+            seq, ts, img = item
+            try:
+                prob = self.cnn_fn(img)
+            except Exception as e:
+                print("[Pipeline CNN Error]", e); self.cnn_ready.set(); continue
+            with self.cnn_lock: self.cnn_hist.append((seq, ts, prob))
+            self.cnn_ready.set()
+        self.cnn_ready.set()
+
+    def _mesh_loop(self):
+        while not self._stop.is_set():
+            item = self.mesh_q.get(timeout=0.5)
+            if item is None:
+                if self.mesh_q.closed: break
+                continue
+            seq, ts, frame = item
+            try:
+                res = self.mesh_fn(frame)
+            except Exception as e:
+                print("[Pipeline Mesh Error]", e); continue
+            self.out_q.put((seq, ts, frame, res))
+        self.out_q.close()
+
+    # ------------------------- consumer -----------------------
+    def _pair_cnn(self, seq, ts):
+        """CNN result for the same frame if present, else the one captured closest in time."""
+        with self.cnn_lock:
+            if not self.cnn_hist: return None, None
+            best = min(self.cnn_hist, key=lambda r: (r[0] != seq, abs(r[1] - ts)))
+        return best[2], best[1]
+
+    def get(self, timeout=1.0):
+        """Next fused-ready packet, or None once the capture source has ended."""
+        # Don't hand out the first frame before the CNN has had a go at all; later calls never block on it
+        if not self._warm: self.cnn_ready.wait(timeout=5.0); self._warm = True
+        while True:
+            item = self.out_q.get(timeout=timeout)
+            if item is not None: break
+            if self.out_q.closed or self._stop.is_set(): return None
+        seq, ts, frame, res = item
+        prob, cnn_ts = self._pair_cnn(seq, ts)
+        return FramePacket(seq, ts, frame, res, prob, cnn_ts)
@@ -0,0 +1,97 @@
+"""
+CNN preprocessing — preallocated, zero-copy input path for predict_model
+------------------------------------------------------------------------
+The old predict_model() allocated a resized copy, a float32 copy, a divided
+copy and an expand_dims array per frame, and asked the TFLite interpreter for
+its input/output details every call. Preprocessor keeps one uint8 resize
+target and one (1, S, S, 3) float32 input tensor for the whole session:
+
+  frame ──cv2.resize(dst=u8)──► u8 ──np.multiply(out=tensor, 1/255)──► tensor
+
+TFLite tensor indices are looked up once. With use_interpreter_buffer=True
+the scaled pixels are written straight into the interpreter's own input
+buffer (interpreter.tensor()), skipping set_tensor()'s copy as well.
+
+fill_batch(frames) does the same for N crops (multi-face mode) into a
+(N, S, S, 3) tensor that only grows when more faces show up than before.
+
+ResizeRing is the frame-loop side: the crop handed to the CNN worker is
+resized into one of a few preallocated buffers instead of a fresh array per
+scored frame.
+
+One Preprocessor serves one caller at a time (the CNN worker / stage thread).
+"""
+
+import numpy as np
+import cv2
+
+IMG_SIZE = 224
+
+
+class Preprocessor:
+    """
+    Reusable CNN input stage. fill(frame) → (1, S, S, 3) float32 tensor in [0, 1].
+    """
+    def __init__(self, size=IMG_SIZE, interpreter=None, use_interpreter_buffer=False):
+        self.size = size
+        self.dsize = (size, size)
+        self.u8 = np.empty((size, size, 3), np.uint8)
+        self.tensor = np.empty((1, size, size, 3), np.float32)
+        self.scale = np.float32(1.0 / 255.0)
+        self.batch = np.empty((0, size, size, 3), np.float32)
+        self.interp = interpreter
+        self.use_interp_buf = bool(interpreter is not None and use_interpreter_buffer)
+        if interpreter is not None:
+            self.in_idx = interpreter.get_input_details()[0]["index"]
+            self.out_idx = interpreter.get_output_details()[0]["index"]
+
+    def fill(self, frame, out=None):
+        """Resize + scale frame into `out` (defaults to the preallocated tensor)."""
+        cv2.resize(frame, self.dsize, dst=self.u8)
+        np.multiply(self.u8, self.scale, out=self.tensor[0] if out is None else out, dtype=np.float32)
+        return self.tensor
+
+    def fill_batch(self, frames, pad_to=0):
+        """
+        Resize + scale N frames into a preallocated (N, S, S, 3) view; with
+        pad_to the view has max(N, pad_to) rows (padding rows are left stale).
+        """
+        n = len(frames); rows = max(n, pad_to)
+        if rows > len(self.batch):
+            self.batch = np.empty((max(rows, 2 * len(self.batch)), self.size, self.size, 3), np.float32)
+        for i, f in enumerate(frames):
+            cv2.resize(f, self.dsize, dst=self.u8)
+            np.multiply(self.u8, self.scale, out=self.batch[i], dtype=np.float32)
+        return self.batch[:rows]
+
+    def run_tflite(self, frame):
+        """Preprocess + invoke + read output without per-frame buffer allocations."""
+        it = self.interp
+        if self.use_interp_buf:
+            # The view must not outlive this statement: TFLite refuses to invoke()
+            # while numpy references into its buffers are alive.
+            self.fill(frame, out=it.tensor(self.in_idx)()[0])
+        else:
+            self.fill(frame)
+            it.set_tensor(self.in_idx, self.tensor)
+        it.invoke()
+        return float(it.tensor(self.out_idx)()[0][0])
+
+
+class ResizeRing:
+    """
+    frame → (S, S, 3) uint8, resized into one of `slots` preallocated buffers
+    round-robin. A buffer is overwritten `slots` calls later, so up to
+    slots - 1 earlier results may still be in use. The default 3 covers one
+    queued in a LatestQueue(1), one being scored and the one being written.
+    Single producer (the capture thread or the frame loop).
+    """
+    def __init__(self, size=IMG_SIZE, slots=3):
+        self.dsize = (size, size)
+        self.bufs = [np.empty((size, size, 3), np.uint8) for _ in range(max(2, slots))]
+        self.i = 0
+
+    def __call__(self, frame):
+        buf = self.bufs[self.i]; self.i = (self.i + 1) % len(self.bufs)
+        cv2.resize(frame, self.dsize, dst=buf)
+        return buf
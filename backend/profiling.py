@@ -0,0 +1,214 @@
+"""
+Runtime profiling — per-stage timers, rolling latency stats, live surfaces
+--------------------------------------------------------------------------
+The only runtime signal used to be the smoothed FPS in the HUD. PROF (one
+process-wide Profiler) times the named stages of the frame loop wherever they
+run — capture / mesh / CNN on their worker threads, features / fusion / draw /
+logging / render on the main thread — and keeps for each:
+
+  - a rolling window of the last `window` samples (p50 / p95 / p99 / max)
+  - a cumulative infer_server.Histogram (for the JSON dump)
+
+Gauges (dropped frames, queue depths, CNN age, ...) are callables read only
+when a snapshot is taken, so they cost nothing per frame.
+
+Off by default. While off, PROF.stage(name) returns one shared null context
+manager and add() / frame() return immediately — a method call per stage.
+
+Surfaces (all optional):
+  panel(overlay)         HUD panel, toggled with 'p' in app.main()
+  tick(now)              one stats line every `report_s` seconds, plus a JSON
+                         dump to `dump_path` when set
+  serve(port)            GET http://127.0.0.1:<port>/metrics → JSON snapshot
+"""
+
+import os, json, time, threading
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import cv2
+
+from infer_server import Histogram
+
+# Latency bucket edges in ms (cumulative histograms)
+BOUNDS_MS = [0.1, 0.25, 0.5, 1, 2, 4, 6, 8, 12, 16, 25, 33, 50, 75, 100, 150, 250, 500, 1000]
+STAGE_ORDER = ["capture", "cnn", "mesh", "features", "fusion", "draw", "logging", "render", "frame"]
+
+_NULL = nullcontext()
+
+
+class _Timer:
+    """Context manager that records its elapsed time into a StageStats."""
+    __slots__ = ("stat", "t0")
+    def __init__(self, stat): self.stat = stat; self.t0 = 0.0
+    def __enter__(self): self.t0 = time.perf_counter(); return self
+    def __exit__(self, *exc): self.stat.add((time.perf_counter() - self.t0) * 1000.0); return False
+
+
+class StageStats:
+    """Rolling window + cumulative histogram of one stage's latency (ms)."""
+    def __init__(self, window=300):
+        self.recent = deque(maxlen=window)
+        self.hist = Histogram(BOUNDS_MS)
+        self.n = 0
+        self.last = 0.0
+    def add(self, ms):
+        self.recent.append(ms); self.hist.add(ms)
+        self.n += 1; self.last = ms
+    def snapshot(self):
+        r = np.fromiter(list(self.recent), np.float64)
+        if len(r) == 0: return {"n": self.n, "last_ms": 0.0}
+        p50, p95, p99 = np.percentile(r, (50, 95, 99))
+        return {"n": self.n, "last_ms": self.last, "mean_ms": float(r.mean()),
+                "p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(r.max())}
+
+
+class Profiler:
+    def __init__(self, enabled=False, window=300, report_s=5.0, dump_path=None):
+        self.enabled = self.pinned = enabled      # pinned: on from config, not just for the panel
+        self.window = window
+        self.report_s = report_s
+        self.dump_path = dump_path
+        self.show_panel = False
+        self.stats = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+        self._frame_t = None
+        self._last_report = None
+        self._panel_cache = (0.0, [])
+        self._httpd = None
+
+    # ------------------------- hot path -----------------------
+    def stage(self, name):
+        """`with PROF.stage("mesh"): ...` — shared null context while disabled."""
+        if not self.enabled: return _NULL
+        return _Timer(self._stat(name))   # per call: stages also run on worker threads
+
+    def add(self, name, ms):
+        """Record a duration measured elsewhere."""
+        if self.enabled: self._stat(name).add(ms)
+
+    def frame(self):
+        """Mark the end of one main-loop iteration (records the 'frame' stage)."""
+        if not self.enabled: return
+        now = time.perf_counter()
+        if self._frame_t is not None: self._stat("frame").add((now - self._frame_t) * 1000.0)
+        self._frame_t = now
+
+    def _stat(self, name):
+        s = self.stats.get(name)
+        if s is None:
+            with self.lock: s = self.stats.setdefault(name, StageStats(self.window))
+        return s
+
+    # ------------------------- control ------------------------
+    def configure(self, enabled=None, report_s=None, dump_path=None):
+        if enabled is not None: self.enabled = self.pinned = enabled
+        if report_s is not None: self.report_s = report_s
+        if dump_path is not None: self.dump_path = dump_path
+        return self
+
+    def gauge(self, name, fn):
+        """Register a zero-arg callable read at snapshot time (dropped counts, queue depths...)."""
+        self.gauges[name] = fn
+
+    def toggle(self):
+        """HUD key: show/hide the panel; timing runs while it is shown (or when pinned on)."""
+        self.show_panel = not self.show_panel
+        self.enabled = self.pinned or self.show_panel
+        if not self.enabled: self._frame_t = None
+        return self.show_panel
+
+    # ------------------------- surfaces -----------------------
+    def snapshot(self):
+        with self.lock: items = list(self.stats.items())
+        order = {n: i for i, n in enumerate(STAGE_ORDER)}
+        items.sort(key=lambda kv: (order.get(kv[0], len(order)), kv[0]))
+        gauges = {}
+        for k, fn in list(self.gauges.items()):
+            try: gauges[k] = fn()
+            except Exception as e: gauges[k] = f"error: {e}"
+        fr = self.stats.get("frame")
+        mean = fr.snapshot().get("mean_ms") if fr is not None else None
+        return {"time": time.time(), "enabled": self.enabled,
+                "fps": 1000.0 / mean if mean else 0.0,
+                "stages": {k: s.snapshot() for k, s in items}, "gauges": gauges}
+
+    def histograms(self):
+        with self.lock: items = list(self.stats.items())
+        return {k: s.hist.snapshot() for k, s in items}
+
+    def line(self, snap=None):
+        snap = snap or self.snapshot()
+        parts = [f"{snap['fps']:.1f} fps"]
+        for k, s in snap["stages"].items():
+            if k != "frame" and "p50_ms" in s: parts.append(f"{k} {s['p50_ms']:.1f}/{s['p95_ms']:.1f}")
+        for k, v in snap["gauges"].items(): parts.append(f"{k} {v}")
+        return "[Prof] " + " | ".join(parts) + "  (p50/p95 ms)"
+
+    def tick(self, now=None):
+        """Periodic stats line + optional JSON dump; call once per frame."""
+        if not self.enabled: return
+        now = time.time() if now is None else now
+        if self._last_report is None: self._last_report = now; return
+        if now - self._last_report < self.report_s: return
+        self._last_report = now
+        snap = self.snapshot()
+        print(self.line(snap))
+        if self.dump_path: self.dump(self.dump_path, snap)
+
+    def dump(self, path, snap=None):
+        doc = dict(snap or self.snapshot()); doc["histograms"] = self.histograms()
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f: json.dump(doc, f, indent=1, default=str)
+            os.replace(tmp, path)       # readers never see a half-written file
+        except OSError as e: print("[Profiler dump Error]", e)
+
+    def panel(self, overlay, x=None, y=180, refresh_s=0.5):
+        """Per-stage p50/p95 table drawn on the frame (recomputed at most every refresh_s)."""
+        if not self.show_panel: return overlay
+        now = time.perf_counter()
+        t, lines = self._panel_cache
+        if now - t >= refresh_s:
+            snap = self.snapshot()
+            lines = [f"PROFILE {snap['fps']:.1f} fps   p50 / p95 ms"]
+            lines += [f"{k:<9}{s['p50_ms']:6.1f}{s['p95_ms']:7.1f}"
+                      for k, s in snap["stages"].items() if "p50_ms" in s]
+            lines += [f"{k}: {v}" for k, v in snap["gauges"].items()]
+            self._panel_cache = (now, lines)
+        x = overlay.shape[1] - 330 if x is None else x
+        cv2.rectangle(overlay, (x - 10, y - 22), (overlay.shape[1], y + 20 * len(lines)), (25,25,25), -1)
+        for i, txt in enumerate(lines):
+            cv2.putText(overlay, txt, (x, y + 20*i), 0, 0.5, (200,255,200), 1)
+        return overlay
+
+    def serve(self, port, host="127.0.0.1"):
+        """Local-only JSON endpoint: /metrics (snapshot) and /histograms."""
+        prof = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"): body = prof.snapshot()
+                elif self.path.startswith("/histograms"): body = prof.histograms()
+                else: self.send_error(404); return
+                data = json.dumps(body, default=str).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers(); self.wfile.write(data)
+            def log_message(self, *a): pass
+        try:
+            self._httpd = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print("⚠️ Profiler endpoint disabled:", e); return None
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="vg-prof-http").start()
+        print(f"✅ Profiler metrics at http://{host}:{port}/metrics")
+        return self._httpd
+
+    def close(self):
+        if self._httpd is not None: self._httpd.shutdown(); self._httpd = None
+
+
+PROF = Profiler()
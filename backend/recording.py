@@ -0,0 +1,236 @@
+"""
+Columnar session recordings (.vgrec) — compact binary log + memory-mapped reader
+-------------------------------------------------------------------------------
+The per-frame CSV (driver_wellness_p11_4.csv) stores every metric as text, so
+analysing a day of fleet logs means parsing millions of float strings. A
+.vgrec file holds the same columns as fixed-width typed arrays:
+
+  header  b"VGREC1\\0\\0" | u32 len | JSON {columns, enums, created} | pad to 8
+  chunk   b"VGCK" | u32 nrows | column 0 (nrows * itemsize) | pad | column 1 | ...
+  ...     (append-only; one chunk per flush)
+  index   b"VGIX" | u32 nchunks | nchunks * (u64 offset, u32 nrows, u32 pad)
+  footer  u64 index_offset | b"VGEND\\0\\0\\0"
+
+Every column block is 8-byte aligned, so RecordingReader can memory-map the
+file and hand out numpy views of each column without copying. A file without
+a footer (crash mid-session) is still readable: the reader scans chunk
+headers instead. Reopening a file for append drops the footer and continues.
+
+CLI:
+    python recording.py convert driver_wellness_p11_4.csv session.vgrec
+    python recording.py summary session.vgrec [--dwi-high 0.7]
+    python recording.py info session.vgrec
+"""
+
+import os, json, time, struct, csv, argparse
+import numpy as np
+
+MAGIC = b"VGREC1\0\0"
+CHUNK = b"VGCK"
+INDEX = b"VGIX"
+END = b"VGEND\0\0\0"
+_U32 = struct.Struct("<I")
+_CHUNK_HDR = struct.Struct("<4sI")
+_IDX_ENTRY = struct.Struct("<QII")
+_FOOTER = struct.Struct("<Q8s")
+
+# Schema of app.py's per-frame log (same names/order as LOG_HEADER)
+ACTIONS = ["none", "beep_alert", "speak_break", "speak_breathing", "play_music"]
+LOG_COLUMNS = [
+    ("time", "f8"), ("ear", "f4"), ("blink_per_min", "f4"), ("perclos_30s", "f4"),
+    ("cnn", "f4"), ("fatigue", "f4"), ("CLI", "f4"), ("VSI", "f4"), ("DWI", "f4"),
+    ("action", "u1"), ("EAR_T", "f4"), ("w_visual", "f4"), ("w_cnn", "f4"),
+]
+LOG_ENUMS = {"action": ACTIONS}
+
+
+def _pad8(n): return (-n) % 8
+
+
+# =========================== WRITER ===========================
+class RecordingWriter:
+    """
+    Buffers rows column-wise in preallocated arrays and appends one chunk per
+    `chunk_rows` rows (or per flush()). Enum columns take their string value.
+    """
+    def __init__(self, path, columns=LOG_COLUMNS, enums=LOG_ENUMS, chunk_rows=4096):
+        self.path = path
+        self.names = [n for n, _ in columns]
+        self.dtypes = [np.dtype(d) for _, d in columns]
+        self.enums = {k: {v: i for i, v in enumerate(vals)} for k, vals in (enums or {}).items()}
+        self.chunk_rows = chunk_rows
+        self.cols = [np.zeros(chunk_rows, d) for d in self.dtypes]
+        self.n = 0
+        self.index = []                 # (offset, nrows)
+        self.rows = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            hdr, self.index, end = _read_layout(path)
+            if [c[0] for c in hdr["columns"]] != self.names:
+                raise ValueError(f"{path}: existing recording has a different column schema")
+            self.f = open(path, "r+b"); self.f.seek(end); self.f.truncate()
+            self.rows = sum(n for _, n in self.index)
+        else:
+            self.f = open(path, "wb")
+            meta = json.dumps({"columns": [[n, d.str] for n, d in zip(self.names, self.dtypes)],
+                               "enums": enums or {}, "created": time.time()}).encode()
+            self.f.write(MAGIC + _U32.pack(len(meta)) + meta + b"\0" * _pad8(len(MAGIC) + 4 + len(meta)))
+
+    def append(self, row):
+        i = self.n
+        for k, (name, v) in enumerate(zip(self.names, row)):
+            enum = self.enums.get(name)
+            if enum is not None: v = enum.get(v or "none", 0)
+            self.cols[k][i] = 0 if v is None or v == "" else v
+        self.n += 1
+        if self.n >= self.chunk_rows: self.flush()
+
+    def flush(self):
+        if self.n == 0: return
+        n = self.n
+        self.index.append((self.f.tell(), n))
+        self.f.write(_CHUNK_HDR.pack(CHUNK, n))
+        for col in self.cols:
+            b = col[:n].tobytes()
+            self.f.write(b); self.f.write(b"\0" * _pad8(len(b)))
+        self.f.flush()
+        self.rows += n; self.n = 0
+
+    def close(self):
+        if self.f.closed: return
+        self.flush()
+        idx_off = self.f.tell()
+        self.f.write(INDEX + _U32.pack(len(self.index)))
+        for off, n in self.index: self.f.write(_IDX_ENTRY.pack(off, n, 0))
+        self.f.write(_FOOTER.pack(idx_off, END))
+        self.f.close()
+
+
+def _chunk_size(nrows, dtypes):
+    return _CHUNK_HDR.size + sum(nrows * d.itemsize + _pad8(nrows * d.itemsize) for d in dtypes)
+
+
+def _read_layout(path, mm=None):
+    """(header, [(offset, nrows)], end_of_chunks) — from the index, or by scanning."""
+    if mm is None: mm = np.memmap(path, np.uint8, mode="r")
+    buf = memoryview(mm)
+    if bytes(buf[:8]) != MAGIC: raise ValueError(f"{path}: not a .vgrec file")
+    hlen = _U32.unpack_from(buf, 8)[0]
+    hdr = json.loads(bytes(buf[12:12 + hlen]))
+    dtypes = [np.dtype(d) for _, d in hdr["columns"]]
+    pos = 12 + hlen + _pad8(12 + hlen)
+    size = len(buf)
+    if size >= pos + _FOOTER.size and bytes(buf[size - 8:]) == END:
+        idx_off = _FOOTER.unpack_from(buf, size - _FOOTER.size)[0]
+        if bytes(buf[idx_off:idx_off + 4]) == INDEX:
+            k = _U32.unpack_from(buf, idx_off + 4)[0]
+            index = [_IDX_ENTRY.unpack_from(buf, idx_off + 8 + i * _IDX_ENTRY.size)[:2] for i in range(k)]
+            return hdr, index, idx_off
+    # No footer (session crashed) → walk chunk headers, ignore a torn tail
+    index = []
+    while pos + _CHUNK_HDR.size <= size:
+        tag, n = _CHUNK_HDR.unpack_from(buf, pos)
+        if tag != CHUNK or pos + _chunk_size(n, dtypes) > size: break
+        index.append((pos, n)); pos += _chunk_size(n, dtypes)
+    return hdr, index, pos
+
+
+# =========================== READER ===========================
+class RecordingReader:
+    """
+    Memory-mapped reader. chunks(name) → list of zero-copy views;
+    column(name) → one zero-copy view when the file has a single chunk
+    (e.g. produced by convert), else a concatenated copy.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.mm = np.memmap(path, np.uint8, mode="r")
+        self.header, self.index, _ = _read_layout(path, self.mm)
+        self.names = [n for n, _ in self.header["columns"]]
+        self.dtypes = {n: np.dtype(d) for n, d in self.header["columns"]}
+        self.enums = self.header.get("enums", {})
+
+    def __len__(self): return sum(n for _, n in self.index)
+
+    def chunks(self, name):
+        k = self.names.index(name)
+        out = []
+        for off, n in self.index:
+            pos = off + _CHUNK_HDR.size
+            for j in range(k):
+                sz = n * self.dtypes[self.names[j]].itemsize
+                pos += sz + _pad8(sz)
+            out.append(np.frombuffer(self.mm, self.dtypes[name], count=n, offset=pos))
+        return out
+
+    def column(self, name):
+        parts = self.chunks(name)
+        if len(parts) == 1: return parts[0]
+        if not parts: return np.empty(0, self.dtypes[name])
+        return np.concatenate(parts)
+
+    def decode(self, name, codes):
+        vals = self.enums.get(name)
+        return [vals[int(c)] for c in codes] if vals else list(codes)
+
+    def __getitem__(self, name): return self.column(name)
+
+
+def summarize(reader, dwi_high=0.70):
+    """write_summary()-style stats computed chunk by chunk straight off the mmap."""
+    n = 0; s_f = 0.0; s_b = 0.0; mn = np.inf; mx = -np.inf; above = 0.0
+    t_first = None; t_last = None; prev_high = False
+    for t, f, b, d in zip(reader.chunks("time"), reader.chunks("fatigue"),
+                          reader.chunks("blink_per_min"), reader.chunks("DWI")):
+        if len(t) == 0: continue
+        if t_first is None: t_first = float(t[0])
+        # time spent above DWI_HIGH: each row owns the interval until the next row
+        if t_last is not None and prev_high: above += float(t[0]) - t_last
+        high = d[:-1] >= dwi_high
+        above += float(np.diff(t)[high].sum())
+        prev_high = bool(d[-1] >= dwi_high); t_last = float(t[-1])
+        n += len(f); s_f += float(f.sum(dtype=np.float64)); s_b += float(b.sum(dtype=np.float64))
+        mn = min(mn, float(f.min())); mx = max(mx, float(f.max()))
+    if n == 0:
+        return {"start": 0, "end": 0, "duration_s": 0.0, "avg_fatigue": 0.0, "min_fatigue": 0.0,
+                "max_fatigue": 0.0, "avg_blink": 0.0, "time_above_high_s": 0.0}
+    return {"start": int(t_first), "end": int(t_last), "duration_s": t_last - t_first,
+            "avg_fatigue": s_f / n, "min_fatigue": mn, "max_fatigue": mx,
+            "avg_blink": s_b / n, "time_above_high_s": above}
+
+
+def csv_to_recording(csv_path, out_path, columns=LOG_COLUMNS, enums=LOG_ENUMS):
+    """Convert an existing per-frame CSV log into a single-chunk .vgrec file."""
+    with open(csv_path, newline="") as f:
+        nrows = max(0, sum(1 for _ in f) - 1)
+    names = [n for n, _ in columns]
+    w = RecordingWriter(out_path, columns, enums, chunk_rows=max(1, nrows))
+    with open(csv_path, newline="") as f:
+        r = csv.reader(f)
+        hdr = next(r)
+        pos = [hdr.index(n) for n in names]
+        for row in r:
+            if row: w.append([row[i] for i in pos])
+    w.close()
+    return nrows
+
+
+# ============================ CLI =============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Columnar session recordings (.vgrec)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("convert"); c.add_argument("csv"); c.add_argument("out")
+    s = sub.add_parser("summary"); s.add_argument("path"); s.add_argument("--dwi-high", type=float, default=0.70)
+    i = sub.add_parser("info"); i.add_argument("path")
+    args = ap.parse_args()
+
+    if args.cmd == "convert":
+        t0 = time.time(); n = csv_to_recording(args.csv, args.out)
+        print(f"✅ {n} rows → {args.out} ({os.path.getsize(args.out)/1e6:.1f} MB, {time.time()-t0:.1f} s)")
+    elif args.cmd == "summary":
+        t0 = time.time(); st = summarize(RecordingReader(args.path), args.dwi_high)
+        for k, v in st.items(): print(f"{k:>18}: {v}")
+        print(f"({time.time()-t0:.3f} s)")
+    else:
+        rd = RecordingReader(args.path)
+        print(f"{args.path}: {len(rd)} rows in {len(rd.index)} chunks")
+        for n in rd.names: print(f"  {n:<14} {rd.dtypes[n].str}")
@@ -0,0 +1,170 @@
+"""
+Offline replay — run the full wellness pipeline on recorded video at max speed
+------------------------------------------------------------------------------
+main() only works on a live camera, paced by waitKey/sleep and timed with
+time.time(). Replay drives the same app.DriverSession (VisionModule,
+CalibrationWizard, TrendTracker, FusionEngine, DWI trigger, session stats)
+from a VirtualClock that follows the frame timestamps, headless and as fast
+as the hardware allows. It writes the same per-frame CSV and summary row as
+a live session, so archived fleet footage can be re-scored and threshold
+changes regression-tested deterministically (fixed seed, synchronous CNN
+scheduling, a pinned CNN backend, no wall-clock dependence).
+
+Usage:
+    python replay.py trip.mp4 [--log trip_replay.csv] [--summary trip_replay_summary.csv]
+    python replay.py frames_dir/ --fps 30 --dwi-high 0.65 --cnn-policy every_n
+"""
+
+import os, time, random, argparse
+import numpy as np
+import cv2
+
+from cnn_sched import CNNScheduler
+from session_log import SessionLogger
+
+IMAGE_EXT = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class VirtualClock:
+    """Callable clock (drop-in for time.time) that returns the current frame's time."""
+    def __init__(self, t0=0.0): self.now = t0
+    def __call__(self): return self.now
+    def set(self, t): self.now = t
+
+
+# =========================== SOURCES ==========================
+class VideoFileSource:
+    """(ts, frame) from a video file; ts in seconds from the start of the file."""
+    def __init__(self, path, fps=None):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"❌ Could not open video {path}")
+        self.fps = fps or self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.use_pts = fps is None
+    def __iter__(self):
+        i = 0; last = -1.0
+        try:
+            while True:
+                ok, frame = self.cap.read()
+                if not ok: break
+                ts = i / self.fps
+                if self.use_pts:
+                    pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+                    if pts > last: ts = pts       # container timestamps when they are usable
+                last = ts; i += 1
+                yield ts, frame
+        finally:
+            self.cap.release()
+
+
+class ImageDirSource:
+    """(ts, frame) from a directory of images in name order, at a fixed fps."""
+    def __init__(self, path, fps=30.0):
+        self.files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.lower().endswith(IMAGE_EXT))
+        self.fps = fps or 30.0
+    def __iter__(self):
+        for i, p in enumerate(self.files):
+            frame = cv2.imread(p)
+            if frame is None:
+                print(f"⚠️ Skipping unreadable image {p}"); continue
+            yield i / self.fps, frame
+
+
+def open_source(path, fps=None):
+    return ImageDirSource(path, fps) if os.path.isdir(path) else VideoFileSource(path, fps)
+
+
+# =========================== REPLAY ===========================
+def default_outputs(path):
+    base = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    return f"{base}_replay.csv", f"{base}_replay_summary.csv"
+
+
+def run_replay(path, log_path=None, summary_path=None, fps=None, t0=None, cnn_policy=None,
+               seed=0, max_frames=None, predict=None, mesh=None, quiet=False, backend=None):
+    """
+    Replay one recording through app.DriverSession. Returns (summary, stats):
+    summary is the write_summary() dict plus cnn_backend, stats has frames /
+    wall_s / fps / realtime_x / alerts.
+    `predict` overrides app.predict_model (e.g. a shared inference server);
+    `mesh` reuses an already-initialized FaceMesh (batch workers keep one warm);
+    `backend` pins the CNN backend kind (default: app.resolve_backend(), never
+    the timing-based "auto" choice). It applies to the first model load only.
+    """
+    import app
+    random.seed(seed); np.random.seed(seed)
+    dlog, dsum = default_outputs(path)
+    log_path = log_path or dlog; summary_path = summary_path or dsum
+    # Virtual time starts at the file's mtime: deterministic, and close to when it was recorded
+    t0 = os.path.getmtime(path) if t0 is None else t0
+    clock = VirtualClock(t0)
+    logger = SessionLogger(log_path, app.LOG_HEADER, block=True); logger.start()
+    if mesh is not None and hasattr(mesh, "reset"): mesh.reset()   # drop tracking state of the last video
+    session = app.DriverSession(clock=clock, logger=logger, rng=random.Random(seed), mesh=mesh)
+    vision = session.vision
+    vision.draw_landmarks = False     # the overlay is discarded; don't draw contours every frame
+    if predict is None:
+        if app.model_loader is None: app.INFER_BACKEND = backend or app.resolve_backend()
+        app.ensure_model()            # CNN from frame 0, not whenever the loader happens to finish
+        predict = app.predict_model
+    policy = cnn_policy or app.CNN_POLICY
+    sched = None
+    if policy != "every_frame":
+        sched = CNNScheduler(predict, policy=policy, every_n=app.CNN_EVERY_N, hz=app.CNN_HZ,
+                             prep=vision.face_crop, sync=True).start()
+
+    n = 0; alerts = 0; ts = 0.0
+    t_wall = time.perf_counter()
+    for ts, frame in open_source(path, fps):
+        clock.set(t0 + ts)
+        now = clock()
+        if sched is not None:
+            sched.offer(frame, now, vision.fatigue, session.pcl)
+            prob, cnn_ts = sched.latest()
+        else:
+            prob, cnn_ts = predict(vision.face_crop(frame)), now
+        m, _ = session.process(frame, prob, None if cnn_ts is None else now - cnn_ts)
+        if m["alert"] is not None: alerts += 1
+        n += 1
+        if not quiet and n % 500 == 0:
+            el = time.perf_counter() - t_wall
+            print(f"[Replay] {n} frames | {n/el:.1f} f/s | {ts/el:.1f}x real-time")
+        if max_frames and n >= max_frames: break
+    wall = time.perf_counter() - t_wall
+
+    logger.close()
+    summary = session.summary()
+    app.write_summary(summary, summary_path)
+    summary["cnn_backend"] = "external" if predict is not app.predict_model else repr(app.backend)
+    stats = {"frames": n, "wall_s": wall, "fps": n / max(1e-9, wall),
+             "realtime_x": ts / max(1e-9, wall), "alerts": alerts,
+             "log": log_path, "summary": summary_path}
+    if not quiet:
+        app.print_summary(summary, summary_path)
+        print(f"🧠 CNN backend: {summary['cnn_backend']}")
+        print(f"⏩ {n} frames in {wall:.1f} s ({stats['fps']:.1f} f/s, {stats['realtime_x']:.1f}x real-time), "
+              f"{alerts} alerts")
+    return summary, stats
+
+
+# ============================ BOOT ============================
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Headless replay of recorded driving video")
+    ap.add_argument("source", help="video file or directory of images")
+    ap.add_argument("--log"); ap.add_argument("--summary")
+    ap.add_argument("--fps", type=float, help="override timestamps with a fixed frame rate")
+    ap.add_argument("--t0", type=float, help="virtual start time (default: source mtime)")
+    ap.add_argument("--cnn-policy", choices=["every_frame", "every_n", "hz", "adaptive"])
+    ap.add_argument("--dwi-high", type=float); ap.add_argument("--dwi-low", type=float)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-frames", type=int)
+    ap.add_argument("--backend", choices=["keras", "tflite", "tflite_int8", "onnx"],
+                    help="CNN backend (default: the reference model, not the timing-based auto pick)")
+    args = ap.parse_args()
+
+    import app
+    if args.dwi_high is not None: app.DWI_HIGH = args.dwi_high
+    if args.dwi_low is not None: app.DWI_LOW = args.dwi_low
+    run_replay(args.source, args.log, args.summary, fps=args.fps, t0=args.t0,
+               cnn_policy=args.cnn_policy, seed=args.seed, max_frames=args.max_frames, backend=args.backend)
@@ -0,0 +1,84 @@
+"""
+Face-ROI tracking — feed the CNN and FaceMesh only the driver's face
+--------------------------------------------------------------------
+At 1080p the face is a small part of the frame, yet predict_model() resized
+the whole frame to 224x224 and FaceMesh converted/processed the whole image.
+FaceROITracker keeps a padded, square face box derived from the previous
+frame's landmarks:
+
+  - FaceMesh runs on the crop; landmarks are mapped back to full-frame
+    normalized coordinates so every downstream feature is unchanged
+  - the CNN gets the same face crop (more face pixels, less background)
+  - when the crop loses the face the box is dropped and the next pass
+    falls back to full-frame detection
+
+The box only moves when the face nears its edge or changes size noticeably,
+so the crop stays stable frame to frame.
+"""
+
+# Cheap outline points (forehead, chin, cheeks, temples) — enough for a box
+OUTLINE = (10, 152, 234, 454, 127, 356, 132, 361)
+
+
+class FaceROITracker:
+    """
+    box: normalized (x0, y0, x1, y1) of the current padded face region, or None.
+    """
+    def __init__(self, pad=0.35, min_px=64, margin=0.12, resize_tol=0.2):
+        self.pad = pad                  # padding as a fraction of face size on each side
+        self.min_px = min_px            # smallest crop we bother with
+        self.margin = margin            # re-center when the face gets this close to the edge
+        self.resize_tol = resize_tol    # re-size when the face size changes by more than this
+        self.box = None
+        self.losses = 0
+
+    def update(self, lm, w, h):
+        """Refresh the box from full-frame normalized landmarks of this frame."""
+        xs = [lm[i].x for i in OUTLINE]; ys = [lm[i].y for i in OUTLINE]
+        fx0, fx1 = min(xs) * w, max(xs) * w
+        fy0, fy1 = min(ys) * h, max(ys) * h
+        side = max(fx1 - fx0, fy1 - fy0)
+        if self.box is not None:
+            bx0, by0, bx1, by1 = self.box[0]*w, self.box[1]*h, self.box[2]*w, self.box[3]*h
+            bside = bx1 - bx0
+            inner = self.margin * bside
+            inside = (fx0 > bx0 + inner and fx1 < bx1 - inner and fy0 > by0 + inner and fy1 < by1 - inner)
+            size_ok = abs(side * (1 + 2*self.pad) - bside) <= self.resize_tol * bside
+            if inside and size_ok: return self.box
+        cx, cy = (fx0 + fx1) / 2, (fy0 + fy1) / 2
+        half = max(self.min_px, side * (1 + 2*self.pad)) / 2
+        self.box = ((cx - half) / w, (cy - half) / h, (cx + half) / w, (cy + half) / h)
+        return self.box
+
+    def lost(self):
+        if self.box is not None: self.losses += 1
+        self.box = None
+
+    def region(self, w, h):
+        """Pixel box (x0, y0, x1, y1) clamped to the frame, or None → use the full frame."""
+        b = self.box
+        if b is None: return None
+        x0, y0 = max(0, int(b[0]*w)), max(0, int(b[1]*h))
+        x1, y1 = min(w, int(b[2]*w)), min(h, int(b[3]*h))
+        if x1 - x0 < self.min_px or y1 - y0 < self.min_px: return None
+        return x0, y0, x1, y1
+
+    def crop(self, frame):
+        """Zero-copy view of the face region (the full frame when not tracking)."""
+        h, w = frame.shape[:2]
+        r = self.region(w, h)
+        if r is None: return frame
+        x0, y0, x1, y1 = r
+        return frame[y0:y1, x0:x1]
+
+
+def to_frame_coords(lm, region, w, h):
+    """Map landmarks detected on a crop back to full-frame normalized coordinates (in place)."""
+    x0, y0, x1, y1 = region
+    cw, ch = x1 - x0, y1 - y0
+    sx, sy = cw / w, ch / h
+    ox, oy = x0 / w, y0 / h
+    for p in lm:
+        p.x = ox + p.x * sx
+        p.y = oy + p.y * sy
+        p.z = p.z * sx
@@ -0,0 +1,129 @@
+"""
+Rolling statistics — O(1) sliding-window mean / variance / slope / fraction
+---------------------------------------------------------------------------
+PERCLOS rebuilt a list of the whole 30 s window every frame, TrendTracker
+turned a 450-sample deque into an array and refit a least-squares line every
+frame, and the simulated sensors ran np.std / np.var over full buffers on
+every read. RollingStats keeps running Σy, Σy², Σx, Σx², Σxy over a ring
+buffer, so every statistic is O(1) per update:
+
+  mean / fraction   Σy / n                (fraction of 1s for 0/1 samples)
+  var / std         Σy²/n − mean²         (population, like np.var / np.std)
+  slope             least-squares dy/dx   (x = sample index unless given)
+
+The window is the last `maxlen` samples, samples within `horizon` x-units of
+the newest one, or both. Sums are recomputed from the buffer (and x rebased)
+every `recompute_every` updates so float drift stays bounded over a shift.
+
+BucketedMean covers long horizons (e.g. 5-minute PERCLOS) at fixed memory by
+aggregating samples into time buckets.
+"""
+
+from collections import deque
+
+
+class RollingStats:
+    """
+    Sliding window with running sums. push(y[, x]) then read .mean/.var/.std/.slope.
+    """
+    def __init__(self, maxlen=None, horizon=None, recompute_every=None):
+        if maxlen is None and horizon is None:
+            raise ValueError("RollingStats needs maxlen and/or horizon")
+        self.maxlen = maxlen
+        self.horizon = horizon
+        self.recompute_every = recompute_every or max(1000, 10 * (maxlen or 0))
+        self.buf = deque()              # (x - x0, y)
+        self.x0 = None
+        self.k = 0                      # default x: running sample index
+        self._since = 0
+        self.sy = self.syy = self.sx = self.sxx = self.sxy = 0.0
+
+    def push(self, y, x=None):
+        if x is None: x = self.k
+        self.k += 1
+        if self.x0 is None: self.x0 = x
+        xr = x - self.x0
+        self.buf.append((xr, y))
+        self.sy += y; self.syy += y*y
+        self.sx += xr; self.sxx += xr*xr; self.sxy += xr*y
+        buf = self.buf
+        while buf and ((self.maxlen is not None and len(buf) > self.maxlen) or
+                       (self.horizon is not None and xr - buf[0][0] > self.horizon)):
+            ox, oy = buf.popleft()
+            self.sy -= oy; self.syy -= oy*oy
+            self.sx -= ox; self.sxx -= ox*ox; self.sxy -= ox*oy
+        self._since += 1
+        if self._since >= self.recompute_every: self._recompute()
+
+    def _recompute(self):
+        """Rebase x on the oldest sample and rebuild the sums (amortized O(1))."""
+        self._since = 0
+        if not self.buf: return
+        shift = self.buf[0][0]
+        self.x0 += shift
+        self.buf = deque((x - shift, y) for x, y in self.buf)
+        self.sy = sum(y for _, y in self.buf); self.syy = sum(y*y for _, y in self.buf)
+        self.sx = sum(x for x, _ in self.buf); self.sxx = sum(x*x for x, _ in self.buf)
+        self.sxy = sum(x*y for x, y in self.buf)
+
+    def clear(self):
+        self.buf.clear(); self.x0 = None; self._since = 0
+        self.sy = self.syy = self.sx = self.sxx = self.sxy = 0.0
+
+    def __len__(self): return len(self.buf)
+
+    @property
+    def n(self): return len(self.buf)
+
+    @property
+    def mean(self):
+        return self.sy / len(self.buf) if self.buf else 0.0
+
+    fraction = mean
+
+    @property
+    def var(self):
+        n = len(self.buf)
+        if n == 0: return 0.0
+        m = self.sy / n
+        return max(0.0, self.syy / n - m*m)
+
+    @property
+    def std(self): return self.var ** 0.5
+
+    @property
+    def slope(self):
+        n = len(self.buf)
+        if n < 2: return 0.0
+        sxx = self.sxx - self.sx*self.sx / n
+        if sxx <= 1e-6: return 0.0
+        return (self.sxy - self.sx*self.sy / n) / sxx
+
+
+class BucketedMean:
+    """
+    Mean over a long time horizon with O(horizon / bucket) memory: samples are
+    folded into fixed time buckets and whole buckets expire.
+    """
+    def __init__(self, horizon, bucket=1.0):
+        self.horizon = horizon
+        self.bucket = bucket
+        self.buckets = deque()          # [bucket_start, count, sum]
+        self.n = 0; self.s = 0.0
+
+    def push(self, y, x):
+        b = x - (x % self.bucket)
+        last = self.buckets[-1] if self.buckets else None
+        if last is not None and last[0] == b:
+            last[1] += 1; last[2] += y
+        else:
+            self.buckets.append([b, 1, y])
+        self.n += 1; self.s += y
+        while self.buckets and b - self.buckets[0][0] >= self.horizon:
+            _, c, s = self.buckets.popleft()
+            self.n -= c; self.s -= s
+
+    @property
+    def mean(self): return self.s / self.n if self.n else 0.0
+
+    fraction = mean
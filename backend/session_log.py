@@ -0,0 +1,107 @@
+"""
+Session logging — buffered, batched CSV writer on a background thread
+---------------------------------------------------------------------
+log_row() used to os.path.exists() + open() + write one row + close() on
+every frame, which at 30 FPS is a syscall storm that can stall the render
+loop on slow SD cards. SessionLogger keeps the same CSV file and header but:
+
+  - log(row) only enqueues (bounded queue, never blocks the frame loop);
+    rows that don't fit are counted in .dropped. Offline replay passes
+    block=True instead, trading speed for a complete log.
+  - the worker writes rows in batches once `batch_rows` are pending or
+    `flush_s` has passed, with one write per batch
+  - flush(durable=True) forces pending rows to disk with fsync; used on
+    alerts and on shutdown (close(), also registered with atexit until it
+    has run). A flush that doesn't fit in a full queue is counted in
+    .dropped_flushes rather than blocking the frame loop: the worker is
+    busy writing anyway.
+  - an optional recording.RecordingWriter receives the same rows on the
+    same thread, producing a compact columnar .vgrec alongside the CSV
+"""
+
+import os, csv, time, queue, threading, atexit
+
+
+class _Flush:
+    __slots__ = ("durable", "stop", "done")
+    def __init__(self, durable, stop=False):
+        self.durable = durable; self.stop = stop; self.done = threading.Event()
+
+
+class SessionLogger(threading.Thread):
+    def __init__(self, path, header, maxsize=4096, batch_rows=64, flush_s=1.0, recorder=None, block=False):
+        super().__init__(daemon=True)
+        self.block = block
+        self.path = path
+        self.header = header
+        self.recorder = recorder
+        self.q = queue.Queue(maxsize=maxsize)
+        self.batch_rows = batch_rows
+        self.flush_s = flush_s
+        self.dropped = 0
+        self.dropped_flushes = 0
+        self.written = 0
+        self.closed = False
+        atexit.register(self.close)
+
+    def log(self, row):
+        try: self.q.put(row, block=self.block)
+        except queue.Full: self.dropped += 1
+
+    def flush(self, durable=True, wait=False, timeout=2.0):
+        """Ask the worker to write everything pending; optionally wait for it. Never blocks on a full queue."""
+        if self.closed: return
+        req = _Flush(durable)
+        try: self.q.put_nowait(req)
+        except queue.Full: self.dropped_flushes += 1; return
+        if wait: req.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        if self.closed or not self.is_alive():
+            atexit.unregister(self.close); return
+        req = _Flush(True, stop=True)
+        try: self.q.put(req, timeout=timeout)
+        except queue.Full: return
+        req.done.wait(timeout)
+        self.closed = True
+        atexit.unregister(self.close)           # don't keep closed loggers alive until exit
+        if self.dropped: print(f"⚠️ Logger dropped {self.dropped} rows (disk too slow)")
+
+    def run(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="") as f:
+            w = csv.writer(f)
+            if new: w.writerow(self.header)
+            pending = []
+            first = 0.0                 # enqueue time of the oldest pending row
+            while True:
+                left = None if not pending else max(0.0, self.flush_s - (time.monotonic() - first))
+                try: item = self.q.get(timeout=left)
+                except queue.Empty: item = None
+                if isinstance(item, _Flush):
+                    self._write(f, w, pending)
+                    if item.durable:
+                        try:
+                            os.fsync(f.fileno())
+                            if self.recorder is not None: self.recorder.flush()
+                        except OSError as e: print("[Logger fsync Error]", e)
+                    if item.stop and self.recorder is not None: self.recorder.close()
+                    item.done.set()
+                    if item.stop: return
+                    continue
+                if item is not None:
+                    if not pending: first = time.monotonic()
+                    pending.append(item)
+                if pending and (len(pending) >= self.batch_rows or time.monotonic() - first >= self.flush_s):
+                    self._write(f, w, pending)
+
+    def _write(self, f, w, pending):
+        if not pending: return
+        try:
+            w.writerows(pending); f.flush()
+            if self.recorder is not None:
+                for row in pending: self.recorder.append(row)
+            self.written += len(pending)
+        except OSError as e:
+            print("[Logger Error]", e); self.dropped += len(pending)
+        pending.clear()
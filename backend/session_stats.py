@@ -0,0 +1,202 @@
+"""
+Streaming session summary — constant memory, mergeable, crash-safe
+------------------------------------------------------------------
+SessionStats used to append every frame's fatigue and blink rate to Python
+lists and run np.mean / min / max over them at exit: about a million boxed
+floats per list on a 10-hour shift, and a crash lost the whole summary.
+Everything here is O(1) memory per session:
+
+  Running        count / sum / min / max (mean on demand)
+  QuantileSketch fixed-bin histogram over [lo, hi]; quantiles interpolate
+                 inside a bin, so the error is at most (hi - lo) / bins
+                 (0.005 for fatigue with the default 200 bins). Sketches with
+                 the same bins merge by adding counts (fleet / multi-trip).
+  BandTimer      seconds spent in each DWI band; each sample owns the
+                 interval until the next one (as recording.summarize does)
+  SessionStats   the per-session aggregate. summary() keeps the keys that
+                 write_summary() writes and adds p50/p95 fatigue and the band
+                 times. With a checkpoint path the state is written to JSON
+                 (atomically) every checkpoint_s, and recover() turns a
+                 leftover checkpoint into a summary row after a crash.
+"""
+
+import os, json, math
+
+
+class Running:
+    __slots__ = ("n", "total", "lo", "hi")
+    def __init__(self): self.n = 0; self.total = 0.0; self.lo = math.inf; self.hi = -math.inf
+    def add(self, v):
+        self.n += 1; self.total += v
+        if v < self.lo: self.lo = v
+        if v > self.hi: self.hi = v
+    @property
+    def mean(self): return self.total / self.n if self.n else 0.0
+    @property
+    def min(self): return self.lo if self.n else 0.0
+    @property
+    def max(self): return self.hi if self.n else 0.0
+    def merge(self, o):
+        self.n += o.n; self.total += o.total
+        self.lo = min(self.lo, o.lo); self.hi = max(self.hi, o.hi)
+        return self
+    def to_dict(self): return {"n": self.n, "total": self.total, "lo": self.min, "hi": self.max}
+    @classmethod
+    def from_dict(cls, d):
+        r = cls(); r.n = d["n"]; r.total = d["total"]
+        if r.n: r.lo, r.hi = d["lo"], d["hi"]
+        return r
+
+
+class QuantileSketch:
+    """Equal-width bins over [lo, hi]; values outside are clamped into the end bins."""
+    def __init__(self, lo=0.0, hi=1.0, bins=200):
+        self.lo, self.hi, self.bins = lo, hi, bins
+        self.width = (hi - lo) / bins
+        self.counts = [0] * bins
+        self.n = 0
+    def add(self, v):
+        i = int((v - self.lo) / self.width)
+        self.counts[0 if i < 0 else (self.bins - 1 if i >= self.bins else i)] += 1
+        self.n += 1
+    def quantile(self, q):
+        if self.n == 0: return 0.0
+        k = q * self.n; acc = 0
+        for i, c in enumerate(self.counts):
+            if c and acc + c >= k:
+                return self.lo + self.width * (i + (k - acc) / c)
+            acc += c
+        return self.hi
+    def merge(self, o):
+        if (o.lo, o.hi, o.bins) != (self.lo, self.hi, self.bins): raise ValueError("sketch bins differ")
+        self.counts = [a + b for a, b in zip(self.counts, o.counts)]; self.n += o.n
+        return self
+    def to_dict(self): return {"lo": self.lo, "hi": self.hi, "counts": self.counts}
+    @classmethod
+    def from_dict(cls, d):
+        s = cls(d["lo"], d["hi"], len(d["counts"])); s.counts = list(d["counts"]); s.n = sum(s.counts)
+        return s
+
+
+class BandTimer:
+    """
+    Time per band: edges [e0, e1, ...] → bands (-inf,e0), [e0,e1), ..., [eN,inf).
+    update(now, v) credits the time since the previous update to the previous
+    sample's band.
+    """
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.secs = [0.0] * (len(self.edges) + 1)
+        self.last_t = None; self.last_band = None
+    def band(self, v):
+        i = 0
+        while i < len(self.edges) and v >= self.edges[i]: i += 1
+        return i
+    def update(self, now, v):
+        if self.last_t is not None: self.secs[self.last_band] += max(0.0, now - self.last_t)
+        self.last_t = now; self.last_band = self.band(v)
+    def totals(self, end=None):
+        """Band seconds, with the open interval up to `end` credited to the current band."""
+        out = list(self.secs)
+        if end is not None and self.last_t is not None: out[self.last_band] += max(0.0, end - self.last_t)
+        return out
+    def labels(self):
+        e = ["-inf"] + [f"{x:g}" for x in self.edges] + ["inf"]
+        return [f"{e[i]}-{e[i+1]}" for i in range(len(e) - 1)]
+    def merge(self, o):
+        if o.edges != self.edges: raise ValueError("band edges differ")
+        self.secs = [a + b for a, b in zip(self.secs, o.totals())]
+        return self
+    def to_dict(self): return {"edges": self.edges, "secs": self.secs, "last_t": self.last_t, "last_band": self.last_band}
+    @classmethod
+    def from_dict(cls, d):
+        b = cls(d["edges"]); b.secs = list(d["secs"]); b.last_t = d["last_t"]; b.last_band = d["last_band"]
+        return b
+
+
+class SessionStats:
+    """
+    Session summary accumulators: fatigue avg/min/max/p50/p95, blink rate,
+    time per DWI band (time above `high` is the sum of the bands from it up).
+    """
+    def __init__(self, start, high=0.70, low=0.45, checkpoint_path=None, checkpoint_s=30.0):
+        self.start = start
+        self.high = high
+        self.fatigue = Running()
+        self.blink = Running()
+        self.fatigue_q = QuantileSketch()
+        self.dwi_bands = BandTimer(sorted({0.3, low, high, 0.85}))
+        self.last_t = start
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_s = checkpoint_s
+        self._last_ckpt = start
+        self.checkpoints = 0
+
+    def update(self, now, fatigue, blink, dwi):
+        self.fatigue.add(fatigue); self.fatigue_q.add(fatigue)
+        self.blink.add(blink)
+        self.dwi_bands.update(now, dwi)
+        self.last_t = now
+        if self.checkpoint_path and now - self._last_ckpt >= self.checkpoint_s:
+            self._last_ckpt = now; self.checkpoint()
+
+    def time_above(self, bands):
+        return sum(s for e, s in zip([-math.inf] + self.dwi_bands.edges, bands) if e >= self.high)
+
+    def summary(self, end):
+        bands = self.dwi_bands.totals(end)
+        return {
+            "start": int(self.start),
+            "end": int(end),
+            "duration_s": end - self.start,
+            "avg_fatigue": self.fatigue.mean,
+            "min_fatigue": self.fatigue.min,
+            "max_fatigue": self.fatigue.max,
+            "avg_blink": self.blink.mean,
+            "time_above_high_s": self.time_above(bands),
+            "p50_fatigue": self.fatigue_q.quantile(0.50),
+            "p95_fatigue": self.fatigue_q.quantile(0.95),
+            "dwi_bands_s": dict(zip(self.dwi_bands.labels(), bands)),
+        }
+
+    def merge(self, o):
+        """Fold another session (e.g. another trip of the same driver) into this one."""
+        self.start = min(self.start, o.start); self.last_t = max(self.last_t, o.last_t)
+        self.fatigue.merge(o.fatigue); self.blink.merge(o.blink); self.fatigue_q.merge(o.fatigue_q)
+        self.dwi_bands.merge(o.dwi_bands)
+        return self
+
+    # ------------------------ persistence ---------------------
+    def to_dict(self):
+        return {"start": self.start, "last_t": self.last_t, "high": self.high,
+                "fatigue": self.fatigue.to_dict(), "blink": self.blink.to_dict(),
+                "fatigue_q": self.fatigue_q.to_dict(), "dwi_bands": self.dwi_bands.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls(d["start"], d["high"])
+        s.last_t = d["last_t"]
+        s.fatigue = Running.from_dict(d["fatigue"]); s.blink = Running.from_dict(d["blink"])
+        s.fatigue_q = QuantileSketch.from_dict(d["fatigue_q"]); s.dwi_bands = BandTimer.from_dict(d["dwi_bands"])
+        return s
+
+    def checkpoint(self, path=None):
+        path = path or self.checkpoint_path
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f: json.dump(self.to_dict(), f)
+            os.replace(tmp, path)                # a crash mid-write leaves the previous checkpoint
+            self.checkpoints += 1
+        except OSError as e: print("[Stats checkpoint Error]", e)
+
+    def discard_checkpoint(self):
+        """Clean shutdown: the summary row has been written, the checkpoint is no longer needed."""
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path): os.remove(self.checkpoint_path)
+
+
+def recover(path):
+    """Summary of a session that died after its last checkpoint (None if there is none)."""
+    try:
+        with open(path) as f: st = SessionStats.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError): return None
+    return st.summary(st.last_t)
@@ -6,12 +6,20 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/com
 import { AlertCircle, AlertTriangle, Heart, Eye, Zap } from "lucide-react"
 import { useDashboardStore } from "@/lib/store"
 import { generateMockWellnessData } from "@/lib/mock-data"
+import { METRICS_URL, subscribeMetrics } from "@/lib/metrics-stream"
 
 export function WellnessMonitor() {
   const { currentData, settings, setCurrentData, addToSessionLog } = useDashboardStore()
   const [isConnected, setIsConnected] = useState(false)
 
   useEffect(() => {
+    if (METRICS_URL) {
+      return subscribeMetrics((data) => {
+        setCurrentData(data)
+        addToSessionLog(data)
+      }, setIsConnected)
+    }
+
     setIsConnected(true)
 
     // Simulate WebSocket polling
@@ -0,0 +1,59 @@
+import type { WellnessData } from "./store"
+
+// Live stream from the Python backend (backend/metrics_server.py), e.g. http://127.0.0.1:8765
+export const METRICS_URL = process.env.NEXT_PUBLIC_METRICS_URL
+
+type Snapshot = Record<string, number | string>
+
+export interface StreamMessage {
+  t: "full" | "delta" | "alert"
+  seq: number
+  d?: Record<string, number | string | null>   // null in a delta: key removed
+  action?: string
+  ctx?: string
+}
+
+export function toWellnessData(s: Snapshot): WellnessData {
+  const num = (k: string) => Number(s[k] ?? 0)
+  return {
+    time: new Date(num("time") * 1000).toLocaleTimeString(),
+    ear: num("ear"),
+    blink_per_min: num("blink_per_min"),
+    perclos_30s: num("perclos_30s"),
+    cnn: num("cnn"),
+    fatigue: num("fatigue") * 100,
+    hr: num("hr"),
+    hrv: num("hrv"),
+    fps: num("fps"),
+    action: (s.action as string) || "normal",
+  }
+}
+
+// Applies a delta: changed keys overwrite, null removes the key.
+export function applyDelta(current: Snapshot, d: Record<string, number | string | null>): Snapshot {
+  const next: Snapshot = { ...current }
+  for (const [k, v] of Object.entries(d)) {
+    if (v === null) delete next[k]
+    else next[k] = v
+  }
+  return next
+}
+
+// Subscribes to /events; full snapshots replace the state, deltas patch it. Returns an unsubscribe function.
+export function subscribeMetrics(
+  onData: (data: WellnessData) => void,
+  onStatus: (connected: boolean) => void,
+  hz = 1,
+): () => void {
+  const es = new EventSource(`${METRICS_URL}/events?hz=${hz}`)
+  let current: Snapshot = {}
+  es.onopen = () => onStatus(true)
+  es.onerror = () => onStatus(false)
+  es.onmessage = (ev) => {
+    const msg: StreamMessage = JSON.parse(ev.data)
+    if (msg.t === "alert" || !msg.d) return
+    current = msg.t === "full" ? (msg.d as Snapshot) : applyDelta(current, msg.d)
+    onData(toWellnessData(current))
+  }
+  return () => es.close()
+}